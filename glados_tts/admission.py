@@ -0,0 +1,128 @@
+import threading
+from time import monotonic
+
+from glados_tts.utils.segment import estimate_tokens
+
+
+class AdmissionError(Exception):
+    """a request that was not admitted, 'status_code' is the http status
+    to answer with and 'retry_after' the seconds to wait before trying
+    again (if it makes sense to try again).
+
+    """
+
+    def __init__(self, status_code, detail, retry_after=None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.t = monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.t) * self.rate)
+        self.t = now
+
+    def take(self, now):
+        """take a token if there is one, otherwise returns the seconds
+        until there will be one.
+
+        """
+
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def full(self, now):
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+class RateLimiter:
+    """a token bucket per client, allowing 'rate' requests per second on
+    average and bursts of up to 'burst' requests.
+
+    """
+
+    # drop the buckets of idle clients once there are this many
+    max_clients = 10000
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, client):
+        now = monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                if len(self._buckets) >= self.max_clients:
+                    self._buckets = {c: b for c, b in self._buckets.items() if not b.full(now)}
+                bucket = self._buckets[client] = TokenBucket(self.rate, self.burst)
+            return bucket.take(now)
+
+
+class AdmissionControl:
+    """decides whether a synthesis request is admitted before any work is
+    done for it:
+
+      - texts over 'max_chars' characters or 'max_tokens' (estimated)
+        phoneme tokens are rejected with 413
+      - clients over their rate limit get a 429
+      - if the latency estimate for the request (from its token count and
+        the requests ahead of it) is over 'latency_slo' seconds, it is
+        deferred with a 429 and a Retry-After, unless it is cached
+
+    0 disables each of the limits.
+
+    """
+
+    def __init__(self, glados, max_chars=0, max_tokens=0, rate=0.0, burst=10, latency_slo=0.0):
+        self.glados = glados
+        self.max_chars = max_chars
+        self.max_tokens = max_tokens
+        self.latency_slo = latency_slo
+        self.rate_limiter = RateLimiter(rate, burst) if rate > 0 else None
+
+    def check(self, client, text, priority="normal", audio_format=None, sample_rate=None, use_cache=True, voice=None):
+        tokens = self.check_size(text)
+        self.check_rate(client)
+        self.check_latency(tokens, text, priority, audio_format, sample_rate, use_cache, voice)
+
+    def check_size(self, text):
+        """returns the estimated token count for 'text'"""
+        if self.max_chars and len(text) > self.max_chars:
+            raise AdmissionError(413, f"text is {len(text)} characters long, the limit is {self.max_chars}")
+
+        tokens = estimate_tokens(text)
+        if self.max_tokens and tokens > self.max_tokens:
+            raise AdmissionError(413, f"text is about {tokens} phoneme tokens long, the limit is {self.max_tokens}")
+        return tokens
+
+    def check_rate(self, client):
+        if self.rate_limiter is not None:
+            wait = self.rate_limiter.take(client)
+            if wait > 0:
+                raise AdmissionError(429, "rate limit exceeded", retry_after=wait)
+
+    def check_latency(self, tokens, text, priority="normal", audio_format=None, sample_rate=None, use_cache=True,
+                      voice=None):
+        if self.latency_slo:
+            latency = self.glados.estimate_latency(tokens, priority)
+            if latency is not None and latency > self.latency_slo:
+                if use_cache and self.glados.is_cached(text, audio_format, sample_rate, voice):
+                    return
+                raise AdmissionError(
+                    429,
+                    f"the server is busy, the estimated latency is {latency:.1f}s (the limit is {self.latency_slo}s)",
+                    retry_after=latency - self.latency_slo
+                )
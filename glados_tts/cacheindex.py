@@ -0,0 +1,125 @@
+import os
+import sqlite3
+import threading
+from time import time
+
+
+COLUMNS = [
+    "fname", "text", "audio_format", "sample_rate", "size", "duration",
+    "synthesis_time", "hits", "renders", "created", "last_access", "voice",
+]
+ORDER_BY = {
+    "last_access": "last_access DESC",
+    "hits": "hits DESC",
+    "created": "created DESC",
+    "size": "size DESC",
+}
+
+
+class CacheIndex:
+    """a sqlite index of what is in the audio cache: the text, format,
+    size and duration of each entry, how long it took to synthesize
+    and how often and how recently it was requested.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    fname TEXT PRIMARY KEY,
+                    text TEXT NOT NULL,
+                    audio_format TEXT NOT NULL,
+                    sample_rate INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    duration REAL NOT NULL,
+                    synthesis_time REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    renders INTEGER NOT NULL DEFAULT 1,
+                    created REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    voice TEXT
+                )""")
+            # indexes from before voices were added
+            columns = [r[1] for r in conn.execute("PRAGMA table_info(entries)")]
+            if "voice" not in columns:
+                conn.execute("ALTER TABLE entries ADD COLUMN voice TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_text ON entries (text)")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_hits ON entries (hits)")
+
+    def _execute(self, sql, params=()):
+        with self._lock, self._conn as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def record_render(self, fname, text, audio_format, sample_rate, size, duration, synthesis_time, voice=None):
+        now = time()
+        self._execute("""
+            INSERT INTO entries
+                (fname, text, audio_format, sample_rate, size, duration, synthesis_time, created, last_access, voice)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (fname) DO UPDATE SET
+                size = excluded.size,
+                duration = excluded.duration,
+                synthesis_time = excluded.synthesis_time,
+                renders = renders + 1,
+                created = excluded.created,
+                last_access = excluded.last_access
+        """, (fname, text, audio_format, sample_rate, size, duration, synthesis_time, now, now, voice))
+
+    def record_hit(self, fname):
+        self._execute(
+            "UPDATE entries SET hits = hits + 1, last_access = ? WHERE fname = ?", (time(), fname))
+
+    def remove(self, fname):
+        self._execute("DELETE FROM entries WHERE fname = ?", (fname,))
+
+    def get(self, fname):
+        rows = self._execute("SELECT * FROM entries WHERE fname = ?", (fname,))
+        return dict(rows[0]) if rows else None
+
+    def lookup(self, text):
+        return [dict(r) for r in self._execute(
+            "SELECT * FROM entries WHERE text = ? ORDER BY last_access DESC", (text,))]
+
+    def list(self, offset=0, limit=50, order="last_access"):
+        """returns (total, entries) for one page of entries"""
+        order_by = ORDER_BY[order]
+        total = self._execute("SELECT COUNT(*) FROM entries")[0][0]
+        rows = self._execute(f"SELECT * FROM entries ORDER BY {order_by} LIMIT ? OFFSET ?", (limit, offset))
+        return total, [dict(r) for r in rows]
+
+    def stats(self):
+        row = self._execute("""
+            SELECT
+                COUNT(*) AS entries,
+                COALESCE(SUM(size), 0) AS total_size,
+                COALESCE(SUM(duration), 0) AS total_duration,
+                COALESCE(SUM(hits), 0) AS hits,
+                COALESCE(SUM(renders), 0) AS renders,
+                COALESCE(AVG(synthesis_time), 0) AS mean_synthesis_time
+            FROM entries""")[0]
+        stats = dict(row)
+        requests = stats["hits"] + stats["renders"]
+        stats["hit_ratio"] = stats["hits"] / requests if requests else 0.0
+        return stats
+
+    def coldest(self, policy="lru"):
+        """iterate over entries in eviction order: least recently used
+        ('lru') or least frequently used ('lfu') first.
+
+        """
+        order_by = "last_access ASC" if policy == "lru" else "hits ASC, last_access ASC"
+        return [dict(r) for r in self._execute(f"SELECT * FROM entries ORDER BY {order_by}")]
+
+    def hottest(self, limit):
+        return [dict(r) for r in self._execute(
+            "SELECT * FROM entries ORDER BY hits DESC, last_access DESC LIMIT ?", (limit,))]
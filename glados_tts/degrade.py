@@ -0,0 +1,99 @@
+import threading
+import collections
+from time import monotonic
+
+from loguru import logger
+
+
+class LoadMonitor:
+    """decides when new renders should use a faster (lower quality)
+    voice: when the 95th percentile of the latency of recent requests is
+    above 'p95' seconds, or the estimated queue wait ('estimate_wait()')
+    is above 'queue_wait' seconds. it switches back once both are below
+    'recover' times their threshold, and it has been degraded for at
+    least 'hold' seconds, so it doesn't flap.
+
+    'voices' maps a voice (None for the default voice) to the voice to
+    degrade to.
+
+    """
+
+    def __init__(self, voices, estimate_wait, p95=0.0, queue_wait=0.0, recover=0.5, hold=10.0,
+                 chunk_frames=None, window=100):
+        self.voices = voices
+        self.p95_limit = p95
+        self.queue_wait_limit = queue_wait
+        self.recover = recover
+        self.hold = hold
+        # vocoder chunking for degraded renders, None to keep the default
+        self.chunk_frames = chunk_frames
+        self._estimate_wait = estimate_wait
+        self._latencies = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.active = False
+        self._since = None
+        self.switches = 0
+        self.degraded_requests = 0
+
+    def record(self, seconds):
+        """the latency of a finished request (queue wait included)"""
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def _p95(self):
+        # called with the lock held
+        if not self._latencies:
+            return 0.0
+        latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+
+    def _update(self):
+        # called with the lock held
+        p95 = self._p95()
+        queue_wait = self._estimate_wait() or 0.0
+        over = (self.p95_limit and p95 > self.p95_limit) or \
+            (self.queue_wait_limit and queue_wait > self.queue_wait_limit)
+        under = (not self.p95_limit or p95 < self.recover * self.p95_limit) and \
+            (not self.queue_wait_limit or queue_wait < self.recover * self.queue_wait_limit)
+
+        now = monotonic()
+        if not self.active and over:
+            self.active = True
+            self._since = now
+            self.switches += 1
+            logger.warning(f"degrading to the fast vocoder: p95 latency {p95:.2f}s, queue wait {queue_wait:.2f}s")
+        elif self.active and under and now - self._since >= self.hold:
+            self.active = False
+            self._since = now
+            self.switches += 1
+            # the latencies from the degraded period would switch it
+            # back on right away
+            self._latencies.clear()
+            logger.info(f"back to full quality: p95 latency {p95:.2f}s, queue wait {queue_wait:.2f}s")
+        return p95, queue_wait
+
+    def voice_for(self, voice):
+        """the voice to render a new request for 'voice' with if the engine
+        is under load, otherwise None.
+
+        """
+
+        if voice not in self.voices:
+            return None
+        with self._lock:
+            self._update()
+            if not self.active:
+                return None
+            self.degraded_requests += 1
+            return self.voices[voice]
+
+    def stats(self):
+        with self._lock:
+            p95, queue_wait = self._update()
+            return {
+                "active": self.active,
+                "p95": p95,
+                "queue_wait": queue_wait,
+                "switches": self.switches,
+                "degraded_requests": self.degraded_requests,
+            }
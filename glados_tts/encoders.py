@@ -0,0 +1,193 @@
+import os
+import mimetypes
+
+import numpy
+
+
+_encoders = {}
+
+
+def register(cls):
+    _encoders[cls.name] = cls
+    return cls
+
+
+def audio_formats():
+    return list(_encoders)
+
+
+def get_encoder(name, options=None):
+    """get an encoder instance for the audio format 'name', with the
+    encoder-specific 'options' (such as bitrate or compression level)
+    from the config.
+
+    """
+
+    try:
+        cls = _encoders[name.lower()]
+    except KeyError:
+        raise ValueError(f"unsupported audio format: '{name}', supported: {audio_formats()}")
+    return cls(**(options or {}))
+
+
+def guess_mimetype(filename, sample_rate=None):
+    extension = os.path.splitext(filename)[1].lstrip(".").lower()
+    for cls in _encoders.values():
+        if cls.extension == extension:
+            return cls.content_type(sample_rate)
+    return mimetypes.types_map.get(f".{extension}")
+
+
+class Encoder:
+    name = None
+    extension = None
+    mimetype = None
+    # sample rates that the format supports, None for any
+    sample_rates = None
+
+    def __init__(self, **options):
+        self.options = options
+
+    @classmethod
+    def content_type(cls, sample_rate=None):
+        """the mimetype for audio at 'sample_rate', with the parameters
+        that formats without a header need.
+
+        """
+        return cls.mimetype
+
+    def output_rate(self, sample_rate):
+        """the closest sample rate to 'sample_rate' that this format supports"""
+        if self.sample_rates is None or sample_rate in self.sample_rates:
+            return sample_rate
+        higher = [r for r in self.sample_rates if r >= sample_rate]
+        return min(higher) if higher else max(self.sample_rates)
+
+    def open(self, f, sample_rate):
+        """returns a writer for the open file object 'f', that int16
+        audio blocks can be appended to with write(), and must be
+        closed (or used as a context manager).
+
+        """
+        raise NotImplementedError
+
+    def encode(self, f, audio, sample_rate):
+        with self.open(f, sample_rate) as w:
+            w.write(audio)
+
+
+class SoundfileEncoder(Encoder):
+    format = None
+    subtype = None
+    # keyword arguments to soundfile.SoundFile that can be set per
+    # encoder in the config
+    option_names = ("compression_level", "bitrate_mode")
+
+    def __init__(self, **options):
+        unknown = set(options) - set(self.option_names)
+        if unknown:
+            raise ValueError(f"unknown options for '{self.name}' encoder: {sorted(unknown)}")
+        super().__init__(**options)
+
+    def open(self, f, sample_rate):
+        import soundfile
+        return soundfile.SoundFile(
+            f, 'w', sample_rate, 1, format=self.format, subtype=self.subtype, **self.options
+        )
+
+
+@register
+class WavEncoder(SoundfileEncoder):
+    name = "wav"
+    extension = "wav"
+    mimetype = mimetypes.types_map[".wav"]
+    format = "WAV"
+    option_names = ()
+
+
+@register
+class Mp3Encoder(SoundfileEncoder):
+    name = "mp3"
+    extension = "mp3"
+    mimetype = mimetypes.types_map[".mp3"]
+    format = "MP3"
+    subtype = "MPEG_LAYER_III"
+    sample_rates = (8000, 11025, 12000, 16000, 22050, 24000, 32000, 44100, 48000)
+
+
+@register
+class FlacEncoder(SoundfileEncoder):
+    name = "flac"
+    extension = "flac"
+    mimetype = "audio/flac"
+    format = "FLAC"
+    subtype = "PCM_16"
+    option_names = ("compression_level",)
+
+
+@register
+class OggVorbisEncoder(SoundfileEncoder):
+    name = "ogg"
+    extension = "ogg"
+    mimetype = "audio/ogg"
+    format = "OGG"
+    subtype = "VORBIS"
+    option_names = ("compression_level",)
+
+
+@register
+class OpusEncoder(SoundfileEncoder):
+    name = "opus"
+    extension = "opus"
+    mimetype = "audio/ogg; codecs=opus"
+    format = "OGG"
+    subtype = "OPUS"
+    # opus only supports these, audio is resampled to the closest one
+    sample_rates = (8000, 12000, 16000, 24000, 48000)
+
+
+class _RawWriter:
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, audio):
+        # int16 audio is written as-is, without encoding or copying
+        audio = numpy.asarray(audio)
+        if audio.dtype != numpy.dtype('<i2'):
+            audio = audio.astype('<i2')
+        self.f.write(numpy.ascontiguousarray(audio).data)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+@register
+class PcmEncoder(Encoder):
+    """raw, headerless signed 16-bit little-endian mono PCM, for local
+    consumers that want to skip encoding and decoding entirely.
+
+    """
+
+    name = "pcm"
+    extension = "pcm"
+    # not audio/L16, that is big-endian
+    mimetype = "audio/pcm"
+
+    @classmethod
+    def content_type(cls, sample_rate=None):
+        rate = f";rate={sample_rate}" if sample_rate else ""
+        return f"{cls.mimetype}{rate};channels=1"
+
+    def __init__(self, **options):
+        if options:
+            raise ValueError(f"the 'pcm' encoder has no options: {sorted(options)}")
+        super().__init__()
+
+    def open(self, f, sample_rate):
+        return _RawWriter(f)
@@ -1,17 +1,41 @@
 import os
 import hashlib
-import mimetypes
+import queue
+import collections
+import threading
+import gc
 from time import time
+from datetime import datetime
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor, Future
 from functools import lru_cache
-from pkg_resources import resource_filename
 
-import torch
-import soundfile
+import numpy
 from loguru import logger
 
 import glados_tts
-from glados_tts.utils import tools
+from glados_tts import encoders
+from glados_tts.utils import tools, profiling
+from glados_tts.utils.resample import Resampler
+from glados_tts.utils.buffers import BufferPool, PcmPool
+from glados_tts.utils.logs import RequestLog
+from glados_tts.storage import DirStorage, ShardedDirStorage, storage_from_url
+from glados_tts.cacheindex import CacheIndex
+from glados_tts.sentencecache import SentenceCache, normalize_sentence
+from glados_tts.frontend import Frontend
+from glados_tts.utils.lexicon import Lexicon
+from glados_tts.utils.segment import segment_text, sentence_segments, estimate_tokens
 from glados_tts.models import GLaDOSResponse
+from glados_tts.pipeline import SynthesisPipeline
+from glados_tts.scheduler import Scheduler, PRIORITY_CLASSES
+from glados_tts.modelpair import TorchScriptModels, get_backend, fingerprint
+from glados_tts.voices import Voice, VoiceRegistry, DEFAULT_VOICE, BUILTIN_VOICES
+from glados_tts.degrade import LoadMonitor
+
+
+# kept in the cache storage: the fingerprint of the models that the
+# cached audio with the unsalted filenames was rendered with
+MODELS_FINGERPRINT = "models.fingerprint"
 
 
 class GLaDOSError(Exception):
@@ -23,81 +47,554 @@ class GLaDOSInputError(GLaDOSError):
 
 
 class GLaDOS:
-    audio_formats = ["wav", "mp3"]
-    audio_mimetypes = [mimetypes.types_map.get("." + a) for a in audio_formats]
-    
+    audio_formats = encoders.audio_formats()
+    audio_mimetypes = [encoders.get_encoder(a).mimetype for a in audio_formats]
 
     def __init__(self):
         self.started = False
         self.models_loaded = False
+        self._models_lock = threading.Lock()
 
-        self.device = self._select_device()
-        logger.debug(f"selected device: '{self.device}'")
+        self.device = None
+        # the inference backend (a ModelPair subclass) and its options
+        self.backend = TorchScriptModels
+        self.backend_options = {}
+        # the models that are shipped in the package
+        self.models_dir = os.path.join(os.path.dirname(glados_tts.__file__), 'models')
+        self.acoustic_model, self.vocoder_model = self._default_models()
+        # the current ModelPair, swapped out by reload_models()
+        self.models = None
+        # the other voices, loaded when they are asked for
+        self.default_voice = DEFAULT_VOICE
+        self.voices = VoiceRegistry(self._load_voice, reserved=self._default_voice_bytes)
+        self._swap_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._swap_callbacks = []
+        self.reload_status = {"state": "idle"}
+        # the fingerprint of the models that the cache was first used
+        # with (kept in the storage), audio rendered with other models
+        # gets its own cache filenames
+        self._base_fingerprint = None
+        self._fname_salt = None
 
         self.audio_dir = None
+        self.storage = None
+        self.index = None
         self.fname_prefix = "GLaDOS-"
+        # hash the token sequence instead of the raw text for the cache
+        # filenames, so texts that the models see the same way ("Door
+        # open" and "door  open.") share the cached audio
+        self.canonical_keys = False
+        # raw text -> (name, token digest), so the text frontend only runs
+        # once per text for the cache keys
+        self._key_memo = collections.OrderedDict()
+        self._key_memo_size = 100000
+        self._key_memo_lock = threading.Lock()
+        self._key_memo_hits = 0
+        self._key_memo_misses = 0
+        # raw text -> tokens prepared for a cache key, taken by the render
+        # that (usually) follows a cache miss, so the frontend doesn't run
+        # for the text a second time
+        self._prepared = collections.OrderedDict()
+        self._prepared_size = 64
         self.default_audio_format = "wav"
+        self.lexicon = None
+        # a process pool for the text frontend, None to run it on the
+        # calling thread
+        self.frontend = None
 
-        # 22,05 kHz sample rate
-        # TODO: should sample rate be a config value?
+        # 22,05 kHz sample rate, the native rate of the models. audio is
+        # resampled if a different output sample rate is requested
         self.sample_rate_khz = int(22050)
+        self.sample_rate = self.sample_rate_khz
+        self.encoder_options = {}
+        self._encoders = {}
 
-    def start(self, audio_dir, default_audio_format=None, fname_prefix=None, delay_generate_models=True):
-        self.audio_dir = audio_dir
-        os.makedirs(self.audio_dir, exist_ok=True)
+        # texts longer than this (in characters) are synthesized in
+        # segments, 0 disables long-text mode
+        self.long_text_threshold = 1000
+        self.segment_max_tokens = 200
+        self.crossfade_ms = 10
+
+        # vocode the mel spectrogram in chunks of this many frames, with
+        # 'overlap' frames of context on each side, 0 disables chunking
+        self.vocoder_chunk_frames = 0
+        self.vocoder_chunk_overlap = 16
+
+        self.pipeline = None
+
+        # pcm per sentence, so only sentences that haven't been
+        # synthesized before need the models. None if disabled
+        self.sentence_cache = None
+        self._sentence_pool = None
+        self._sentence_threads = 0
+        self._sentence_inflight = {}
+        self._sentence_lock = threading.Lock()
+
+        # admits synthesis requests by priority class and text length
+        self.scheduler = None
+        # moving average of the synthesis time per (estimated) phoneme
+        # token, to estimate the latency of new requests
+        self.seconds_per_token = None
+        # switches new renders to a faster voice under load, None if
+        # disabled
+        self.degrade = None
+
+        # in-memory renders are persisted to the audio dir by a write-behind
+        # thread, renders for use_cache=False requests only if this is set
+        self.persist_uncached = False
+        self.buffers = BufferPool()
+        # reusable int16 arrays for the synthesized audio blocks
+        self.pcm_pool = PcmPool()
+        # sampled per-request log lines and periodic summaries
+        self.request_log = RequestLog()
+        self._write_behind = ThreadPoolExecutor(max_workers=1, thread_name_prefix="glados-write-behind")
+        self._pending_writes = {}
+        self._pending_lock = threading.Lock()
+
+    def configure(self, default_audio_format=None, fname_prefix=None, lexicon=None, lexicon_overrides=None,
+                  sample_rate=None, encoder_options=None, acoustic_model=None, vocoder_model=None, backend=None,
+                  backend_options=None, canonical_keys=None, voices=None, voice_memory_budget=None):
+        """the settings that name the cached files, look up words and find
+        the models. cheap, unlike start(): there is no storage, cache index,
+        pipeline or frontend processes, for the commands that only need to
+        compute cache keys or read the lexicon.
+
+        """
+
+        if backend is not None:
+            self.backend = get_backend(backend)
+            self.acoustic_model, self.vocoder_model = self._default_models()
+        if backend_options is not None:
+            self.backend_options = {k: v for k, v in backend_options.items() if v is not None}
+        if acoustic_model is not None:
+            self.acoustic_model = acoustic_model
+        if vocoder_model is not None:
+            self.vocoder_model = vocoder_model
+        self._add_voices(voices or {})
+        if voice_memory_budget is not None:
+            self.voices.memory_budget = voice_memory_budget
 
         if default_audio_format is not None:
             self.default_audio_format = default_audio_format.lower()
         if fname_prefix is not None:
             self.fname_prefix = fname_prefix
+        if canonical_keys is not None:
+            self.canonical_keys = canonical_keys
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        if encoder_options is not None:
+            self.encoder_options = encoder_options
+            # fail early on bad options in the config
+            for audio_format in encoder_options:
+                self.get_encoder(audio_format)
 
-        logger.info(f"GLaDOS generated audio files store: '{audio_dir}' (default format: {self.default_audio_format})")
+        if lexicon is not None or lexicon_overrides is not None:
+            self.lexicon = Lexicon.from_files(lexicon, lexicon_overrides)
+            logger.info(
+                f"pronunciation lexicon: '{lexicon}' (overrides: '{lexicon_overrides}', {len(self.lexicon)} words)")
 
-        self.glados = torch.jit.load(
-            resource_filename(glados_tts.__name__, 'models/glados.pt'))
-        self.vocoder = torch.jit.load(
-            resource_filename(glados_tts.__name__, 'models/vocoder-gpu.pt'),
-            map_location=self.device)
+    def start(self, audio_dir, default_audio_format=None, fname_prefix=None, delay_generate_models=True,
+              lexicon=None, lexicon_overrides=None, long_text_threshold=None, segment_max_tokens=None,
+              pipeline=None, vocoder_chunk_frames=None, vocoder_chunk_overlap=None,
+              sample_rate=None, encoder_options=None, persist_uncached=None, storage=None, cache_index=None,
+              acoustic_model=None, vocoder_model=None, scheduler=None, sentence_cache=None,
+              frontend_processes=None, backend=None, backend_options=None, canonical_keys=None,
+              voices=None, voice_memory_budget=None, degrade=None, request_log=None):
+        self.configure(
+            default_audio_format, fname_prefix, lexicon, lexicon_overrides, sample_rate, encoder_options,
+            acoustic_model, vocoder_model, backend, backend_options, canonical_keys, voices, voice_memory_budget)
+        self.audio_dir = audio_dir
+        if storage is not None:
+            self.storage = storage_from_url(storage)
+        else:
+            self.storage = DirStorage(audio_dir)
+        if cache_index is not None:
+            self.index = CacheIndex(cache_index)
+            logger.info(f"cache index: '{cache_index}'")
+        if os.path.exists(self.acoustic_model) and os.path.exists(self.vocoder_model):
+            # before anything is looked up in the cache, the models are
+            # only loaded on the first render
+            self._check_fingerprint(fingerprint(self.acoustic_model, self.vocoder_model))
 
+        if long_text_threshold is not None:
+            self.long_text_threshold = long_text_threshold
+        if segment_max_tokens is not None:
+            self.segment_max_tokens = segment_max_tokens
+        if persist_uncached is not None:
+            self.persist_uncached = persist_uncached
+
+        logger.info(
+            f"GLaDOS generated audio files store: '{self.storage}' (default format: {self.default_audio_format})")
+
+        if frontend_processes:
+            self.frontend = Frontend(frontend_processes, lexicon, lexicon_overrides)
+
+        if vocoder_chunk_frames is not None:
+            self.vocoder_chunk_frames = vocoder_chunk_frames
+        if vocoder_chunk_overlap is not None:
+            self.vocoder_chunk_overlap = vocoder_chunk_overlap
+
+        if pipeline is not None:
+            self.pipeline = SynthesisPipeline(self._acoustic_stage, self._vocode_stage, **pipeline)
+            self.pipeline.start()
+
+        if sentence_cache is not None:
+            path = sentence_cache.get("path")
+            self.sentence_cache = SentenceCache(
+                storage=ShardedDirStorage(path) if path else None,
+                max_bytes=sentence_cache.get("max_bytes", 64 * 1024 * 1024))
+            self._sentence_threads = sentence_cache.get("threads", 2)
+            self._sentence_pool = ThreadPoolExecutor(
+                max_workers=self._sentence_threads, thread_name_prefix="glados-sentence")
+            # sentences from the old models shouldn't be mixed in
+            self.on_models_swapped(lambda models: self.sentence_cache.clear_memory())
+            logger.info(f"sentence cache: '{path}'")
+
+        if scheduler is not None:
+            scheduler = dict(scheduler)
+            if scheduler.get("slots") is None:
+                # enough requests to keep every pipeline stage busy
+                scheduler["slots"] = len(self.pipeline.acoustic._threads) + len(self.pipeline.vocoder._threads) \
+                    if self.pipeline is not None else 1
+            self.scheduler = Scheduler(**scheduler)
+            logger.info(f"scheduler: {self.scheduler.slots} synthesis slot(s)")
+
+        if degrade is not None:
+            self._start_degrade(dict(degrade))
+
+        if request_log is not None:
+            self.request_log = RequestLog(**request_log)
+
+        self.started = True
         if delay_generate_models:
-            logger.info("models are not loaded and will be generated on the first request")
-            self.models_loaded = False
+            logger.info("models are not loaded and will be loaded on the first request")
         else:
-            self._generate_models()
+            self.load_models()
+
+    def load_models(self):
+        """load the models and warm them up, only does anything the first
+        time it is called. the heavy imports (torch) happen here too.
+
+        """
+
+        with self._models_lock:
+            if self.models_loaded:
+                return
+
+            with profiling.phase("load models"):
+                self.device = self.backend.select_device()
+                logger.debug(f"selected device: '{self.device}' ({self.backend.backend})")
+
+                models = self._model_pair(self.acoustic_model, self.vocoder_model).load()
+
+            with profiling.phase("warm models"):
+                self._generate_models(models)
+
+            self.models = models
+            self._check_fingerprint(models.fingerprint)
             self.models_loaded = True
-        self.started = True
+            logger.info("models loaded")
+        profiling.report()
+
+    def _check_fingerprint(self, model_fingerprint):
+        """salt the cache filenames if the default models aren't the ones
+        that the cache was first used with. that fingerprint is kept in
+        the storage, so audio from the old models isn't served after a
+        reload and a restart with the new models either.
+
+        """
+
+        if self._base_fingerprint is None:
+            if self.storage is None:
+                self._base_fingerprint = model_fingerprint
+            else:
+                try:
+                    with self.storage.open(MODELS_FINGERPRINT) as f:
+                        self._base_fingerprint = f.read().decode().strip()
+                except FileNotFoundError:
+                    self.storage.write(MODELS_FINGERPRINT, model_fingerprint.encode())
+                    self._base_fingerprint = model_fingerprint
+        salt = None if model_fingerprint == self._base_fingerprint else model_fingerprint
+        if salt is not None and salt != self._fname_salt:
+            logger.info(
+                f"the models ({model_fingerprint}) aren't the ones the cache was first used with "
+                f"({self._base_fingerprint}), their audio is cached under other filenames")
+        self._fname_salt = salt
+
+    def load_models_background(self):
+        """load and warm the models on a background thread, and then the
+        voices that are configured to be preloaded.
+
+        """
+
+        def load():
+            try:
+                self.load_models()
+            except Exception:
+                logger.exception("failed to load models")
+                return
+            for voice in self.voices.voices.values():
+                if voice.preload:
+                    try:
+                        self.voices.acquire(voice.name).release()
+                    except Exception:
+                        logger.exception(f"failed to load voice '{voice.name}'")
+
+        t = threading.Thread(target=load, name="glados-load-models", daemon=True)
+        t.start()
+        return t
+
+    def _ensure_models(self):
+        if not self.models_loaded:
+            self.load_models()
+
+    def _add_voices(self, voices):
+        for name, config in BUILTIN_VOICES.items():
+            # the builtin models are named without the extension, the
+            # files are the ones for the backend
+            config = {k: v + self.backend.extension if k.endswith("_model") else v for k, v in config.items()}
+            voice = Voice.from_config(name, config, self.models_dir, self.acoustic_model, self.vocoder_model)
+            if os.path.exists(voice.acoustic_model) and os.path.exists(voice.vocoder_model):
+                self.voices.add(voice)
+        for name, config in voices.items():
+            if name == self.default_voice:
+                raise ValueError(
+                    f"'{name}' is the default voice, configure it with --acoustic-model and --vocoder-model")
+            self.voices.add(
+                Voice.from_config(name, config, self.models_dir, self.acoustic_model, self.vocoder_model))
+        if self.voices.voices:
+            logger.info(f"voices: {', '.join([self.default_voice] + self.voices.names())}")
+
+    def _load_voice(self, voice):
+        logger.info(f"loading voice '{voice.name}': '{voice.acoustic_model}', '{voice.vocoder_model}'")
+        models = self._model_pair(voice.acoustic_model, voice.vocoder_model).load()
+        models.voice = voice.name
+        self._generate_models(models)
+        return models
+
+    def _default_voice_bytes(self):
+        models = self.models
+        return models.nbytes() if models is not None else 0
+
+    def _start_degrade(self, degrade):
+        # the default voice degrades to 'voice', other voices to their
+        # 'degraded_voice' from the config
+        voices = {None: degrade.pop("voice")}
+        for voice in self.voices.voices.values():
+            if voice.degraded_voice is not None:
+                voices[voice.name] = voice.degraded_voice
+        for name, fast in list(voices.items()):
+            if fast not in self.voices or fast == name:
+                logger.warning(f"voice '{name or self.default_voice}' can't degrade to unknown voice '{fast}'")
+                del voices[name]
+        if not voices:
+            logger.warning("adaptive degradation is enabled, but there is no voice to degrade to")
+            return
+        self.degrade = LoadMonitor(voices, lambda: self.estimate_latency(0), **degrade)
+        pairs = ', '.join(f'{k or self.default_voice} -> {v}' for k, v in voices.items())
+        logger.info(f"adaptive degradation: {pairs}")
+
+    def degrade_stats(self):
+        if self.degrade is None:
+            return None
+        return self.degrade.stats()
+
+    def _check_voice(self, voice):
+        """the voice for a request, None for the default voice"""
+        if voice is None or voice == self.default_voice:
+            return None
+        if voice not in self.voices:
+            raise GLaDOSInputError(
+                f"unknown voice: '{voice}', supported: {[self.default_voice] + self.voices.names()}")
+        return voice
+
+    def list_voices(self):
+        resident = self.voices.resident()
+        voices = [{
+            "name": self.default_voice,
+            "description": "GLaDOS",
+            "default": True,
+            "loaded": self.models_loaded,
+            "model_bytes": self._default_voice_bytes() if self.models_loaded else None,
+        }]
+        for voice in self.voices.voices.values():
+            voices.append({
+                "name": voice.name,
+                "description": voice.description,
+                "default": False,
+                "loaded": voice.name in resident,
+                "model_bytes": resident.get(voice.name),
+            })
+        return voices
+
+    def voice_stats(self):
+        if not self.voices.voices:
+            return None
+        return self.voices.stats()
+
+    @contextmanager
+    def _use_models(self, voice=None):
+        """the current model pair (of 'voice', the default voice if None),
+        held for the duration of a request so that reload_models() (or
+        unloading the voice) can wait for the request to finish before
+        dropping the pair.
+
+        """
+
+        self._ensure_models()
+        if voice is not None:
+            models = self.voices.acquire(voice)
+        else:
+            with self._swap_lock:
+                models = self.models.acquire()
+        try:
+            yield models
+        finally:
+            models.release()
+
+    def on_models_swapped(self, callback):
+        """call 'callback(models)' after reload_models() swapped in a new
+        model pair, to invalidate caches of model output.
+
+        """
+        self._swap_callbacks.append(callback)
+
+    def reload_models(self, acoustic_model=None, vocoder_model=None, drain_timeout=60.0):
+        """load and warm a new model pair (the current paths are reloaded if
+        none are given) while the current pair keeps serving requests,
+        then swap it in. requests that are in flight finish on the old
+        pair, which is dropped once they are done (or after
+        'drain_timeout' seconds, when it is left to be freed by the last
+        request holding on to it).
+
+        returns a status dict, including the process memory (rss) before,
+        during and after the swap.
+
+        """
+
+        with self._reload_lock:
+            self._ensure_models()
+            old = self.models
+            t0 = time()
+            status = {
+                "state": "loading",
+                "acoustic_model": acoustic_model or old.acoustic_path,
+                "vocoder_model": vocoder_model or old.vocoder_path,
+                "old_fingerprint": old.fingerprint,
+                "rss_before": profiling.rss(),
+            }
+            self.reload_status = status
+            logger.info(f"reloading models: '{status['acoustic_model']}', '{status['vocoder_model']}'")
+
+            try:
+                new = self._model_pair(status["acoustic_model"], status["vocoder_model"]).load()
+                self._generate_models(new)
+            except Exception as e:
+                status.update(state="failed", error=str(e), seconds=time() - t0)
+                logger.error(f"failed to reload models, keeping the current ones: {e}")
+                raise
+
+            status.update(
+                state="draining", fingerprint=new.fingerprint, rss_loaded=profiling.rss(),
+                old_model_bytes=old.nbytes(), new_model_bytes=new.nbytes(), in_flight=old.in_flight)
+
+            with self._swap_lock:
+                self.models = new
+                self.acoustic_model = new.acoustic_path
+                self.vocoder_model = new.vocoder_path
+                self._check_fingerprint(new.fingerprint)
+            for callback in self._swap_callbacks:
+                callback(new)
+
+            drained = old.wait_drained(drain_timeout)
+            if drained:
+                old.unload()
+            else:
+                logger.warning(f"{old.in_flight} request(s) still running on the old models after {drain_timeout}s")
+            del old
+            gc.collect()
+
+            status.update(state="done", drained=drained, rss_after=profiling.rss(), seconds=time() - t0)
+            mb = 1024 * 1024
+            logger.info(
+                f"models reloaded in {status['seconds']:.1f}s ({status['fingerprint']}), rss: "
+                f"{status['rss_before'] / mb:.0f} MB before, {status['rss_loaded'] / mb:.0f} MB with both pairs, "
+                f"{status['rss_after'] / mb:.0f} MB after")
+            return status
+
+    def reload_models_background(self, acoustic_model=None, vocoder_model=None):
+        """reload_models() on a background thread, returns False if a reload
+        is already running.
+
+        """
+
+        if self._reload_lock.locked():
+            return False
+
+        def reload():
+            try:
+                self.reload_models(acoustic_model, vocoder_model)
+            except Exception:
+                logger.exception("failed to reload models")
+
+        threading.Thread(target=reload, name="glados-reload-models", daemon=True).start()
+        return True
 
     @classmethod
     @lru_cache()
     def get(cls):
         return cls()
 
+    def get_encoder(self, audio_format):
+        audio_format = audio_format.lower()
+        if audio_format not in self._encoders:
+            self._encoders[audio_format] = encoders.get_encoder(
+                audio_format, self.encoder_options.get(audio_format))
+        return self._encoders[audio_format]
+
     def get_audiofile_path(self, fname):
-        return os.path.join(self.audio_dir, fname)
+        """the path to the audio file if the storage keeps plain files on
+        disk, otherwise None (use get_audiofile_iter).
+        """
+        return self.storage.local_path(fname)
+
+    def get_audiofile_iter(self, fname, chunk_size=65536):
+        return self.storage.iter(fname, chunk_size)
 
-    def _generate_models(self):
+    def _default_models(self):
+        return tuple(os.path.join(self.models_dir, f) for f in self.backend.default_models)
+
+    def _model_pair(self, acoustic_model, vocoder_model):
+        return self.backend(acoustic_model, vocoder_model, self.device, **self.backend_options)
+
+    def _generate_models(self, models):
         logger.info("generating models")
         # TODO: why 4?
         for i in range(4):
-            prepared = tools.prepare_text(str(i))
-            init = self.glados.generate_jit(prepared)
-            init_mel = init['mel_post'].to(self.device)
-            init_vo = self.vocoder(init_mel)  # noqa
+            init_vo = models.audio(models.mel(self._prepare(str(i))))  # noqa
+
+    def _prepare(self, text):
+        """text -> token array, in the frontend process pool if enabled"""
+        with self._key_memo_lock:
+            tokens = self._prepared.pop(text, None)
+        if tokens is not None:
+            return tokens
+        if self.frontend is not None:
+            return self.frontend.prepare(text)
+        return tools.prepare_tokens(text, self.lexicon)
+
+    def _prepare_iter(self, texts):
+        if self.frontend is not None:
+            return self.frontend.prepare_iter(texts)
+        return (tools.prepare_tokens(text, self.lexicon) for text in texts)
 
     def _prepare_text(f):
         def wrapped(self, text, *args, **kwargs):
-            text_tensor = tools.prepare_text(text)
+            text_tensor = self._prepare(text)
             return f(self, text, text_tensor, *args, **kwargs)
         return wrapped
 
-    def _select_device(self):
-        if torch.is_vulkan_available():
-            return 'vulkan'
-        elif torch.cuda.is_available():
-            return 'cuda'
-        else:
-            return 'cpu'
-
     def _to_alnum(self, s):
         return "".join([a for a in s.replace(" ", "_") if a.isalnum() or a == "_"])
 
@@ -114,12 +611,61 @@ class GLaDOS:
 
         return " ".join(text.split(" ")[:7])
 
-    def _make_fname(self, text, audio_format):
+    def _canonical_key(self, text):
+        """the name (from the cleaned, lowercased text) and a digest of the
+        token sequence for 'text', memoized by the raw text. the tokens
+        are kept for the render that follows if the audio isn't cached.
+
+        """
+
+        with self._key_memo_lock:
+            key = self._key_memo.get(text)
+            if key is not None:
+                self._key_memo.move_to_end(text)
+                self._key_memo_hits += 1
+                return key
+
+        tokens = self._prepare(text)
+        key = (
+            self._to_alnum(self._short_name(normalize_sentence(text).lower())),
+            b"tokens:" + hashlib.blake2b(tokens.tobytes(), digest_size=20).digest(),
+        )
+        with self._key_memo_lock:
+            self._key_memo_misses += 1
+            self._key_memo[text] = key
+            if len(self._key_memo) > self._key_memo_size:
+                self._key_memo.popitem(last=False)
+            self._prepared[text] = tokens
+            if len(self._prepared) > self._prepared_size:
+                self._prepared.popitem(last=False)
+        return key
+
+    def cache_key_stats(self):
+        if not self.canonical_keys:
+            return None
+        with self._key_memo_lock:
+            lookups = self._key_memo_hits + self._key_memo_misses
+            return {
+                "memo_entries": len(self._key_memo),
+                "memo_hits": self._key_memo_hits,
+                "memo_misses": self._key_memo_misses,
+                "memo_hit_ratio": self._key_memo_hits / lookups if lookups else 0.0,
+            }
+
+    def _make_fname(self, text, audio_format, sample_rate=None, voice=None):
         """use the same "short name" as we do in logs, but only keeping alphanumeric
         characters and replacing whitespaces, for filesystem friendlyness.
 
         then we hash the full input string, and use the hex string for
-        the hash to guarantee unique filenames.
+        the hash to guarantee unique filenames. if the audio is resampled
+        to a different rate than the native one, the rate is included
+        in the hash as well. audio in voices other than the default has
+        the voice in the name and the hash.
+
+        with 'canonical_keys', the token sequence that the models get is
+        hashed instead of the text (see _canonical_key), so texts that only
+        differ in case, whitespace or spelled-out numbers get the same
+        filename.
 
         since we arent hashing for cryptographic reasons, i picked
         BLAKE2s with 20-bytes, somewhat arbitrarily, mostly because
@@ -130,40 +676,425 @@ class GLaDOS:
 
         """
 
-        text_name = self._short_name(text)
-        base_fname = self._to_alnum(text_name)
-
         h = hashlib.blake2b(digest_size=20)
-        h.update(text.encode())
+        if self.canonical_keys:
+            base_fname, digest = self._canonical_key(text)
+            h.update(digest)
+        else:
+            base_fname = self._to_alnum(self._short_name(text))
+            h.update(text.encode())
+        if sample_rate is not None and sample_rate != self.sample_rate_khz:
+            h.update(f"@{sample_rate}".encode())
+        if voice is not None:
+            # every voice has its own namespace in the cache
+            h.update(f"%{voice}".encode())
+            base_fname = f"{voice}-{base_fname}"
+        elif self._fname_salt is not None:
+            h.update(f"#{self._fname_salt}".encode())
 
         fname = f"{self.fname_prefix}{base_fname}_{h.hexdigest()}.{audio_format.lower()}"
 
         return fname
 
+    def _acoustic(self, models, text_tensor):
+        """text -> mel, with the acoustic model (Forward Tacotron)"""
+        return models.mel(text_tensor)
+
+    def _vocode(self, models, mel):
+        """mel -> audio, using HiFiGAN as vocoder to make output sound like GLaDOS"""
+        if self.vocoder_chunk_frames > 0:
+            return numpy.concatenate(list(self._vocode_chunks(models, mel)))
+        return models.audio(mel)
+
+    # pipeline items carry the model pair of the request along
+    def _acoustic_stage(self, item):
+        models, text_tensor = item
+        return models, self._acoustic(models, text_tensor)
+
+    def _vocode_stage(self, item):
+        models, mel = item
+        return self._vocode(models, mel)
+
+    def _vocode_chunks(self, models, mel, chunk_frames=None, overlap=None):
+        """run the vocoder over fixed windows of 'chunk_frames' mel frames,
+        padding each window with 'overlap' frames of context on both
+        sides (to cover the receptive field of the vocoder) and trimming
+        the audio for the padding off again, so the chunks line up with
+        the output of a single pass over the whole spectrogram.
+
+        yields float audio blocks, one per chunk.
+
+        """
+
+        chunk_frames = chunk_frames or self.vocoder_chunk_frames
+        overlap = self.vocoder_chunk_overlap if overlap is None else overlap
+        n_frames = mel.shape[-1]
+
+        for start in range(0, n_frames, chunk_frames):
+            end = min(start + chunk_frames, n_frames)
+            lo = max(0, start - overlap)
+            hi = min(n_frames, end + overlap)
+
+            audio = models.audio(mel[..., lo:hi])
+            hop = audio.shape[-1] // (hi - lo)
+            yield audio[(start - lo) * hop:(end - lo) * hop]
+
+    def check_chunked_vocoder(self, text, chunk_frames, overlap):
+        """compare the stitched output of the chunked vocoder with the output
+        of a single pass over the whole mel spectrogram, returns the
+        maximum absolute difference (audio is in the range [-1.0, 1.0]).
+
+        """
+
+        with self._use_models() as models:
+            mel = self._acoustic(models, self._prepare(text))
+            full = models.audio(mel)
+            chunked = numpy.concatenate(list(self._vocode_chunks(models, mel, chunk_frames, overlap)))
+        if full.shape != chunked.shape:
+            raise GLaDOSError(f"chunked output has {len(chunked)} samples, expected {len(full)}")
+        return float(numpy.abs(full - chunked).max())
+
+    def pipeline_stats(self):
+        if self.pipeline is None:
+            return None
+        return self.pipeline.stats()
+
+    def scheduler_stats(self):
+        if self.scheduler is None:
+            return None
+        return self.scheduler.stats()
+
+    def _schedule(self, tokens, priority):
+        if self.scheduler is None:
+            return nullcontext()
+        return self.scheduler.slot(priority, tokens)
+
+    def _record_speed(self, tokens, seconds):
+        if tokens <= 0:
+            return
+        if self.seconds_per_token is None:
+            self.seconds_per_token = seconds / tokens
+        else:
+            self.seconds_per_token = 0.9 * self.seconds_per_token + 0.1 * seconds / tokens
+
+    def estimate_latency(self, tokens, priority="normal"):
+        """estimate how many seconds a new request of 'tokens' (see
+        estimate_tokens) would take, including the requests that are
+        likely to go before it. None until a request has been synthesized.
+
+        """
+
+        if self.seconds_per_token is None:
+            return None
+        backlog = 0
+        if self.scheduler is not None:
+            backlog = self.scheduler.backlog(priority) / self.scheduler.slots
+        return (backlog + tokens) * self.seconds_per_token
+
+    def is_cached(self, text, audio_format=None, sample_rate=None, voice=None):
+        audio_format = (audio_format or self.default_audio_format).lower()
+        if audio_format not in self.audio_formats:
+            return False
+        if voice is not None and voice != self.default_voice and voice not in self.voices:
+            return False
+        encoder = self.get_encoder(audio_format)
+        sample_rate = encoder.output_rate(sample_rate or self.sample_rate)
+        fname = self._make_fname(text, audio_format, sample_rate, self._check_voice(voice))
+        with self._pending_lock:
+            if fname in self._pending_writes:
+                return True
+        return self.storage.exists(fname)
+
     @_prepare_text
-    def tts_generate_audio(self, text, text_tensor):
-        if not self.models_loaded:
-            self._generate_models()
+    def tts_generate_audio(self, text, text_tensor, models=None):
+        t0 = time()
+        t_name = self._short_name(text)
+        # lazy, so the text isn't truncated and formatted unless debug is on
+        logger.opt(lazy=True).debug("generating audio for text: '{}'", lambda: self.request_log.truncate(text))
+
+        with (self._use_models() if models is None else nullcontext(models)) as models:
+            if self.pipeline is not None:
+                audio = self.pipeline.submit((models, text_tensor)).result()
+            else:
+                audio = self._vocode(models, self._acoustic(models, text_tensor))
+
+        logger.debug(f"time to generate audio for '{t_name}': {round(time()-t0, 2)}s")
+
+        return self._to_pcm(audio)
+
+    def _to_pcm(self, audio, scale=32768.0):
+        """float audio -> int16 in a pooled array (see PcmPool). 'audio' is
+        clipped in place (it is overwritten) and scaled straight into the
+        int16 array, without full-length temporary copies.
+
+        """
+
+        audio = numpy.asarray(audio)
+        if audio.dtype != numpy.float32 or not audio.flags.writeable:
+            audio = audio.astype(numpy.float32)
+        numpy.clip(audio, -32768.0 / scale, 32767.0 / scale, out=audio)
+        pcm = self.pcm_pool.get(len(audio))
+        numpy.multiply(audio, scale, out=pcm, casting='unsafe')
+        return pcm
+
+    def is_long_text(self, text):
+        return self.long_text_threshold > 0 and len(text) > self.long_text_threshold
+
+    def _acoustic_worker(self, models, segments, mels, stop):
+        """runs the acoustic model over 'segments' on its own thread,
+        handing the mel spectrograms over to the vocoder through the
+        bounded 'mels' queue. an exception is handed over in place of a
+        mel, and None marks the end.
+
+        """
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    mels.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        try:
+            for text_tensor in self._prepare_iter(segments):
+                if not put(self._acoustic(models, text_tensor)):
+                    return
+        except Exception as e:
+            put(e)
+        else:
+            put(None)
+
+    def _pipelined_segments(self, models, segments):
+        """feeds the segments through the synthesis pipeline, keeping a
+        small window of segments in flight so the stages overlap
+        without queueing up the whole text.
+
+        """
+
+        in_flight = collections.deque()
+        for text_tensor in self._prepare_iter(segments):
+            in_flight.append(self.pipeline.submit((models, text_tensor)))
+            if len(in_flight) > 2:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+    def _threaded_segments(self, models, segments):
+        mels = queue.Queue(maxsize=2)
+        stop = threading.Event()
+        worker = threading.Thread(
+            target=self._acoustic_worker, args=(models, segments, mels, stop), name="glados-acoustic", daemon=True)
+        worker.start()
+
+        try:
+            while True:
+                mel = mels.get()
+                if mel is None:
+                    return
+                if isinstance(mel, Exception):
+                    raise mel
+                yield self._vocode(models, mel)
+        finally:
+            stop.set()
+            worker.join()
+
+    def _crossfade(self, audio_blocks):
+        """joins consecutive float audio blocks with a short linear
+        crossfade, yielding int16 blocks as soon as they are final (the
+        tail of each block is held back until the next one arrives).
+
+        """
+
+        n = int(self.sample_rate_khz * self.crossfade_ms / 1000)
+        tail = None
+        for audio in audio_blocks:
+            if tail is not None:
+                k = min(n, len(tail), len(audio))
+                if k > 0:
+                    fade_in = numpy.linspace(0.0, 1.0, k, dtype=numpy.float32)
+                    audio[:k] = tail[len(tail)-k:] * fade_in[::-1] + audio[:k] * fade_in
+                yield self._to_pcm(tail[:len(tail)-k])
+            tail = audio
+        if tail is not None:
+            yield self._to_pcm(tail)
+
+    def tts_generate_segments(self, text, models):
+        """long-text mode: split the text into segments and synthesize them
+        one by one, with the acoustic model working on the next segment
+        while the vocoder works on the current one. yields int16 audio
+        blocks, so memory use stays bounded no matter how long the text is.
+
+        """
 
         t0 = time()
         t_name = self._short_name(text)
-        logger.debug(f"generating audio for text: '{text}'")
+        segments = segment_text(text, self.segment_max_tokens)
+        logger.debug(f"long-text mode for '{t_name}': {len(segments)} segments")
+
+        if self.pipeline is not None:
+            audio_blocks = self._pipelined_segments(models, segments)
+        else:
+            audio_blocks = self._threaded_segments(models, segments)
+
+        yield from self._crossfade(audio_blocks)
+
+        logger.debug(f"time to generate audio for '{t_name}' ({len(segments)} segments): {round(time()-t0, 2)}s")
+
+    def _synthesize(self, models, text):
+        """float audio for a (short) text"""
+        text_tensor = self._prepare(text)
+        if self.pipeline is not None:
+            return self.pipeline.submit((models, text_tensor)).result()
+        return self._vocode(models, self._acoustic(models, text_tensor))
+
+    def _sentence_audio(self, models, sentence):
+        """float audio for a single sentence, from the sentence cache if
+        possible. concurrent requests for the same new sentence share a
+        single synthesis.
+
+        """
 
-        with torch.no_grad():
-            # Generate generic TTS-output
-            tts_output = self.glados.generate_jit(text_tensor.to(self.device))
+        salt = self._fname_salt if models.voice is None else f"voice:{models.voice}"
+        key = self.sentence_cache.key(sentence, salt)
+        audio = self.sentence_cache.get(key)
+        if audio is not None:
+            return audio
 
-            # Use HiFiGAN as vocoder to make output sound like GLaDOS
-            mel = tts_output['mel_post'].to(self.device)
-            audio = self.vocoder(mel)
+        with self._sentence_lock:
+            future = self._sentence_inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._sentence_inflight[key] = Future()
+        if not owner:
+            # the crossfade modifies the audio in place
+            return future.result().copy()
 
-            logger.info(f"time to generate audio for '{t_name}': {round(time()-t0, 2)}s")
+        try:
+            audio = self._synthesize(models, sentence)
+            self.sentence_cache.put(key, audio)
+            future.set_result(audio)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._sentence_lock:
+                self._sentence_inflight.pop(key, None)
+        return audio.copy()
 
-            # Normalize audio to fit in file
-            audio = audio.squeeze() * 32768.0
-            return audio.cpu().numpy().astype('int16')
+    def tts_generate_sentences(self, text, models):
+        """sentence cache mode: split the text into sentences, look each of
+        them up in the sentence cache and synthesize the ones that
+        aren't cached in parallel, then join them with short crossfades.
 
-    def tts_audio_to_file(self, text, audio_format, use_cache):
+        """
+
+        t0 = time()
+        t_name = self._short_name(text)
+        sentences = sentence_segments(text, self.segment_max_tokens)
+        window = self._sentence_threads + 1
+
+        def audio_blocks():
+            in_flight = collections.deque()
+            for sentence in sentences:
+                in_flight.append(self._sentence_pool.submit(self._sentence_audio, models, sentence))
+                if len(in_flight) > window:
+                    yield in_flight.popleft().result()
+            while in_flight:
+                yield in_flight.popleft().result()
+
+        yield from self._crossfade(audio_blocks())
+
+        logger.debug(f"time to generate audio for '{t_name}' ({len(sentences)} sentences): {round(time()-t0, 2)}s")
+
+    def sentence_cache_stats(self):
+        if self.sentence_cache is None:
+            return None
+        return self.sentence_cache.stats()
+
+    def tts_generate_blocks(self, text, priority="normal", voice=None, degraded=False):
+        """yields int16 audio blocks for 'text' as they are synthesized: per
+        sentence with the sentence cache, per segment in long-text mode,
+        per vocoder chunk with chunked vocoding, otherwise the whole
+        audio as a single block.
+
+        """
+
+        tokens = estimate_tokens(text)
+        chunk_frames = self.vocoder_chunk_frames
+        if degraded and self.degrade.chunk_frames is not None:
+            chunk_frames = self.degrade.chunk_frames
+        t_request = time()
+        with self._schedule(tokens, priority), self._use_models(voice) as models:
+            t0 = time()
+            if self.sentence_cache is not None:
+                yield from self.tts_generate_sentences(text, models)
+            elif self.is_long_text(text):
+                yield from self.tts_generate_segments(text, models)
+            elif chunk_frames > 0 and self.pipeline is None:
+                mel = self._acoustic(models, self._prepare(text))
+                for audio in self._vocode_chunks(models, mel, chunk_frames):
+                    yield self._to_pcm(audio)
+            else:
+                yield self.tts_generate_audio(text, models=models)
+            self._record_speed(tokens, time() - t0)
+        if self.degrade is not None:
+            self.degrade.record(time() - t_request)
+
+    def _resampled(self, blocks, sample_rate):
+        """resample int16 audio blocks from the native sample rate to
+        'sample_rate'
+
+        """
+
+        if sample_rate == self.sample_rate_khz:
+            yield from blocks
+            return
+
+        # the resampler is linear, so it works on the int16 scale directly
+        resampler = Resampler(self.sample_rate_khz, sample_rate)
+        for block in blocks:
+            audio = resampler.process(block)
+            self.pcm_pool.put(block)
+            yield self._to_pcm(audio, scale=1.0)
+        yield self._to_pcm(resampler.process([], final=True), scale=1.0)
+
+    def _encode(self, f, text, encoder, sample_rate, priority="normal", voice=None, degraded=False):
+        """synthesize 'text' and append the audio blocks to the file object
+        'f' as they are generated. returns the number of samples.
+
+        """
+
+        n_samples = 0
+        with encoder.open(f, sample_rate) as w:
+            for block in self._resampled(self.tts_generate_blocks(text, priority, voice, degraded), sample_rate):
+                w.write(block)
+                n_samples += len(block)
+                # the encoder has copied it
+                self.pcm_pool.put(block)
+        return n_samples
+
+    def _index_render(self, fname, text, audio_format, sample_rate, size, n_samples, t0, voice=None):
+        if self.index is not None:
+            self.index.record_render(
+                fname, text, audio_format, sample_rate, size, n_samples / sample_rate, time() - t0, voice)
+
+    def _index_hit(self, fname):
+        if self.index is not None:
+            self.index.record_hit(fname)
+
+    def _degraded_voice(self, voice, cached):
+        """the voice to render with under load, or None. audio that is
+        already cached in full quality is served as it is.
+
+        """
+
+        if self.degrade is None or cached():
+            return None
+        return self.degrade.voice_for(voice)
+
+    def tts_audio_to_file(self, text, audio_format, use_cache, sample_rate=None, priority="normal", voice=None):
         """generates the audio, writes it to a file and returns the path to
         the file.
 
@@ -172,41 +1103,177 @@ class GLaDOS:
 
         """
 
-        fname = self._make_fname(text, audio_format)
-        audiofile_path = os.path.join(self.audio_dir, fname)
+        encoder = self.get_encoder(audio_format)
+        sample_rate = encoder.output_rate(sample_rate or self.sample_rate)
 
-        if use_cache and os.path.exists(audiofile_path):
+        fname = self._make_fname(text, audio_format, sample_rate, voice)
+        fast_voice = self._degraded_voice(voice, lambda: use_cache and self.storage.exists(fname))
+        if fast_voice is not None:
+            # degraded audio is cached under the names of the fast voice
+            voice = fast_voice
+            fname = self._make_fname(text, audio_format, sample_rate, voice)
+
+        # a single lookup, a file can be evicted between two of them
+        stat = self.storage.stat(fname) if use_cache else None
+        if stat is not None:
             from_cache = True
             # update access time
-            os.utime(audiofile_path)
+            self.storage.touch(fname)
+            self._index_hit(fname)
             logger.debug(f"cached: '{fname}'")
 
         else:
             from_cache = False
-            # generate the audio
-            audio = self.tts_generate_audio(text)
-            with open(audiofile_path, 'wb') as f:
-                soundfile.write(f, audio, self.sample_rate_khz, format=audio_format)
+            # generate the audio, the file only shows up in the storage
+            # once it is complete, so a partial file never looks like a
+            # cached one
+            t0 = time()
+            with self.storage.writer(fname) as f:
+                n_samples = self._encode(f, text, encoder, sample_rate, priority, voice, fast_voice is not None)
 
             logger.debug(f"wrote file: '{fname}'")
+            stat = self.storage.stat(fname)
+            if stat is not None:
+                self._index_render(fname, text, audio_format, sample_rate, stat.size, n_samples, t0, voice)
+            else:
+                logger.warning(f"'{fname}' was evicted right after it was written")
 
-        audiofile_timestamp = os.stat(audiofile_path).st_ctime
         return GLaDOSResponse(
             from_cache=from_cache,
             text=text,
             audio_format=audio_format,
             audio_filename=fname,
-            audio_timestamp=audiofile_timestamp
+            audio_timestamp=stat.ctime if stat is not None else datetime.now(),
+            sample_rate=sample_rate,
+            degraded=fast_voice is not None
         )
 
-    def tts(self, text, audio_format="wav", use_cache=True):
-        """shorthand function for Text-to-Speech.
+    def _persist(self, fname, buf):
+        """write-behind: write an in-memory render to the storage"""
+        try:
+            with buf.getbuffer() as view:
+                self.storage.write(fname, view)
+            logger.debug(f"wrote file: '{fname}' (write-behind)")
+        except Exception as e:
+            logger.error(f"failed to write '{fname}': {e}")
+        finally:
+            with self._pending_lock:
+                self._pending_writes.pop(fname, None)
+            buf.release()
+
+    def tts_audio_to_memory(self, text, audio_format, use_cache, sample_rate=None, priority="normal", voice=None):
+        """like tts_audio_to_file, but cache misses are encoded into a pooled
+        in-memory buffer instead of a file, and persisted to the audio
+        storage asynchronously (write-behind).
+
+        returns the response, and the buffer with the encoded audio (the
+        caller has to release() it), or None if the audio should be
+        read from the cached file.
 
         """
 
+        encoder = self.get_encoder(audio_format)
+        sample_rate = encoder.output_rate(sample_rate or self.sample_rate)
+
+        fname = self._make_fname(text, audio_format, sample_rate, voice)
+
+        def cached():
+            with self._pending_lock:
+                if fname in self._pending_writes:
+                    return True
+            return self.storage.exists(fname)
+
+        fast_voice = self._degraded_voice(voice, lambda: use_cache and cached())
+        if fast_voice is not None:
+            voice = fast_voice
+            fname = self._make_fname(text, audio_format, sample_rate, voice)
+
+        def response(from_cache, timestamp=None):
+            return GLaDOSResponse(
+                from_cache=from_cache,
+                text=text,
+                audio_format=audio_format,
+                audio_filename=fname,
+                audio_timestamp=timestamp or datetime.now(),
+                sample_rate=sample_rate,
+                degraded=fast_voice is not None
+            )
+
+        if use_cache:
+            with self._pending_lock:
+                buf = self._pending_writes.get(fname)
+                if buf is not None:
+                    buf.acquire()
+            if buf is not None:
+                self._index_hit(fname)
+                logger.debug(f"cached: '{fname}' (pending write)")
+                return response(True), buf
+            stat = self.storage.stat(fname)
+            if stat is not None:
+                self.storage.touch(fname)
+                self._index_hit(fname)
+                logger.debug(f"cached: '{fname}'")
+                return response(True, stat.ctime), None
+
+        t0 = time()
+        buf = self.buffers.get()
+        try:
+            n_samples = self._encode(buf, text, encoder, sample_rate, priority, voice, fast_voice is not None)
+        except Exception:
+            buf.release()
+            raise
+
+        if use_cache or self.persist_uncached:
+            # renders that are never written don't go in the index
+            self._index_render(fname, text, audio_format, sample_rate, len(buf), n_samples, t0, voice)
+            with self._pending_lock:
+                self._pending_writes[fname] = buf.acquire()
+            self._write_behind.submit(self._persist, fname, buf)
+
+        return response(False), buf
+
+    def _check_input(self, text, audio_format, sample_rate, priority="normal"):
         if not len(text) > 0:
             raise GLaDOSInputError("input must not be empty")
+        if priority not in PRIORITY_CLASSES:
+            raise GLaDOSInputError(f"unknown priority: '{priority}', supported: {PRIORITY_CLASSES}")
+        audio_format = (audio_format or self.default_audio_format).lower()
+        if audio_format not in self.audio_formats:
+            raise GLaDOSInputError(f"unsupported audio format: '{audio_format}', supported: {self.audio_formats}")
+        if sample_rate is not None and not 8000 <= sample_rate <= 48000:
+            raise GLaDOSInputError("sample rate must be between 8000 and 48000 Hz")
+        return audio_format
 
-        logger.info(f"input: '{text}'")
+    def tts(self, text, audio_format=None, use_cache=True, sample_rate=None, priority="normal", voice=None):
+        """shorthand function for Text-to-Speech. 'priority' is the class
+        (interactive, normal or bulk) the request is scheduled with, and
+        'voice' the name of the voice (None for the default voice).
+
+        """
+
+        audio_format = self._check_input(text, audio_format, sample_rate, priority)
+        voice = self._check_voice(voice)
+
+        t0 = time()
+        g = self.tts_audio_to_file(text, audio_format, use_cache, sample_rate, priority, voice)
+        self._log_request(text, time() - t0, g, priority, voice)
+        return g
+
+    def tts_to_memory(self, text, audio_format=None, use_cache=True, sample_rate=None, priority="normal", voice=None):
+        """Text-to-Speech that returns the encoded audio in memory for cache
+        misses, see tts_audio_to_memory.
+
+        """
+
+        audio_format = self._check_input(text, audio_format, sample_rate, priority)
+        voice = self._check_voice(voice)
+
+        t0 = time()
+        g, buf = self.tts_audio_to_memory(text, audio_format, use_cache, sample_rate, priority, voice)
+        self._log_request(text, time() - t0, g, priority, voice)
+        return g, buf
 
-        return self.tts_audio_to_file(text, audio_format, use_cache)
+    def _log_request(self, text, seconds, g, priority, voice):
+        self.request_log.record(
+            text, seconds, from_cache=g.from_cache, audio_format=g.audio_format, sample_rate=g.sample_rate,
+            priority=priority, voice=voice or self.default_voice, degraded=g.degraded)
@@ -0,0 +1,139 @@
+import os
+import sys
+import collections
+from concurrent.futures import ProcessPoolExecutor, Future
+from multiprocessing import get_context, shared_memory, resource_tracker
+
+import numpy
+from loguru import logger
+
+from glados_tts.utils import tools
+from glados_tts.utils.lexicon import Lexicon
+
+
+# set in each worker process by _init_worker
+_lexicon = None
+
+
+def _init_worker(lexicon_path, overrides_path):
+    global _lexicon
+    if lexicon_path is not None or overrides_path is not None:
+        # the lexicon file is mmap'd, so the workers share the pages
+        _lexicon = Lexicon.from_files(lexicon_path, overrides_path)
+
+
+def _create_untracked(size):
+    """a new shared memory block that the resource tracker of this
+    process won't unlink when the process exits.
+
+    """
+
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(create=True, size=size, track=False)
+    shm = shared_memory.SharedMemory(create=True, size=size)
+    if os.name == "posix":
+        # the tracker knows posix blocks by their name with the leading
+        # slash, which shm.name leaves off
+        resource_tracker.unregister(f"/{shm.name}", "shared_memory")
+    return shm
+
+
+def _prepare_batch(texts):
+    """runs in a worker process: turns 'texts' into token arrays, and
+    hands them back in a single shared memory block (rather than
+    pickling them). returns the name of the block and the length of
+    each array.
+
+    """
+
+    arrays = [numpy.asarray(tools.text_to_tokens(text, _lexicon), dtype=numpy.int32) for text in texts]
+    lengths = [len(a) for a in arrays]
+    total = sum(lengths)
+
+    # the parent unlinks the block once it has copied the tokens out,
+    # the worker shouldn't clean it up when it exits
+    shm = _create_untracked(max(1, total * 4))
+    out = numpy.ndarray((total,), dtype=numpy.int32, buffer=shm.buf)
+    if total:
+        numpy.concatenate(arrays, out=out)
+    del out
+    shm.close()
+    return shm.name, lengths
+
+
+def _unpack(name, lengths):
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        flat = numpy.ndarray((sum(lengths),), dtype=numpy.int32, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+
+    arrays = []
+    offset = 0
+    for n in lengths:
+        arrays.append(flat[offset:offset + n].reshape(1, n))
+        offset += n
+    return arrays
+
+
+class Frontend:
+    """runs the text frontend (cleaning, espeak and tokenization) in a pool
+    of 'processes' worker processes, so it doesn't hold the GIL on the
+    threads that run the models and scales across cores on its own.
+    the token arrays come back through shared memory.
+
+    """
+
+    def __init__(self, processes, lexicon_path=None, overrides_path=None):
+        self.processes = processes
+        # workers are spawned rather than forked, torch (and its thread
+        # pools) don't survive a fork
+        self._pool = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(lexicon_path, overrides_path),
+        )
+        logger.info(f"text frontend: {processes} process(es)")
+
+    def submit_batch(self, texts):
+        """prepare 'texts' in a single worker, returns a future for a list of
+        token arrays (shaped (1, n), like tools.prepare_tokens).
+
+        """
+
+        outer = Future()
+        inner = self._pool.submit(_prepare_batch, list(texts))
+
+        def done(f):
+            try:
+                result = _unpack(*f.result())
+            except Exception as e:
+                outer.set_exception(e)
+            else:
+                outer.set_result(result)
+
+        inner.add_done_callback(done)
+        return outer
+
+    def prepare(self, text):
+        return self.submit_batch([text]).result()[0]
+
+    def prepare_iter(self, texts, batch_size=4, lookahead=2):
+        """yields token arrays for 'texts' in order, with up to 'lookahead'
+        batches of 'batch_size' texts being prepared in parallel.
+
+        """
+
+        texts = list(texts)
+        in_flight = collections.deque()
+        for i in range(0, len(texts), batch_size):
+            in_flight.append(self.submit_batch(texts[i:i + batch_size]))
+            if len(in_flight) > lookahead:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+    def shutdown(self):
+        self._pool.shutdown()
@@ -1,19 +1,25 @@
 import json
 import os
+import time
+import atexit
 from functools import update_wrapper
 
 from loguru import logger
 import click
 from click_help_colors import HelpColorsGroup, version_option
-import uvicorn
-from fastapi import FastAPI
 
 import glados_tts
-import glados_tts.restapi
 from glados_tts.engine import GLaDOS
+from glados_tts.utils import profiling, logs
+from glados_tts.utils.lexicon import Lexicon, write_lexicon, split_words
+from glados_tts.utils.cleaners import english_cleaners, espeak
+from glados_tts.storage import storage_from_url, migrate
 
 import click
 
+# heavy modules (torch, phonemizer, uvicorn, ..) are imported lazily, when
+# (and if) a command needs them
+
 # Check for the correct environment variable based on the operating system
 home_dir = os.environ.get("HOME") or os.environ.get("USERPROFILE")
 if not home_dir:
@@ -21,6 +27,10 @@ if not home_dir:
 
 DEFAULT_GLADOS_CONFIG = os.path.join(home_dir, ".config", "glados.json")
 
+# ctx.meta keys for the engine options of the cli group
+CONFIGURE_OPTIONS = "glados_tts.configure"
+START_OPTIONS = "glados_tts.start"
+
 
 @click.command()
 @click.pass_context
@@ -44,6 +54,13 @@ CONTEXT_SETTINGS = {
     "default_map": {}
 }
 
+
+def state_dir():
+    """the local directory for state files (the cache index)"""
+    state_home = os.environ.get("XDG_STATE_HOME") or os.path.join(os.path.expanduser("~"), ".local", "state")
+    return os.path.join(state_home, "glados-tts")
+
+
 def read_config_file(ctx, param, value):
     try:
         with open(value, 'r') as f:
@@ -72,6 +89,34 @@ def update_meta(f):
         return ctx.invoke(f, *args, **kwargs)
     return update_wrapper(new_func, f)
 
+def start_engine(f):
+    """start the engine with the options of the cli group before the
+    command runs: the storage, the cache index, the pipeline and the
+    frontend processes. for the commands that synthesize.
+    """
+    @click.pass_context
+    def new_func(ctx, *args, **kwargs):
+        glados = GLaDOS.get()
+        if not glados.started:
+            with profiling.phase("configure engine"):
+                glados.start(**ctx.meta[START_OPTIONS], **ctx.meta[CONFIGURE_OPTIONS])
+        return ctx.invoke(f, *args, **kwargs)
+    return update_wrapper(new_func, f)
+
+
+def configure_engine(f):
+    """only configure the engine (models, voices, lexicon, cache key
+    settings), for the commands that don't synthesize or touch the cache.
+    """
+    @click.pass_context
+    def new_func(ctx, *args, **kwargs):
+        glados = GLaDOS.get()
+        if not glados.started:
+            glados.configure(**ctx.meta[CONFIGURE_OPTIONS])
+        return ctx.invoke(f, *args, **kwargs)
+    return update_wrapper(new_func, f)
+
+
 @click.group(
     cls=HelpColorsGroup,
     context_settings=CONTEXT_SETTINGS,
@@ -93,15 +138,203 @@ def update_meta(f):
 )
 @click.option("--debug/--no-debug", default=False, show_envvar=True, show_default=True)
 @click.option("--log-level", show_envvar=True, show_default=True, default="INFO")
+@click.option(
+    "--log-json/--no-log-json", default=False, show_envvar=True, show_default=True,
+    help="write the log as json objects, one per line",
+)
+@click.option(
+    "--log-file", default=None, show_envvar=True, type=click.Path(dir_okay=False),
+    help="write the log to this file [default: stderr]",
+)
+@click.option(
+    "--log-sample", default=1.0, type=float, show_envvar=True, show_default=True,
+    help="fraction of the requests that get a log line at DEBUG (0 for none), the summary is logged at INFO",
+)
+@click.option(
+    "--log-max-text", default=80, type=int, show_envvar=True, show_default=True,
+    help="cut the text off after this many characters in request log lines (0 for the full text)",
+)
+@click.option(
+    "--log-summary-interval", default=60.0, type=float, show_envvar=True, show_default=True,
+    help="log a summary of the throughput and latency every this many seconds (0 to disable)",
+)
+@click.option(
+    "--profile-startup/--no-profile-startup", default=False, show_envvar=True, show_default=True,
+    help="report how long imports and each startup phase take",
+)
 @click.option(
     "--audio-dir", default="audio/", show_default=True, show_envvar=True,
     type=click.Path(dir_okay=True),
     help="where generated audiofiles get saved",
 )
+@click.option(
+    "--storage", default=None, show_envvar=True,
+    help="cache storage backend instead of --audio-dir: 'sharded:DIR', 'sqlite:FILE' or 's3://BUCKET/PREFIX'",
+)
+@click.option(
+    "--cache-index/--no-cache-index", default=False, show_envvar=True, show_default=True,
+    help="keep an index of cached audio (text, size, hits, ..) for the /cache api, eviction and warm-up",
+)
+@click.option(
+    "--cache-index-path", default=None, show_envvar=True, type=click.Path(dir_okay=False),
+    help="sqlite file for the cache index, on a local disk [default: $XDG_STATE_HOME/glados-tts/index.db]",
+)
+@click.option(
+    "--canonical-cache-keys/--no-canonical-cache-keys", default=False, show_envvar=True, show_default=True,
+    help="name cached audio by the phoneme tokens of the text, so equivalent texts share audio",
+)
 @click.option(
     "--audio-format", default="wav", show_default=True, show_envvar=True,
     type=click.Choice(GLaDOS.audio_formats, case_sensitive=False),
 )
+@click.option(
+    "--backend", default="torchscript", show_envvar=True, show_default=True,
+    type=click.Choice(["torchscript", "onnx"]),
+    help="inference backend, onnx runs models exported with 'gladosctl onnx export' on onnxruntime",
+)
+@click.option(
+    "--acoustic-model", default=None, show_envvar=True,
+    type=click.Path(dir_okay=False, exists=True),
+    help="acoustic model [default: the packaged glados.pt, or glados.onnx]",
+)
+@click.option(
+    "--vocoder-model", default=None, show_envvar=True,
+    type=click.Path(dir_okay=False, exists=True),
+    help="vocoder model [default: the packaged vocoder-gpu.pt, or vocoder-gpu.onnx]",
+)
+@click.option(
+    "--voice-memory-mb", default=0, type=int, show_envvar=True, show_default=True,
+    help="unload the least recently used voices when the models use more memory than this (0 for no limit)",
+)
+@click.option(
+    "--onnx-threads", default=None, type=int, show_envvar=True,
+    help="onnxruntime intra-op threads per model [default: one per core]",
+)
+@click.option(
+    "--onnx-inter-threads", default=None, type=int, show_envvar=True,
+    help="onnxruntime inter-op threads, for --onnx-execution-mode parallel",
+)
+@click.option(
+    "--onnx-execution-mode", default="sequential", show_envvar=True, show_default=True,
+    type=click.Choice(["sequential", "parallel"]),
+)
+@click.option(
+    "--onnx-graph-optimization", default="all", show_envvar=True, show_default=True,
+    type=click.Choice(["disable", "basic", "extended", "all"]),
+    help="onnxruntime graph optimization level",
+)
+@click.option(
+    "--lexicon", default=None, show_envvar=True,
+    type=click.Path(dir_okay=False, exists=True),
+    help="pronunciation lexicon built with 'gladosctl lexicon build'",
+)
+@click.option(
+    "--lexicon-overrides", default=None, show_envvar=True,
+    type=click.Path(dir_okay=False, exists=True),
+    help="json file with {word: phonemes} that take precedence over the lexicon",
+)
+@click.option(
+    "--long-text-threshold", default=1000, type=int, show_envvar=True, show_default=True,
+    help="texts longer than this many characters are synthesized in segments (0 to disable)",
+)
+@click.option(
+    "--segment-max-tokens", default=200, type=int, show_envvar=True, show_default=True,
+    help="approximate token budget for each segment in long-text mode",
+)
+@click.option(
+    "--pipeline/--no-pipeline", default=False, show_envvar=True, show_default=True,
+    help="run the acoustic model and the vocoder as separate pipeline stages",
+)
+@click.option("--acoustic-threads", default=1, type=int, show_envvar=True, show_default=True)
+@click.option("--vocoder-threads", default=1, type=int, show_envvar=True, show_default=True)
+@click.option(
+    "--pipeline-queue-size", default=4, type=int, show_envvar=True, show_default=True,
+    help="bounded queue size for each pipeline stage",
+)
+@click.option(
+    "--acoustic-torch-threads", default=None, type=int, show_envvar=True,
+    help="torch intra-op threads for each acoustic stage thread",
+)
+@click.option(
+    "--vocoder-torch-threads", default=None, type=int, show_envvar=True,
+    help="torch intra-op threads for each vocoder stage thread",
+)
+@click.option(
+    "--frontend-processes", default=0, type=int, show_envvar=True, show_default=True,
+    help="run the text frontend (cleaning, espeak, tokenization) in this many processes (0: on the request thread)",
+)
+@click.option(
+    "--sentence-cache/--no-sentence-cache", default=False, show_envvar=True, show_default=True,
+    help="cache audio per sentence, so only new sentences in a text are synthesized",
+)
+@click.option(
+    "--sentence-cache-dir", default=None, show_envvar=True, type=click.Path(file_okay=False),
+    help="where the sentence cache is kept [default: AUDIO_DIR/.sentences]",
+)
+@click.option(
+    "--sentence-cache-memory-mb", default=64, type=int, show_envvar=True, show_default=True,
+    help="recently used sentences kept in memory",
+)
+@click.option(
+    "--sentence-threads", default=2, type=int, show_envvar=True, show_default=True,
+    help="new sentences of a text that are synthesized in parallel",
+)
+@click.option(
+    "--scheduler/--no-scheduler", default=True, show_envvar=True, show_default=True,
+    help="schedule synthesis by priority class and text length (shortest job first, with aging)",
+)
+@click.option(
+    "--scheduler-slots", default=None, type=int, show_envvar=True,
+    help="requests synthesized at the same time [default: 1, or the number of pipeline threads]",
+)
+@click.option(
+    "--scheduler-aging", default=100.0, type=float, show_envvar=True, show_default=True,
+    help="tokens (about a character of text each) a waiting request catches up per second it waits",
+)
+@click.option(
+    "--sample-rate", default=22050, type=int, show_envvar=True, show_default=True,
+    help="default output sample rate, audio is resampled from the native 22050 Hz if needed",
+)
+@click.option(
+    "--persist-uncached/--no-persist-uncached", default=False, show_envvar=True, show_default=True,
+    help="also write audio for use_cache=false requests to the audio dir (in the background)",
+)
+@click.option(
+    "--vocoder-chunk-frames", default=0, type=int, show_envvar=True, show_default=True,
+    help="run the vocoder over windows of this many mel frames (0 to disable)",
+)
+@click.option(
+    "--vocoder-chunk-overlap", default=16, type=int, show_envvar=True, show_default=True,
+    help="mel frames of context on each side of a vocoder window",
+)
+@click.option(
+    "--degrade/--no-degrade", default=False, show_envvar=True, show_default=True,
+    help="render new requests with a faster voice while the server is overloaded",
+)
+@click.option(
+    "--degrade-voice", default="glados-lq", show_envvar=True, show_default=True,
+    help="the voice the default voice degrades to (other voices: 'degraded_voice' in the config)",
+)
+@click.option(
+    "--degrade-p95", default=5.0, type=float, show_envvar=True, show_default=True,
+    help="degrade when the 95th percentile of recent request latencies is above this many seconds (0 to ignore)",
+)
+@click.option(
+    "--degrade-queue-wait", default=2.0, type=float, show_envvar=True, show_default=True,
+    help="degrade when the estimated wait for a synthesis slot is above this many seconds (0 to ignore)",
+)
+@click.option(
+    "--degrade-recover", default=0.5, type=float, show_envvar=True, show_default=True,
+    help="back to full quality when both are below this fraction of their threshold",
+)
+@click.option(
+    "--degrade-hold", default=10.0, type=float, show_envvar=True, show_default=True,
+    help="stay degraded for at least this many seconds",
+)
+@click.option(
+    "--degrade-chunk-frames", default=None, type=int, show_envvar=True,
+    help="vocoder window (mel frames) for degraded renders, for a faster first byte [default: --vocoder-chunk-frames]",
+)
 @version_option(
     prog_name=glados_tts.__name__, version=glados_tts.__version__,
     version_color="yellow", prog_name_color="green"
@@ -109,8 +342,106 @@ def update_meta(f):
 @update_meta
 @click.pass_context
 def cli(ctx, *args, **kwargs):
-    glados = GLaDOS.get()
-    glados.start(kwargs['audio_dir'], kwargs['audio_format'])
+    logs.configure(
+        "DEBUG" if kwargs['debug'] else kwargs['log_level'], json=kwargs['log_json'], path=kwargs['log_file'])
+
+    if kwargs['profile_startup']:
+        profiling.enable()
+        profiling.time_imports()
+        atexit.register(profiling.report)
+
+    if kwargs['pipeline']:
+        pipeline = {
+            "acoustic_threads": kwargs['acoustic_threads'],
+            "vocoder_threads": kwargs['vocoder_threads'],
+            "queue_size": kwargs['pipeline_queue_size'],
+            "acoustic_torch_threads": kwargs['acoustic_torch_threads'],
+            "vocoder_torch_threads": kwargs['vocoder_torch_threads'],
+        }
+    else:
+        pipeline = None
+
+    if kwargs['scheduler']:
+        scheduler = {"slots": kwargs['scheduler_slots'], "aging": kwargs['scheduler_aging']}
+    else:
+        scheduler = None
+
+    if kwargs['sentence_cache']:
+        sentence_cache = {
+            "path": kwargs['sentence_cache_dir'] or os.path.join(kwargs['audio_dir'], ".sentences"),
+            "max_bytes": kwargs['sentence_cache_memory_mb'] * 1024 * 1024,
+            "threads": kwargs['sentence_threads'],
+        }
+    else:
+        sentence_cache = None
+
+    if kwargs['cache_index']:
+        # not next to the audio: that can be a network mount (or s3),
+        # and sqlite doesn't work on those
+        cache_index = kwargs['cache_index_path'] or os.path.join(state_dir(), "index.db")
+    else:
+        cache_index = None
+
+    if kwargs['backend'] == "onnx":
+        backend_options = {
+            "intra_op_threads": kwargs['onnx_threads'],
+            "inter_op_threads": kwargs['onnx_inter_threads'],
+            "execution_mode": kwargs['onnx_execution_mode'],
+            "graph_optimization": kwargs['onnx_graph_optimization'],
+        }
+    else:
+        backend_options = None
+
+    if kwargs['degrade']:
+        degrade = {
+            "voice": kwargs['degrade_voice'],
+            "p95": kwargs['degrade_p95'],
+            "queue_wait": kwargs['degrade_queue_wait'],
+            "recover": kwargs['degrade_recover'],
+            "hold": kwargs['degrade_hold'],
+            "chunk_frames": kwargs['degrade_chunk_frames'],
+        }
+    else:
+        degrade = None
+
+    # the engine is only set up by the commands that need it, see
+    # start_engine() and configure_engine()
+    ctx.meta[CONFIGURE_OPTIONS] = dict(
+        default_audio_format=kwargs['audio_format'],
+        lexicon=kwargs['lexicon'],
+        lexicon_overrides=kwargs['lexicon_overrides'],
+        sample_rate=kwargs['sample_rate'],
+        canonical_keys=kwargs['canonical_cache_keys'],
+        acoustic_model=kwargs['acoustic_model'],
+        vocoder_model=kwargs['vocoder_model'],
+        backend=kwargs['backend'],
+        backend_options=backend_options,
+        # {name: {"acoustic_model": .., "vocoder_model": .., "preload": ..}}
+        voices=ctx.meta.get("voices", {}),
+        voice_memory_budget=kwargs['voice_memory_mb'] * 1024 * 1024,
+        # per-format encoder options, e.g. {"mp3": {"compression_level": 0.5}}
+        encoder_options=ctx.meta.get("encoders", {}),
+    )
+    ctx.meta[START_OPTIONS] = dict(
+        audio_dir=kwargs['audio_dir'],
+        long_text_threshold=kwargs['long_text_threshold'],
+        segment_max_tokens=kwargs['segment_max_tokens'],
+        pipeline=pipeline,
+        scheduler=scheduler,
+        sentence_cache=sentence_cache,
+        frontend_processes=kwargs['frontend_processes'],
+        vocoder_chunk_frames=kwargs['vocoder_chunk_frames'],
+        vocoder_chunk_overlap=kwargs['vocoder_chunk_overlap'],
+        persist_uncached=kwargs['persist_uncached'],
+        storage=kwargs['storage'],
+        cache_index=cache_index,
+        degrade=degrade,
+        request_log={
+            "sample": kwargs['log_sample'],
+            "max_text": kwargs['log_max_text'],
+            "interval": kwargs['log_summary_interval'],
+        },
+    )
 
 
 @cli.command(name="restapi")
@@ -119,9 +450,51 @@ def cli(ctx, *args, **kwargs):
 @click.option("--root-path", default="", show_envvar=True, show_default=True)
 @click.option("--forwarded-allow-ips", default="0.0.0.0", show_envvar=True, show_default=True)
 @click.option("--workers", default=1, show_envvar=True, show_default=True)
+@click.option(
+    "--admin-token", default=None, show_envvar=True,
+    help="enable the /admin api (model reload), with 'Authorization: Bearer TOKEN'",
+)
+@click.option(
+    "--max-chars", default=10000, type=int, show_envvar=True, show_default=True,
+    help="reject texts longer than this many characters with 413 (0 for no limit)",
+)
+@click.option(
+    "--max-tokens", default=15000, type=int, show_envvar=True, show_default=True,
+    help="reject texts with more (estimated) phoneme tokens than this with 413 (0 for no limit)",
+)
+@click.option(
+    "--rate-limit", default=0.0, type=float, show_envvar=True, show_default=True,
+    help="requests per second per client (api key or ip), over the limit gets 429 (0 for no limit)",
+)
+@click.option("--rate-burst", default=10, type=int, show_envvar=True, show_default=True)
+@click.option(
+    "--latency-slo", default=0.0, type=float, show_envvar=True, show_default=True,
+    help="defer requests (429) that are estimated to take longer than this many seconds (0 to disable)",
+)
+@click.option(
+    "--jobs/--no-jobs", default=False, show_envvar=True, show_default=True,
+    help="enable the /jobs api, for synthesis in the background",
+)
+@click.option(
+    "--jobs-db", default=None, show_envvar=True, type=click.Path(dir_okay=False),
+    help="sqlite file for the job queue [default: AUDIO_DIR/.jobs.db]",
+)
+@click.option(
+    "--jobs-max-pending", default=1000, type=int, show_envvar=True, show_default=True,
+    help="jobs that can be queued or running, more are rejected with 503",
+)
+@click.option("--job-workers", default=1, type=int, show_envvar=True, show_default=True)
+@click.option(
+    "--webhook-host", "webhook_hosts", multiple=True, show_envvar=True,
+    help="host that any client may have job webhooks posted to (repeat for each host), "
+    "other webhooks need a configured api key",
+)
+@start_engine
 @update_meta
 @click.pass_context
-def cli_gladosapi(ctx, host, port, root_path, forwarded_allow_ips, workers):
+def cli_gladosapi(ctx, host, port, root_path, forwarded_allow_ips, workers, admin_token, **limits):
+    import uvicorn
+
     debug_mode = ctx.meta.get("debug", False)
     log_level = ctx.meta.get("log_level", "INFO").lower()  # Safely handle NoneType by providing a default value
     
@@ -144,6 +517,349 @@ def cli_gladosapi(ctx, host, port, root_path, forwarded_allow_ips, workers):
     server.run()
 
 
+@cli.command(name="router")
+@click.option(
+    "--replica", multiple=True, required=True, show_envvar=True,
+    help="base url of a 'gladosctl restapi' replica (repeat for each replica)",
+)
+@click.option("--host", default="0.0.0.0", show_envvar=True, show_default=True)
+@click.option("--port", default=8123, type=int, show_envvar=True, show_default=True)
+@click.option(
+    "--vnodes", default=100, type=int, show_envvar=True, show_default=True,
+    help="points per replica on the hash ring",
+)
+@click.option(
+    "--load-factor", default=1.25, type=float, show_envvar=True, show_default=True,
+    help="a replica gets at most this times the average number of requests in flight, the rest spill over",
+)
+@click.option("--health-interval", default=5.0, type=float, show_envvar=True, show_default=True)
+@click.option("--timeout", default=60.0, type=float, show_envvar=True, show_default=True)
+@configure_engine
+@update_meta
+@click.pass_context
+def cli_router(ctx, host, port, **kwargs):
+    """route requests to restapi replicas by the hash of the text, so each
+    phrase is rendered and cached on one replica only.
+    """
+    import uvicorn
+
+    log_level = ctx.meta.get("log_level", "INFO").lower()
+    config = uvicorn.Config(
+        "glados_tts.router:create_app",
+        host=host,
+        port=port,
+        log_level=log_level,
+        proxy_headers=True,
+        factory=True,
+    )
+    uvicorn.Server(config).run()
+
+
+@cli.command(name="wyoming")
+@click.option("--host", default="0.0.0.0", show_envvar=True, show_default=True)
+@click.option("--port", default=10200, type=int, show_envvar=True, show_default=True)
+@start_engine
+@update_meta
+@click.pass_context
+def cli_wyoming(ctx, host, port):
+    """run a wyoming protocol server, for home assistant voice pipelines"""
+    import asyncio
+    from glados_tts import wyoming
+
+    try:
+        asyncio.run(wyoming.serve(host, port))
+    except KeyboardInterrupt:
+        pass
+
+
+@cli.command(name="wyoming-say")
+@click.argument("text")
+@click.option("--host", default="localhost", show_default=True)
+@click.option("--port", default=10200, type=int, show_default=True)
+@click.option("-o", "--output", required=True, type=click.Path(dir_okay=False), help="wav file to write")
+@click.option("--voice", default="glados", show_default=True)
+def cli_wyoming_say(text, host, port, output, voice):
+    """synthesize TEXT with a running wyoming server (to check it works)"""
+    import asyncio
+    import numpy
+    from glados_tts import wyoming
+    from glados_tts.encoders import get_encoder
+
+    rate, audio = asyncio.run(wyoming.synthesize(host, port, text, voice))
+    with open(output, 'wb') as f:
+        get_encoder("wav").encode(f, numpy.frombuffer(audio, dtype='<i2'), rate)
+    logger.success(f"wrote {len(audio) // wyoming.SAMPLE_WIDTH / rate:.2f}s of audio to '{output}'")
+
+
+@cli.group(name="lexicon")
+def cli_lexicon():
+    """manage the pronunciation lexicon"""
+
+
+@cli_lexicon.command(name="build")
+@click.argument("corpus", nargs=-1, required=True, type=click.Path(dir_okay=False, exists=True))
+@click.option(
+    "-o", "--output", required=True, type=click.Path(dir_okay=False),
+    help="where to write the lexicon file",
+)
+@click.option(
+    "--overrides", default=None, type=click.Path(dir_okay=False, exists=True),
+    help="json file with {word: phonemes} to bake into the lexicon",
+)
+@click.option("--batch-size", default=5000, show_default=True, help="words per espeak call")
+def cli_lexicon_build(corpus, output, overrides, batch_size):
+    """build a lexicon from the words in CORPUS text files (runs them
+    through espeak once).
+    """
+
+    words = set()
+    for path in corpus:
+        with open(path, 'r') as f:
+            for line in f:
+                text = english_cleaners(line)
+                words.update(w.lower() for is_word, w in split_words(text) if is_word)
+    words = sorted(words)
+    logger.info(f"phonemizing {len(words)} words from {len(corpus)} file(s)")
+
+    entries = {}
+    for i in range(0, len(words), batch_size):
+        batch = words[i:i+batch_size]
+        entries.update(zip(batch, espeak(batch, 'en-us')))
+
+    if overrides is not None:
+        entries.update(Lexicon.from_files(overrides_path=overrides).overrides)
+
+    count = write_lexicon(output, entries)
+    logger.success(f"wrote {count} words to '{output}'")
+
+
+@cli_lexicon.command(name="lookup")
+@click.argument("words", nargs=-1, required=True)
+@configure_engine
+@click.pass_context
+def cli_lexicon_lookup(ctx, words):
+    """look up WORDS in the configured lexicon"""
+
+    lexicon = GLaDOS.get().lexicon or Lexicon()
+    for word in words:
+        click.echo(f"{word}\t{lexicon.get(word)}")
+
+
+@cli.command(name="vocoder-check")
+@click.argument("text")
+@click.option("--chunk-frames", default=32, show_default=True, type=click.IntRange(min=1))
+@click.option("--overlap", default=16, show_default=True, type=click.IntRange(min=0))
+@click.option("--tolerance", default=1e-3, show_default=True, help="max absolute difference (audio in [-1.0, 1.0])")
+@configure_engine
+def cli_vocoder_check(text, chunk_frames, overlap, tolerance):
+    """check that the chunked vocoder matches a full pass for TEXT"""
+
+    diff = GLaDOS.get().check_chunked_vocoder(text, chunk_frames, overlap)
+    if diff > tolerance:
+        logger.error(f"max difference {diff:.6f} is above the tolerance {tolerance}")
+        raise SystemExit(1)
+    logger.success(f"max difference {diff:.6f} is within the tolerance {tolerance}")
+
+
+@cli.command(name="bench")
+@click.argument("texts", nargs=-1)
+@click.option("--repeat", default=10, show_default=True, help="renders of each text")
+@click.option("--audio-format", default="wav", show_default=True, type=click.Choice(GLaDOS.audio_formats))
+@click.option("--sample-rate", default=None, type=int, help="[default: --sample-rate of the server]")
+@start_engine
+def cli_bench(texts, repeat, audio_format, sample_rate):
+    """render TEXTS (uncached) and report the latency, the peak memory and
+    the int16 block allocations per request, with and without the pcm
+    buffer pool.
+    """
+
+    import tracemalloc
+    from glados_tts.utils.buffers import PcmPool
+
+    glados = GLaDOS.get()
+    texts = texts or ("Hello, and welcome to the Aperture Science computer-aided enrichment center.",)
+    glados.load_models()
+
+    def render(text):
+        _, buf = glados.tts_audio_to_memory(text, audio_format, False, sample_rate)
+        buf.release()
+
+    # warm up the models, the encoder and the buffers
+    for text in texts:
+        render(text)
+
+    tracemalloc.start()
+    try:
+        for size in (0, PcmPool().size):
+            glados.pcm_pool = pool = PcmPool(size=size)
+            render(texts[0])
+            allocations = pool.allocations
+            latencies, peaks = [], []
+            for _ in range(repeat):
+                for text in texts:
+                    before, _ = tracemalloc.get_traced_memory()
+                    tracemalloc.reset_peak()
+                    t0 = time.perf_counter()
+                    render(text)
+                    latencies.append(time.perf_counter() - t0)
+                    peaks.append(tracemalloc.get_traced_memory()[1] - before)
+            n = len(latencies)
+            latencies.sort()
+            logger.info(
+                f"pcm pool {'on' if size else 'off'}: {n} requests, "
+                f"latency mean {sum(latencies) / n * 1000:.1f} ms, p95 {latencies[int(0.95 * (n - 1))] * 1000:.1f} ms, "
+                f"peak memory {sum(peaks) / n / 1024:.0f} KiB/request, "
+                f"int16 allocations {(pool.allocations - allocations) / n:.2f}/request")
+    finally:
+        tracemalloc.stop()
+        glados.pcm_pool = PcmPool()
+
+
+@cli.group(name="onnx")
+def cli_onnx():
+    """export the models to ONNX, for --backend onnx"""
+
+
+@cli_onnx.command(name="export")
+@click.option(
+    "--output-dir", default=None, type=click.Path(file_okay=False),
+    help="where glados.onnx and vocoder-gpu.onnx are written [default: the packaged models dir]",
+)
+@click.option("--opset", default=17, show_default=True)
+@click.option("--text", default="Hello, and welcome to the Aperture Science computer-aided enrichment center.",
+              show_default=True, help="sample text to trace the models with")
+@configure_engine
+def cli_onnx_export(output_dir, opset, text):
+    """export the TorchScript models (--acoustic-model and --vocoder-model)
+    to ONNX, with dynamic sequence lengths. the vocoders of the builtin
+    voices are exported too, if they are in the packaged models dir.
+    """
+
+    from glados_tts.modelpair import export_onnx, TorchScriptModels
+    from glados_tts.voices import BUILTIN_VOICES
+    from glados_tts.utils import tools
+
+    glados = GLaDOS.get()
+    acoustic_model, vocoder_model = glados.acoustic_model, glados.vocoder_model
+    if glados.backend is not TorchScriptModels:
+        raise click.UsageError("export needs the TorchScript models, run it with --backend torchscript")
+    output_dir = output_dir or glados.models_dir
+    os.makedirs(output_dir, exist_ok=True)
+
+    vocoders = [os.path.join(glados.models_dir, v["vocoder_model"] + TorchScriptModels.extension)
+                for v in BUILTIN_VOICES.values() if "vocoder_model" in v]
+    vocoders = [v for v in vocoders if os.path.exists(v)]
+
+    tokens = tools.prepare_tokens(text, glados.lexicon)
+    paths = export_onnx(acoustic_model, vocoder_model, output_dir, tokens, opset, vocoders)
+    logger.success(f"exported: {', '.join(paths)}")
+
+
+@cli_onnx.command(name="verify")
+@click.argument("texts", nargs=-1, required=True)
+@click.option("--acoustic-onnx", default=None, type=click.Path(dir_okay=False, exists=True),
+              help="[default: glados.onnx in the packaged models dir]")
+@click.option("--vocoder-onnx", default=None, type=click.Path(dir_okay=False, exists=True),
+              help="[default: vocoder-gpu.onnx in the packaged models dir]")
+@click.option("--tolerance", default=1e-3, show_default=True, help="max absolute difference of mel and audio")
+@configure_engine
+def cli_onnx_verify(texts, acoustic_onnx, vocoder_onnx, tolerance):
+    """check that the ONNX models match the TorchScript models for TEXTS"""
+
+    from glados_tts.modelpair import TorchScriptModels, OnnxModels, compare_backends
+    from glados_tts.utils import tools
+
+    glados = GLaDOS.get()
+    if glados.backend is not TorchScriptModels:
+        raise click.UsageError("verify compares against the TorchScript models, run it with --backend torchscript")
+    default_onnx = (os.path.join(glados.models_dir, f) for f in OnnxModels.default_models)
+    acoustic_onnx, vocoder_onnx = (a or b for a, b in zip((acoustic_onnx, vocoder_onnx), default_onnx))
+
+    reference = TorchScriptModels(glados.acoustic_model, glados.vocoder_model, 'cpu').load()
+    onnx = OnnxModels(acoustic_onnx, vocoder_onnx, 'cpu').load()
+
+    failed = False
+    for text in texts:
+        mel_diff, audio_diff = compare_backends(reference, onnx, tools.prepare_tokens(text, glados.lexicon))
+        ok = max(mel_diff, audio_diff) <= tolerance
+        failed = failed or not ok
+        log = logger.info if ok else logger.error
+        log(f"mel: {mel_diff:.6f}, audio: {audio_diff:.6f}: '{text}'")
+    if failed:
+        logger.error(f"the onnx models differ by more than the tolerance {tolerance}")
+        raise SystemExit(1)
+    logger.success(f"the onnx models match within the tolerance {tolerance}")
+
+
+@cli.group(name="cache")
+def cli_cache():
+    """manage the audio cache"""
+
+
+@cli_cache.command(name="migrate")
+@click.argument("src")
+@click.argument("dst")
+@click.option("--delete/--no-delete", default=False, help="delete files from SRC after copying them")
+def cli_cache_migrate(src, dst, delete):
+    """copy cached audio from the SRC storage backend to DST (same syntax
+    as --storage, a plain path is a flat directory).
+    """
+
+    src_storage = storage_from_url(src)
+    dst_storage = storage_from_url(dst)
+    logger.info(f"migrating cache from '{src_storage}' to '{dst_storage}'")
+    copied = migrate(src_storage, dst_storage, delete=delete)
+    logger.success(f"copied {copied} files to '{dst_storage}'")
+
+
+@cli_cache.command(name="evict")
+@click.option("--max-size-mb", required=True, type=float, help="evict entries until the cache is at most this big")
+@click.option("--policy", type=click.Choice(["lru", "lfu"]), default="lru", show_default=True)
+@start_engine
+def cli_cache_evict(max_size_mb, policy):
+    """evict cached audio (that is in the cache index) until the cache
+    fits in --max-size-mb.
+    """
+
+    glados = GLaDOS.get()
+    if glados.index is None:
+        raise click.UsageError("the cache index is not enabled")
+
+    max_size = int(max_size_mb * 1024 * 1024)
+    total_size = glados.index.stats()["total_size"]
+    evicted = 0
+    for entry in glados.index.coldest(policy):
+        if total_size <= max_size:
+            break
+        glados.storage.delete(entry["fname"])
+        glados.index.remove(entry["fname"])
+        total_size -= entry["size"]
+        evicted += 1
+        logger.debug(f"evicted: '{entry['fname']}'")
+    logger.success(f"evicted {evicted} entries, cache size is now {total_size / 1024 / 1024:.1f} MB")
+
+
+@cli_cache.command(name="warm")
+@click.option("--top", default=100, show_default=True, help="number of hottest entries to make sure are cached")
+@start_engine
+def cli_cache_warm(top):
+    """re-render the hottest entries from the cache index that are missing
+    from the storage (after eviction or a migration, for example).
+    """
+
+    glados = GLaDOS.get()
+    if glados.index is None:
+        raise click.UsageError("the cache index is not enabled")
+
+    rendered = 0
+    for entry in glados.index.hottest(top):
+        if not glados.storage.exists(entry["fname"]):
+            glados.tts(
+                entry["text"], audio_format=entry["audio_format"], sample_rate=entry["sample_rate"], priority="bulk",
+                voice=entry["voice"])
+            rendered += 1
+    logger.success(f"rendered {rendered} missing entries")
+
 
 def main():
     # load config and stuff here?
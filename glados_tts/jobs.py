@@ -0,0 +1,277 @@
+import os
+import json
+import uuid
+import sqlite3
+import threading
+import urllib.request
+from urllib.parse import urlparse
+from time import time, sleep
+
+from loguru import logger
+
+from glados_tts.admission import AdmissionError
+from glados_tts.utils.segment import estimate_tokens
+
+
+# jobs that haven't finished, and count against the queue size
+PENDING = ("queued", "running")
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # a webhook host that is allowed shouldn't be able to send the post
+    # on to one that isn't
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+_webhook_opener = urllib.request.build_opener(_NoRedirect)
+
+
+class JobQueue:
+    """synthesis jobs that are queued in a sqlite database, so they
+    survive restarts, and rendered by 'workers' background threads. at
+    most 'max_pending' jobs can be queued or running. jobs for text that
+    is already in the audio cache are done right away. when a job is
+    done (or has failed), its status is posted to its webhook, if it has
+    one. finished jobs are kept for 'retention' seconds.
+
+    """
+
+    def __init__(self, glados, path, max_pending=1000, workers=1, retention=7 * 24 * 3600,
+                 webhook_timeout=10.0, webhook_retries=3):
+        self.glados = glados
+        self.path = path
+        self.max_pending = max_pending
+        self.workers = workers
+        self.retention = retention
+        self.webhook_timeout = webhook_timeout
+        self.webhook_retries = webhook_retries
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._threads = []
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    audio_format TEXT NOT NULL,
+                    sample_rate INTEGER,
+                    use_cache INTEGER NOT NULL,
+                    priority TEXT NOT NULL,
+                    webhook TEXT,
+                    audio_filename TEXT,
+                    from_cache INTEGER,
+                    error TEXT,
+                    estimate REAL,
+                    created REAL NOT NULL,
+                    started REAL,
+                    finished REAL,
+                    webhook_status TEXT,
+                    voice TEXT
+                )""")
+            columns = [r[1] for r in conn.execute("PRAGMA table_info(jobs)")]
+            if "voice" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN voice TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, created)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished)")
+            # jobs that were running when the server stopped are run again
+            requeued = conn.execute("UPDATE jobs SET state = 'queued', started = NULL WHERE state = 'running'").rowcount
+        if requeued:
+            logger.info(f"jobs: requeued {requeued} job(s) that were interrupted")
+
+    def _execute(self, sql, params=()):
+        with self._lock, self._conn as conn:
+            cursor = conn.execute(sql, params)
+            return cursor.fetchall(), cursor.rowcount
+
+    def get(self, job_id):
+        rows, _ = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        if not rows:
+            return None
+        return self._status(dict(rows[0]))
+
+    def _status(self, job):
+        job["use_cache"] = bool(job["use_cache"])
+        if job["from_cache"] is not None:
+            job["from_cache"] = bool(job["from_cache"])
+        job["progress"] = self._progress(job)
+        job["position"] = None
+        if job["state"] == "queued":
+            rows, _ = self._execute(
+                "SELECT COUNT(*) FROM jobs WHERE state = 'queued' AND created < ?", (job["created"],))
+            job["position"] = rows[0][0]
+        return job
+
+    @staticmethod
+    def _progress(job):
+        """the fraction of the job that is done, for running jobs estimated
+        from the time it has been running and the time it was estimated
+        to take.
+
+        """
+
+        if job["state"] in ("done", "failed"):
+            return 1.0
+        if job["state"] == "running" and job["estimate"]:
+            return min(0.99, (time() - job["started"]) / job["estimate"])
+        return 0.0
+
+    def pending(self):
+        rows, _ = self._execute(
+            f"SELECT COUNT(*) FROM jobs WHERE state IN ({', '.join('?' * len(PENDING))})", PENDING)
+        return rows[0][0]
+
+    def submit(self, text, audio_format=None, sample_rate=None, use_cache=True, priority="bulk", webhook=None,
+               voice=None):
+        """queue a job, returns its status. the input is checked right away
+        (raising GLaDOSInputError), and AdmissionError (503) is raised if
+        the queue is full.
+
+        """
+
+        glados = self.glados
+        audio_format = glados._check_input(text, audio_format, sample_rate, priority)
+        voice = glados._check_voice(voice)
+        now = time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "state": "queued",
+            "text": text,
+            "audio_format": audio_format,
+            "sample_rate": sample_rate,
+            "use_cache": use_cache,
+            "priority": priority,
+            "webhook": webhook,
+            "voice": voice,
+            "created": now,
+        }
+
+        if use_cache and glados.is_cached(text, audio_format, sample_rate, voice):
+            # nothing to render, the job is done before it is queued
+            output_rate = glados.get_encoder(audio_format).output_rate(sample_rate or glados.sample_rate)
+            job.update(
+                state="done", audio_filename=glados._make_fname(text, audio_format, output_rate, voice),
+                from_cache=True, started=now, finished=now)
+        elif self.pending() >= self.max_pending:
+            raise AdmissionError(503, f"the job queue is full ({self.max_pending} jobs)", retry_after=60)
+
+        self._execute(
+            f"INSERT INTO jobs ({', '.join(job)}) VALUES ({', '.join('?' * len(job))})", tuple(job.values()))
+        logger.debug(f"jobs: {job['state']}: {job['id']}")
+
+        if job["state"] == "done":
+            threading.Thread(target=self._notify, args=(self.get(job["id"]),), daemon=True).start()
+        else:
+            with self._wakeup:
+                self._wakeup.notify()
+        return self.get(job["id"])
+
+    def _claim(self):
+        """take the oldest queued job (of the most urgent priority class),
+        returns None if there are none. several server processes can
+        share the database, the update only succeeds for one of them.
+
+        """
+
+        while True:
+            rows, _ = self._execute("""
+                SELECT * FROM jobs WHERE state = 'queued'
+                ORDER BY CASE priority WHEN 'interactive' THEN 0 WHEN 'normal' THEN 1 ELSE 2 END, created
+                LIMIT 1""")
+            if not rows:
+                return None
+            job = dict(rows[0])
+            estimate = self.glados.estimate_latency(estimate_tokens(job["text"]), job["priority"])
+            _, claimed = self._execute(
+                "UPDATE jobs SET state = 'running', started = ?, estimate = ? WHERE id = ? AND state = 'queued'",
+                (time(), estimate, job["id"]))
+            if claimed:
+                return job
+
+    def _run(self, job):
+        try:
+            g = self.glados.tts(
+                job["text"], audio_format=job["audio_format"], use_cache=bool(job["use_cache"]),
+                sample_rate=job["sample_rate"], priority=job["priority"], voice=job["voice"])
+        except Exception as e:
+            logger.error(f"jobs: failed: {job['id']}: {e}")
+            self._execute(
+                "UPDATE jobs SET state = 'failed', error = ?, finished = ? WHERE id = ?",
+                (str(e), time(), job["id"]))
+        else:
+            self._execute(
+                "UPDATE jobs SET state = 'done', audio_filename = ?, from_cache = ?, finished = ? WHERE id = ?",
+                (g.audio_filename, g.from_cache, time(), job["id"]))
+            logger.debug(f"jobs: done: {job['id']}")
+        self._notify(self.get(job["id"]))
+
+    def _notify(self, job):
+        """post the status of a finished job to its webhook, retrying with
+        backoff if that fails.
+
+        """
+
+        if not job["webhook"]:
+            return
+        if urlparse(job["webhook"]).scheme not in ("http", "https"):
+            # the api only accepts http(s) urls, but the database could
+            # have been written by anything
+            logger.warning(f"jobs: not calling webhook for {job['id']}, it isn't an http(s) url")
+            self._execute("UPDATE jobs SET webhook_status = ? WHERE id = ?", ("failed: not an http(s) url", job["id"]))
+            return
+        body = json.dumps(job).encode()
+        request = urllib.request.Request(
+            job["webhook"], data=body, method="POST", headers={"Content-Type": "application/json"})
+        status = None
+        for attempt in range(self.webhook_retries + 1):
+            if attempt:
+                sleep(2 ** attempt)
+            try:
+                with _webhook_opener.open(request, timeout=self.webhook_timeout) as resp:
+                    status = str(resp.status)
+                break
+            except OSError as e:
+                status = f"failed: {e}"
+                logger.warning(f"jobs: webhook for {job['id']} failed (attempt {attempt + 1}): {e}")
+        self._execute("UPDATE jobs SET webhook_status = ? WHERE id = ?", (status, job["id"]))
+
+    def _expire(self):
+        _, deleted = self._execute("DELETE FROM jobs WHERE finished < ?", (time() - self.retention,))
+        if deleted:
+            logger.debug(f"jobs: removed {deleted} finished job(s)")
+
+    def _worker(self):
+        last_expire = 0
+        while True:
+            if time() - last_expire > 3600:
+                self._expire()
+                last_expire = time()
+
+            job = self._claim()
+            if job is None:
+                # other processes sharing the database don't wake us up
+                with self._wakeup:
+                    self._wakeup.wait(timeout=5.0)
+                continue
+            self._run(job)
+
+    def start(self):
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"glados-jobs-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        logger.info(f"jobs: {self.workers} worker(s), {self.pending()} job(s) pending")
+
+    def stats(self):
+        rows, _ = self._execute("SELECT state, COUNT(*) FROM jobs GROUP BY state")
+        counts = {state: 0 for state in ("queued", "running", "done", "failed")}
+        counts.update({r[0]: r[1] for r in rows})
+        return counts
@@ -0,0 +1,315 @@
+import os
+import hashlib
+import threading
+
+import numpy
+from loguru import logger
+
+
+def fingerprint(*paths):
+    """a short hash of the contents of the model files"""
+    h = hashlib.blake2b(digest_size=8)
+    for path in paths:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+class ModelPair:
+    """an acoustic model (Forward Tacotron) and a vocoder (HiFiGAN) that
+    are used together. requests hold on to the pair they started with
+    (see acquire()), so that a pair can be swapped out while requests are
+    still in flight on it.
+
+    subclasses are the inference backends, that run the models with
+    mel() and audio().
+
+    """
+
+    backend = None
+    # the model files in the package's models dir
+    default_models = (None, None)
+    # the extension of the backend's model files
+    extension = None
+
+    def __init__(self, acoustic_path, vocoder_path, device, **options):
+        self.acoustic_path = acoustic_path
+        self.vocoder_path = vocoder_path
+        self.device = device
+        self.options = options
+        # the name of the voice, None for the default voice
+        self.voice = None
+        self.acoustic = None
+        self.vocoder = None
+        self.fingerprint = None
+
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._drained = threading.Event()
+        self._drained.set()
+
+    @classmethod
+    def select_device(cls):
+        return 'cpu'
+
+    def load(self):
+        self.fingerprint = fingerprint(self.acoustic_path, self.vocoder_path)
+
+        self._load()
+        logger.debug(
+            f"loaded models: '{self.acoustic_path}', '{self.vocoder_path}' ({self.backend}, {self.fingerprint})")
+        return self
+
+    def _load(self):
+        raise NotImplementedError
+
+    def mel(self, tokens):
+        """token array (shaped (1, n), int32) -> mel spectrogram, in
+        whatever type the backend uses. mel[..., a:b] selects frames.
+
+        """
+        raise NotImplementedError
+
+    def audio(self, mel):
+        """mel spectrogram -> float audio as a 1-d numpy array, that the
+        caller owns (and may overwrite)
+        """
+        raise NotImplementedError
+
+    def nbytes(self):
+        """memory used by the weights of both models"""
+        raise NotImplementedError
+
+    def acquire(self):
+        """mark a request as in flight on this pair"""
+        with self._lock:
+            self.in_flight += 1
+            self._drained.clear()
+        return self
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+            if self.in_flight == 0:
+                self._drained.set()
+
+    def wait_drained(self, timeout=None):
+        return self._drained.wait(timeout)
+
+    def unload(self):
+        self.acoustic = None
+        self.vocoder = None
+
+
+class TorchScriptModels(ModelPair):
+    """the default backend, the TorchScript models that are shipped in the
+    package.
+
+    """
+
+    backend = "torchscript"
+    default_models = ("glados.pt", "vocoder-gpu.pt")
+    extension = ".pt"
+
+    @classmethod
+    def select_device(cls):
+        import torch
+        if torch.is_vulkan_available():
+            return 'vulkan'
+        elif torch.cuda.is_available():
+            return 'cuda'
+        else:
+            return 'cpu'
+
+    def _load(self):
+        import torch
+        self.acoustic = torch.jit.load(self.acoustic_path)
+        self.vocoder = torch.jit.load(self.vocoder_path, map_location=self.device)
+
+    def mel(self, tokens):
+        import torch
+        with torch.inference_mode():
+            tts_output = self.acoustic.generate_jit(torch.from_numpy(tokens).to(self.device))
+            return tts_output['mel_post'].to(self.device)
+
+    def audio(self, mel):
+        import torch
+        with torch.inference_mode():
+            return self.vocoder(mel).squeeze().cpu().numpy()
+
+    def nbytes(self):
+        total = 0
+        for model in (self.acoustic, self.vocoder):
+            if model is None:
+                continue
+            for t in list(model.parameters()) + list(model.buffers()):
+                total += t.numel() * t.element_size()
+        return total
+
+    def unload(self):
+        super().unload()
+        if self.device == 'cuda':
+            import torch
+            torch.cuda.empty_cache()
+
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": "ORT_DISABLE_ALL",
+    "basic": "ORT_ENABLE_BASIC",
+    "extended": "ORT_ENABLE_EXTENDED",
+    "all": "ORT_ENABLE_ALL",
+}
+
+
+class OnnxModels(ModelPair):
+    """ONNX Runtime on the cpu, for the models exported with 'gladosctl
+    onnx export'. doesn't need torch at all. the options are passed on
+    to the onnxruntime session: 'intra_op_threads', 'inter_op_threads',
+    'graph_optimization' (disable, basic, extended or all) and
+    'execution_mode' (sequential or parallel).
+
+    """
+
+    backend = "onnx"
+    default_models = ("glados.onnx", "vocoder-gpu.onnx")
+    extension = ".onnx"
+
+    def _session_options(self):
+        import onnxruntime
+
+        so = onnxruntime.SessionOptions()
+        if self.options.get("intra_op_threads"):
+            so.intra_op_num_threads = self.options["intra_op_threads"]
+        if self.options.get("inter_op_threads"):
+            so.inter_op_num_threads = self.options["inter_op_threads"]
+        level = self.options.get("graph_optimization") or "all"
+        so.graph_optimization_level = getattr(onnxruntime.GraphOptimizationLevel, GRAPH_OPTIMIZATION_LEVELS[level])
+        if self.options.get("execution_mode") == "parallel":
+            so.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL
+        else:
+            so.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        return so
+
+    def _load(self):
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise RuntimeError("the onnx backend needs 'onnxruntime' installed") from e
+
+        so = self._session_options()
+        providers = ["CPUExecutionProvider"]
+        self.acoustic = onnxruntime.InferenceSession(self.acoustic_path, so, providers=providers)
+        self.vocoder = onnxruntime.InferenceSession(self.vocoder_path, so, providers=providers)
+        self._acoustic_input = self.acoustic.get_inputs()[0].name
+        self._vocoder_input = self.vocoder.get_inputs()[0].name
+
+    def mel(self, tokens):
+        return self.acoustic.run(None, {self._acoustic_input: tokens})[0]
+
+    def audio(self, mel):
+        return numpy.squeeze(self.vocoder.run(None, {self._vocoder_input: mel})[0])
+
+    def nbytes(self):
+        # the weights make up nearly all of the file
+        return sum(os.path.getsize(p) for p in (self.acoustic_path, self.vocoder_path))
+
+
+BACKENDS = {cls.backend: cls for cls in (TorchScriptModels, OnnxModels)}
+
+
+def get_backend(name):
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"unknown inference backend: '{name}', supported: {list(BACKENDS)}")
+
+
+def export_onnx(acoustic_path, vocoder_path, output_dir, sample_tokens, opset=17, vocoders=()):
+    """export the TorchScript models to ONNX, with the sequence axes
+    (tokens and mel frames) dynamic. 'sample_tokens' is a token array
+    to trace the models with. 'vocoders' are more TorchScript vocoders
+    (of the builtin voices) that are exported next to the default one,
+    with the same name. returns the paths of the exported models.
+
+    """
+
+    import inspect
+    import torch
+
+    options = {"opset_version": opset}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        # newer torch versions default to the dynamo exporter, the models
+        # are TorchScript and are exported with the TorchScript exporter
+        options["dynamo"] = False
+
+    class Acoustic(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, tokens):
+            return self.model.generate_jit(tokens)['mel_post']
+
+    torchscript = TorchScriptModels(acoustic_path, vocoder_path, 'cpu').load()
+    acoustic_onnx, vocoder_onnx = (os.path.join(output_dir, f) for f in OnnxModels.default_models)
+    tokens = torch.from_numpy(sample_tokens)
+
+    with torch.no_grad():
+        mel = torchscript.acoustic.generate_jit(tokens)['mel_post']
+        torch.onnx.export(
+            Acoustic(torchscript.acoustic), (tokens,), acoustic_onnx,
+            input_names=["tokens"], output_names=["mel"],
+            dynamic_axes={"tokens": {1: "tokens"}, "mel": {2: "frames"}},
+            **options,
+        )
+        logger.info(f"exported the acoustic model to '{acoustic_onnx}'")
+
+        exported = [acoustic_onnx]
+        vocoders = [(torchscript.vocoder, vocoder_onnx)] + [
+            (torch.jit.load(path, map_location='cpu'),
+             os.path.join(output_dir, os.path.splitext(os.path.basename(path))[0] + OnnxModels.extension))
+            for path in vocoders]
+        for vocoder, path in vocoders:
+            torch.onnx.export(
+                vocoder, (mel,), path,
+                input_names=["mel"], output_names=["audio"],
+                dynamic_axes={"mel": {2: "frames"}, "audio": {2: "samples"}},
+                **options,
+            )
+            logger.info(f"exported the vocoder to '{path}'")
+            exported.append(path)
+
+    return tuple(exported)
+
+
+def compare_backends(reference, other, tokens):
+    """run 'tokens' through two loaded model pairs, returns the maximum
+    absolute difference of the mel spectrograms, and of the audio when
+    both vocoders get the same (reference) mel.
+
+    """
+
+    mel = reference.mel(tokens)
+    ref_mel = numpy.asarray(_to_numpy(mel))
+    other_mel = numpy.asarray(_to_numpy(other.mel(tokens)))
+    if ref_mel.shape != other_mel.shape:
+        raise ValueError(f"mel spectrograms differ in shape: {ref_mel.shape} and {other_mel.shape}")
+
+    ref_audio = reference.audio(mel)
+    other_audio = other.audio(_from_numpy(other, ref_mel))
+    if ref_audio.shape != other_audio.shape:
+        raise ValueError(f"audio differs in length: {ref_audio.shape} and {other_audio.shape}")
+
+    return float(numpy.abs(ref_mel - other_mel).max()), float(numpy.abs(ref_audio - other_audio).max())
+
+
+def _to_numpy(mel):
+    return mel.cpu().numpy() if hasattr(mel, "cpu") else mel
+
+
+def _from_numpy(models, mel):
+    if isinstance(models, TorchScriptModels):
+        import torch
+        return torch.from_numpy(mel).to(models.device)
+    return mel
@@ -1,10 +1,14 @@
-import os.path
 import mimetypes
 
-from typing import Literal
+from typing import Literal, Dict, Optional, List
 from datetime import datetime
 
-from pydantic import BaseModel, Field, root_validator
+from pydantic import AnyHttpUrl, BaseModel, Field, root_validator
+
+from glados_tts.encoders import guess_mimetype
+
+
+Priority = Literal['interactive', 'normal', 'bulk']
 
 
 class GLaDOSRequest(BaseModel):
@@ -14,6 +18,47 @@ class GLaDOSRequest(BaseModel):
         description="Allows retrieving a previously generated audio file for the same text"
     )
     audio_format: str = Field("wav", description="Format that the resulting audio will be encoded in")
+    sample_rate: Optional[int] = Field(
+        None,
+        description="Sample rate (Hz) of the resulting audio, resampled from the native 22050 Hz if needed"
+    )
+    voice: Optional[str] = Field(None, description="the voice to speak with (see `/voices`), default: `glados`")
+
+
+class JobRequest(GLaDOSRequest):
+    webhook: Optional[AnyHttpUrl] = Field(
+        None,
+        description="http(s) url that the job status is posted to (as json) when the job is done or has failed, "
+        "needs an api key or a host that is allowed with `--webhook-host`"
+    )
+
+
+class JobStatus(BaseModel):
+    id: str = Field(description="the job id")
+    state: Literal['queued', 'running', 'done', 'failed'] = Field(description="state of the job")
+    progress: float = Field(description="fraction of the job that is done (estimated while running)")
+    position: Optional[int] = Field(None, description="jobs ahead of this one in the queue (while queued)")
+    text: str
+    audio_format: str
+    sample_rate: Optional[int] = None
+    use_cache: bool
+    priority: Priority
+    voice: Optional[str] = Field(None, description="the voice, null for the default voice")
+    webhook: Optional[str] = None
+    audio_filename: Optional[str] = Field(None, description="the audio file (at `/audio/`) once the job is done")
+    from_cache: Optional[bool] = Field(None, description="whether the audio was already in the cache")
+    error: Optional[str] = Field(None, description="why the job failed")
+    created: datetime
+    started: Optional[datetime] = None
+    finished: Optional[datetime] = None
+    webhook_status: Optional[str] = Field(None, description="http status of the webhook call, or the error")
+
+
+class JobStats(BaseModel):
+    queued: int
+    running: int
+    done: int
+    failed: int
 
 
 mary_compat = "provided for compatability, has no meaning"
@@ -35,16 +80,20 @@ class GLaDOSResponse(BaseModel):
     audio_format: str = Field(description="The format the audio is encoded with")
     audio_filename: str = Field(description="the filename of the TTS audio file")
     audio_timestamp: datetime = Field(description="the timestamp for when the file was created")
+    sample_rate: int = Field(22050, description="The sample rate (Hz) of the audio")
     audio_mimetype: str = Field(
         mimetypes.types_map['.wav'],
         description="The MIME type of the file"
     )
+    degraded: bool = Field(
+        False,
+        description="whether the audio was rendered with a faster, lower quality vocoder because of high load"
+    )
 
     @root_validator
     def get_mimetype(cls, values):
         audio_filename = values.get("audio_filename")
-        extension = os.path.splitext(audio_filename)[1]
-        values['audio_mimetype'] = mimetypes.types_map.get(extension)
+        values['audio_mimetype'] = guess_mimetype(audio_filename, values.get("sample_rate"))
         return values
 
 
@@ -52,3 +101,161 @@ class HealthResponse(BaseModel):
     status: Literal['healthy', 'unhealthy'] = Field(
         description="GLaDOS API status"
     )
+    models_loaded: bool = Field(
+        False,
+        description="whether the models are loaded and warmed up, requests wait for that"
+    )
+
+
+class StageStats(BaseModel):
+    queue_depth: int = Field(description="items waiting in the stage's queue")
+    queue_size: int = Field(description="maximum number of items in the stage's queue")
+    busy: int = Field(description="worker threads currently processing an item")
+    threads: int = Field(description="number of worker threads for the stage")
+
+
+class ClassStats(BaseModel):
+    waiting: int = Field(description="requests of this class waiting for a synthesis slot")
+    requests: int = Field(description="requests of this class that got a synthesis slot")
+    wait_mean: float = Field(description="mean seconds waited for a slot (recent requests)")
+    wait_p50: float = Field(description="median seconds waited for a slot (recent requests)")
+    wait_p95: float = Field(description="95th percentile of seconds waited for a slot (recent requests)")
+    wait_max: float = Field(description="longest wait for a slot in seconds (recent requests)")
+
+
+class SchedulerStats(BaseModel):
+    slots: int = Field(description="number of requests that are synthesized at the same time")
+    busy: int = Field(description="slots in use")
+    classes: Dict[Priority, ClassStats] = Field(description="queue-wait stats per priority class")
+
+
+class SentenceCacheStats(BaseModel):
+    hits: int = Field(description="sentences that were found in the sentence cache")
+    misses: int = Field(description="sentences that had to be synthesized")
+    hit_ratio: float = Field(description="hits / (hits + misses)")
+    memory_entries: int = Field(description="sentences kept in memory")
+    memory_bytes: int = Field(description="size of the sentences kept in memory")
+
+
+class VoiceInfo(BaseModel):
+    name: str
+    description: str
+    default: bool = Field(description="whether this is the default voice")
+    loaded: bool = Field(description="whether the models for the voice are in memory")
+    model_bytes: Optional[int] = Field(None, description="memory used by the models (if loaded)")
+
+
+class VoiceStats(BaseModel):
+    memory_budget: int = Field(description="memory budget (bytes) for all loaded models, 0 for no limit")
+    memory_used: int = Field(description="memory used by the loaded models (bytes)")
+    resident: List[str] = Field(description="loaded voices (besides the default), least recently used first")
+    loads: int = Field(description="times a voice was loaded")
+    evictions: int = Field(description="times a voice was unloaded to stay within the budget")
+
+
+class DegradeStats(BaseModel):
+    active: bool = Field(description="whether new renders currently use the faster voice")
+    p95: float = Field(description="95th percentile of the latency of recent requests (seconds)")
+    queue_wait: float = Field(description="estimated wait for a synthesis slot (seconds)")
+    switches: int = Field(description="times the quality was switched down or back up")
+    degraded_requests: int = Field(description="requests that were rendered with the faster voice")
+
+
+class CacheKeyStats(BaseModel):
+    memo_entries: int = Field(description="texts with a memoized canonical cache key")
+    memo_hits: int = Field(description="cache keys that were found in the memo")
+    memo_misses: int = Field(description="cache keys that needed the text frontend")
+    memo_hit_ratio: float = Field(description="memo_hits / (memo_hits + memo_misses)")
+
+
+class StatsResponse(BaseModel):
+    pipeline: Optional[Dict[str, StageStats]] = Field(
+        None,
+        description="per-stage stats for the synthesis pipeline (if enabled)"
+    )
+    scheduler: Optional[SchedulerStats] = Field(
+        None,
+        description="stats for the request scheduler (if enabled)"
+    )
+    sentence_cache: Optional[SentenceCacheStats] = Field(
+        None,
+        description="stats for the sentence cache (if enabled)"
+    )
+    degrade: Optional[DegradeStats] = Field(
+        None,
+        description="stats for adaptive degradation under load (if enabled)"
+    )
+    voices: Optional[VoiceStats] = Field(
+        None,
+        description="stats for loading and unloading voices (if more than one is configured)"
+    )
+    cache_keys: Optional[CacheKeyStats] = Field(
+        None,
+        description="stats for the canonical cache key memo (if enabled)"
+    )
+    jobs: Optional[JobStats] = Field(
+        None,
+        description="jobs in the job queue by state (if enabled)"
+    )
+
+
+class CacheEntry(BaseModel):
+    fname: str = Field(description="the filename of the cached audio file")
+    text: str = Field(description="the text that was synthesized")
+    audio_format: str = Field(description="the format the audio is encoded with")
+    sample_rate: int = Field(description="the sample rate (Hz) of the audio")
+    size: int = Field(description="size of the audio file in bytes")
+    duration: float = Field(description="duration of the audio in seconds")
+    synthesis_time: float = Field(description="seconds it took to synthesize and encode the audio")
+    hits: int = Field(description="number of requests that were served from the cache")
+    renders: int = Field(description="number of times the audio was synthesized")
+    created: datetime = Field(description="when the audio was last synthesized")
+    last_access: datetime = Field(description="when the audio was last requested")
+    voice: Optional[str] = Field(None, description="the voice, null for the default voice")
+
+
+class CacheListing(BaseModel):
+    total: int = Field(description="total number of entries in the cache index")
+    offset: int
+    limit: int
+    entries: List[CacheEntry]
+
+
+class CacheStats(BaseModel):
+    entries: int = Field(description="number of entries in the cache index")
+    total_size: int = Field(description="total size of the cached audio in bytes")
+    total_duration: float = Field(description="total duration of the cached audio in seconds")
+    hits: int = Field(description="requests served from the cache")
+    renders: int = Field(description="requests that were synthesized")
+    hit_ratio: float = Field(description="hits / (hits + renders)")
+    mean_synthesis_time: float = Field(description="mean seconds to synthesize an entry")
+
+
+class ReloadRequest(BaseModel):
+    acoustic_model: Optional[str] = Field(
+        None,
+        description="path to the new acoustic model (TorchScript), default: reload the current one"
+    )
+    vocoder_model: Optional[str] = Field(
+        None,
+        description="path to the new vocoder model (TorchScript), default: reload the current one"
+    )
+
+
+class ReloadStatus(BaseModel):
+    state: Literal['idle', 'loading', 'draining', 'done', 'failed'] = Field(
+        description="state of the last (or current) model reload"
+    )
+    acoustic_model: Optional[str] = None
+    vocoder_model: Optional[str] = None
+    fingerprint: Optional[str] = Field(None, description="fingerprint of the new model files")
+    old_fingerprint: Optional[str] = Field(None, description="fingerprint of the model files that were swapped out")
+    in_flight: Optional[int] = Field(None, description="requests that were running on the old models at the swap")
+    drained: Optional[bool] = Field(None, description="whether the in-flight requests finished within the timeout")
+    rss_before: Optional[int] = Field(None, description="process memory (bytes) before loading the new models")
+    rss_loaded: Optional[int] = Field(None, description="process memory (bytes) with both model pairs loaded")
+    rss_after: Optional[int] = Field(None, description="process memory (bytes) after dropping the old models")
+    old_model_bytes: Optional[int] = Field(None, description="size of the parameters of the old models")
+    new_model_bytes: Optional[int] = Field(None, description="size of the parameters of the new models")
+    seconds: Optional[float] = Field(None, description="how long the reload took")
+    error: Optional[str] = None
@@ -1,17 +1,18 @@
 import os
-from pkg_resources import resource_filename
 
 from fastapi import APIRouter, Request
 from fastapi.responses import HTMLResponse, FileResponse
 from fastapi.templating import Jinja2Templates
 
+_here = os.path.dirname(__file__)
+
 
 def create_docs_router(openapi_url):
     router = APIRouter()
-    templates = Jinja2Templates(directory=resource_filename(__name__, "jinja"))
+    templates = Jinja2Templates(directory=os.path.join(_here, "jinja"))
 
     async def _template_doc(item: str, request: Request):
-        t = Jinja2Templates(directory=resource_filename(__name__, "jinja"))
+        t = Jinja2Templates(directory=os.path.join(_here, "jinja"))
         return t.TemplateResponse(f"{item}.j2", {
             "request": request,
             "openapi_url": request.url_for('openapi').path, #openapi_url,
@@ -27,7 +28,7 @@ def create_docs_router(openapi_url):
     @router.get("/static/{filename}", include_in_schema=False)
     async def static_file(filename: str) -> FileResponse:
         return FileResponse(
-            resource_filename(__name__,  os.path.join("static", filename)),
+            os.path.join(_here, "static", filename),
             filename=filename
         )
 
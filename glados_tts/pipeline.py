@@ -0,0 +1,127 @@
+import queue
+import threading
+from concurrent.futures import Future
+
+from loguru import logger
+
+
+class Stage:
+    """a pool of worker threads that take items off a bounded queue, run
+    'func' on them and hand the result to the next stage (or resolve
+    the request's future if this is the last stage).
+
+    """
+
+    def __init__(self, name, func, threads, queue_size, torch_threads=None):
+        self.name = name
+        self.func = func
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.torch_threads = torch_threads
+        self.next = None
+        self.busy = 0
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"glados-{name}-{i}", daemon=True)
+            for i in range(threads)
+        ]
+
+    def start(self):
+        for t in self._threads:
+            t.start()
+
+    def put(self, item):
+        self.queue.put(item)
+
+    def _worker(self):
+        if self.torch_threads:
+            # with openmp builds of torch, this only applies to parallel
+            # regions entered from this thread
+            import torch
+            torch.set_num_threads(self.torch_threads)
+
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            value, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            with self._lock:
+                self.busy += 1
+            try:
+                result = self.func(value)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                if self.next is None:
+                    future.set_result(result)
+                else:
+                    self.next.put((result, future))
+            finally:
+                with self._lock:
+                    self.busy -= 1
+
+    def stop(self):
+        for _ in self._threads:
+            self.queue.put(None)
+        for t in self._threads:
+            t.join()
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "busy": self.busy,
+            "threads": len(self._threads),
+        }
+
+
+class _ChainedFuture(Future):
+    # the first stage marks the future as running, later stages should
+    # not try to do that again
+    def set_running_or_notify_cancel(self):
+        if self.running():
+            return True
+        return super().set_running_or_notify_cancel()
+
+
+class SynthesisPipeline:
+    """two-stage pipeline with separate bounded queues for text -> mel
+    (acoustic model) and mel -> audio (vocoder), so that the vocoder
+    can work on one request while the acoustic model works on the next.
+
+    """
+
+    def __init__(self, acoustic, vocoder, acoustic_threads=1, vocoder_threads=1, queue_size=4,
+                 acoustic_torch_threads=None, vocoder_torch_threads=None):
+        self.acoustic = Stage("acoustic", acoustic, acoustic_threads, queue_size, acoustic_torch_threads)
+        self.vocoder = Stage("vocoder", vocoder, vocoder_threads, queue_size, vocoder_torch_threads)
+        self.acoustic.next = self.vocoder
+        self.stages = [self.acoustic, self.vocoder]
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+        logger.info(
+            f"synthesis pipeline started: {len(self.acoustic._threads)} acoustic thread(s), "
+            f"{len(self.vocoder._threads)} vocoder thread(s), queue size {self.acoustic.queue.maxsize}"
+        )
+
+    def submit(self, item):
+        """queue an item (the text tensor, and whatever else the stage
+        functions need) for synthesis, blocks if the first stage's queue
+        is full. returns a future for the vocoder output.
+
+        """
+
+        future = _ChainedFuture()
+        self.acoustic.put((item, future))
+        return future
+
+    def stop(self):
+        for stage in self.stages:
+            stage.stop()
+
+    def stats(self):
+        return {stage.name: stage.stats() for stage in self.stages}
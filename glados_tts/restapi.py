@@ -1,17 +1,39 @@
+import os
+import json
+import math
+import struct
+import signal
+import asyncio
+import secrets
 from urllib.parse import urljoin
 
-from typing import Annotated
+from typing import Annotated, List, Literal, Optional
 
 from loguru import logger
-from fastapi import FastAPI, APIRouter, Depends, Body, Request
-from fastapi.responses import StreamingResponse, FileResponse
+from fastapi import FastAPI, APIRouter, Depends, Body, Request, HTTPException, Query, Header
+from fastapi import WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse, FileResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 from click.decorators import pass_meta_key
 
+try:
+    # what uvicorn's websocket implementation raises when sending to a
+    # client that has gone away
+    from websockets.exceptions import ConnectionClosed
+except ImportError:
+    ConnectionClosed = WebSocketDisconnect
+
 from glados_tts import __version__
-from glados_tts.utils.tools import iterfile
-from glados_tts.engine import GLaDOS
-from glados_tts.models import GLaDOSResponse, GLaDOSRequest, HealthResponse, MaryRequest
+from glados_tts.utils.tools import iterbuffer
+from glados_tts.utils.segment import SentenceSplitter
+from glados_tts.engine import GLaDOS, GLaDOSInputError
+from glados_tts.scheduler import PRIORITY_CLASSES
+from glados_tts.admission import AdmissionControl, AdmissionError
+from glados_tts.encoders import guess_mimetype
+from glados_tts.models import GLaDOSResponse, GLaDOSRequest, HealthResponse, MaryRequest, StatsResponse
+from glados_tts.models import CacheEntry, CacheListing, CacheStats, ReloadRequest, ReloadStatus, Priority
+from glados_tts.models import JobRequest, JobStatus, VoiceInfo
 from glados_tts.openapi.docs import create_docs_router
 
 
@@ -19,9 +41,78 @@ from glados_tts.openapi.docs import create_docs_router
 
 audio_responses = {200: {"content": {a: {} for a in GLaDOS.audio_mimetypes}}}
 
-def create_glados_router(root_path=""):
+
+def audio_response(g, buf):
+    """stream the audio straight from memory if it was just rendered,
+    otherwise from the cached file.
+
+    """
+
+    if buf is not None:
+        content = iterbuffer(buf)
+    else:
+        content = GLaDOS.get().get_audiofile_iter(g.audio_filename)
+
+    return StreamingResponse(
+        content,
+        media_type=g.audio_mimetype,
+        headers={'GLaDOS-from-cache': str(g.from_cache), 'GLaDOS-degraded': str(g.degraded)}
+    )
+
+
+def request_priority(default, api_keys):
+    """a dependency for the priority class of a request: the class
+    configured for the client's api key, the class the client asks for
+    with the 'X-GLaDOS-Priority' header, or the default for the route.
+    without a configured key, the header can't ask for more than
+    'normal' on routes that aren't interactive already.
+
+    """
+
+    def priority(
+            x_glados_priority: Optional[Priority] = Header(None),
+            x_api_key: Optional[str] = Header(None)
+    ) -> str:
+        if x_api_key is not None and x_api_key in api_keys:
+            return api_keys[x_api_key]
+        if x_glados_priority == "interactive" and default != "interactive":
+            # any client could send the header and jump the queue
+            return "normal"
+        return x_glados_priority or default
+    return priority
+
+
+def client_key(request, api_keys):
+    """clients are told apart by api key, or by ip address. keys that
+    aren't configured don't count, or a client could get a new rate
+    limit with every request by making up keys.
+
+    """
+
+    api_key = request.headers.get("x-api-key")
+    if api_key and api_key in api_keys:
+        return f"key:{api_key}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+async def admit(admission, request, api_keys, text, priority, audio_format=None, sample_rate=None, use_cache=True,
+                voice=None):
+    # the size and latency checks run the text cleaners (and espeak for
+    # canonical cache keys), which shouldn't block the event loop
+    if admission is not None:
+        await run_in_threadpool(
+            admission.check, client_key(request, api_keys), text, priority, audio_format, sample_rate, use_cache,
+            voice)
+
+
+def create_glados_router(root_path="", api_keys=None, admission=None):
+    api_keys = api_keys or {}
     router = APIRouter(prefix=root_path)
     glados = GLaDOS.get()
+    # bulk work (such as warming the cache) goes through /tts, someone
+    # is usually waiting to hear the audio from /say
+    tts_priority = request_priority("normal", api_keys)
+    say_priority = request_priority("interactive", api_keys)
 
 
     @router.post(
@@ -29,22 +120,46 @@ def create_glados_router(root_path=""):
         summary="Text-to-speech",
         response_description="a `GLaDOSReponse` json-dict, mainly with the url to get the audiofile",
     )
-    async def tts(params: Annotated[GLaDOSRequest, Body(embed=False)]) -> GLaDOSResponse:
-        """Synthesize TTS audio with the GLaDOS engine
+    async def tts(
+            request: Request,
+            params: Annotated[GLaDOSRequest, Body(embed=False)],
+            priority: str = Depends(tts_priority)
+    ) -> GLaDOSResponse:
+        """Synthesize TTS audio with the GLaDOS engine. Requests are
+        scheduled with the `normal` priority, unless the `X-GLaDOS-Priority`
+        header asks for `interactive` or `bulk`.
         """
 
-        return glados.tts(
+        await admit(
+            admission, request, api_keys, params.text, priority, params.audio_format, params.sample_rate,
+            params.use_cache, params.voice)
+        return await run_in_threadpool(
+            glados.tts,
             params.text,
             use_cache=params.use_cache,
-            audio_format=params.audio_format
+            audio_format=params.audio_format,
+            sample_rate=params.sample_rate,
+            priority=priority,
+            voice=params.voice
         )
 
     @router.get("/tts", summary="Text-to-speech", response_description="Robot voice")
-    async def tts_query(params: GLaDOSRequest = Depends()) -> GLaDOSResponse:
-        return glados.tts(
+    async def tts_query(
+            request: Request,
+            params: GLaDOSRequest = Depends(),
+            priority: str = Depends(tts_priority)
+    ) -> GLaDOSResponse:
+        await admit(
+            admission, request, api_keys, params.text, priority, params.audio_format, params.sample_rate,
+            params.use_cache, params.voice)
+        return await run_in_threadpool(
+            glados.tts,
             params.text,
             use_cache=params.use_cache,
-            audio_format=params.audio_format
+            audio_format=params.audio_format,
+            sample_rate=params.sample_rate,
+            priority=priority,
+            voice=params.voice
         )
 
     @router.get(
@@ -55,19 +170,23 @@ def create_glados_router(root_path=""):
         responses=audio_responses,
     )
     @router.get("/say.{audio_format}", include_in_schema=False)
-    async def say(params: GLaDOSRequest = Depends()) -> StreamingResponse:
+    async def say(
+            request: Request,
+            params: GLaDOSRequest = Depends(),
+            priority: str = Depends(say_priority)
+    ) -> StreamingResponse:
         """Synthesize TTS audio with the GLaDOS engine and directly return the
-        audio file. Request parameters have the same meaning as for `/tts`.
+        audio file. Request parameters have the same meaning as for `/tts`,
+        but requests are scheduled with the `interactive` priority by default.
         """
 
-        g = glados.tts(params.text, use_cache=params.use_cache, audio_format=params.audio_format)
-        audiofile_path = glados.get_audiofile_path(g.audio_filename)
-
-        return StreamingResponse(
-            iterfile(audiofile_path),
-            media_type=g.audio_mimetype,
-            headers={'GLaDOS-from-cache': str(g.from_cache)}
-        )
+        await admit(
+            admission, request, api_keys, params.text, priority, params.audio_format, params.sample_rate,
+            params.use_cache, params.voice)
+        g, buf = await run_in_threadpool(
+            glados.tts_to_memory, params.text, use_cache=params.use_cache, audio_format=params.audio_format,
+            sample_rate=params.sample_rate, priority=priority, voice=params.voice)
+        return audio_response(g, buf)
 
     @router.get(
         "/audio/{audio_filename}",
@@ -81,16 +200,340 @@ def create_glados_router(root_path=""):
         the `audio_filename` returned from `/tts`.
         """
 
-        return FileResponse(
-            glados.get_audiofile_path(audio_filename),
-            filename=audio_filename
+        if "/" in audio_filename or not glados.storage.exists(audio_filename):
+            raise HTTPException(status_code=404, detail="no such audio file")
+
+        audiofile_path = glados.get_audiofile_path(audio_filename)
+        if audiofile_path is not None:
+            return FileResponse(audiofile_path, filename=audio_filename, media_type=guess_mimetype(audio_filename))
+
+        return StreamingResponse(
+            glados.get_audiofile_iter(audio_filename),
+            media_type=guess_mimetype(audio_filename),
+            headers={"Content-Disposition": f'attachment; filename="{audio_filename}"'}
         )
 
     return router
 
-def create_mary_router(root_path=""):
+
+# binary websocket frames start with the sentence number and the chunk
+# number within the sentence
+STREAM_HEADER = struct.Struct("<II")
+STREAM_CHUNK_SIZE = 16384
+
+
+def create_stream_router(root_path="", api_keys=None, admission=None):
+    api_keys = api_keys or {}
+    router = APIRouter(prefix=root_path)
+    glados = GLaDOS.get()
+    stream_priority = request_priority("interactive", api_keys)
+
+    @router.websocket("/stream")
+    async def stream(
+            websocket: WebSocket,
+            audio_format: str = "pcm",
+            sample_rate: Optional[int] = None,
+            use_cache: bool = True,
+            voice: Optional[str] = None,
+            priority: str = Depends(stream_priority)
+    ):
+        """Text-to-speech for text that arrives in fragments (from an LLM,
+        for example). Send json messages:
+
+          {"type": "text", "text": "fragment"}   more text
+          {"type": "flush"}                      synthesize the text so far
+          {"type": "end"}                        flush, and close when done
+
+        Each complete sentence is synthesized as soon as it has arrived
+        (looked up in the cache first), and sent back as:
+
+          {"type": "sentence", "seq": 0, "text": .., "from_cache": .., ..}
+          binary frames: uint32 seq, uint32 chunk (little-endian), audio
+          {"type": "sentence_end", "seq": 0, "chunks": 3}
+
+        followed by {"type": "done"} after "end". The audio of each
+        sentence is a complete file in `audio_format` (raw 16-bit pcm
+        by default).
+        """
+
+        audio_format = audio_format.lower()
+        if audio_format not in glados.audio_formats:
+            await websocket.close(code=1003, reason=f"unsupported audio format: '{audio_format}'")
+            return
+        if admission is not None:
+            try:
+                admission.check_rate(client_key(websocket, api_keys))
+            except AdmissionError as e:
+                await websocket.close(code=1008, reason=str(e))
+                return
+
+        if voice is not None and voice != glados.default_voice and voice not in glados.voices:
+            await websocket.close(code=1003, reason=f"unknown voice: '{voice}'")
+            return
+
+        await websocket.accept()
+
+        def render(sentence):
+            if admission is not None:
+                admission.check_size(sentence)
+            return glados.tts_to_memory(sentence, audio_format, use_cache, sample_rate, priority, voice)
+
+        # sentences are rendered while the previous ones are sent, with a
+        # couple in flight at most
+        renders = asyncio.Queue(maxsize=2)
+
+        async def send_audio():
+            """send the renders in order, returns False if that failed. the
+            client gets an error message and the socket is closed with
+            1011 if something unexpected went wrong.
+
+            """
+
+            try:
+                while True:
+                    item = await renders.get()
+                    if item is None:
+                        return True
+                    await send_sentence(*item)
+            except (WebSocketDisconnect, ConnectionClosed):
+                logger.debug("stream: client disconnected")
+            except Exception as e:
+                logger.opt(exception=e).error("stream: failed to send audio")
+                try:
+                    await websocket.send_json({"type": "error", "detail": "internal error"})
+                    await websocket.close(code=1011)
+                except Exception:
+                    # the client is gone already
+                    pass
+
+            # keep taking renders, so adding them doesn't block, until the
+            # receiving side sees that the socket is closed
+            while True:
+                item = await renders.get()
+                if item is None:
+                    return False
+                item[2].add_done_callback(release)
+
+        async def send_sentence(seq, sentence, task):
+            try:
+                g, buf = await task
+            except (GLaDOSInputError, AdmissionError) as e:
+                await websocket.send_json({"type": "error", "seq": seq, "text": sentence, "detail": str(e)})
+                return
+
+            await websocket.send_json({
+                "type": "sentence",
+                "seq": seq,
+                "text": sentence,
+                "from_cache": g.from_cache,
+                "audio_format": g.audio_format,
+                "audio_mimetype": g.audio_mimetype,
+                "sample_rate": g.sample_rate,
+            })
+            if buf is not None:
+                content = iterbuffer(buf, STREAM_CHUNK_SIZE)
+            else:
+                content = glados.get_audiofile_iter(g.audio_filename, STREAM_CHUNK_SIZE)
+            chunk = 0
+            try:
+                for data in content:
+                    await websocket.send_bytes(STREAM_HEADER.pack(seq, chunk) + data)
+                    chunk += 1
+            finally:
+                content.close()
+            await websocket.send_json({"type": "sentence_end", "seq": seq, "chunks": chunk})
+
+        def release(task):
+            # for renders that finished after the client went away
+            if not task.cancelled() and task.exception() is None:
+                g, buf = task.result()
+                if buf is not None:
+                    buf.release()
+
+        splitter = SentenceSplitter(glados.segment_max_tokens)
+        sender = asyncio.create_task(send_audio())
+        seq = 0
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(message.get("code", 1000))
+                try:
+                    # binary frames have no 'text'
+                    message = json.loads(message.get("text"))
+                    kind = message.get("type", "text")
+                except (TypeError, ValueError, AttributeError):
+                    await websocket.close(code=1003, reason="messages must be json objects in text frames")
+                    return
+
+                if kind == "text":
+                    sentences = splitter.feed(str(message.get("text", "")))
+                elif kind in ("flush", "end"):
+                    sentences = splitter.flush()
+                else:
+                    await websocket.close(code=1003, reason=f"unknown message type: '{kind}'")
+                    return
+
+                for sentence in sentences:
+                    task = asyncio.ensure_future(run_in_threadpool(render, sentence))
+                    await renders.put((seq, sentence, task))
+                    seq += 1
+                if sender.done():
+                    # the sender failed, and has closed the socket
+                    return
+                if kind == "end":
+                    break
+
+            await renders.put(None)
+            if not await sender:
+                return
+            await websocket.send_json({"type": "done", "sentences": seq})
+            await websocket.close()
+
+        except WebSocketDisconnect:
+            logger.debug("stream: client disconnected")
+        finally:
+            sender.cancel()
+            while not renders.empty():
+                item = renders.get_nowait()
+                if item is not None:
+                    item[2].add_done_callback(release)
+
+    return router
+
+
+def create_cache_router(root_path=""):
+    router = APIRouter(prefix=root_path)
+    glados = GLaDOS.get()
+
+    def get_index():
+        if glados.index is None:
+            raise HTTPException(status_code=404, detail="the cache index is not enabled")
+        return glados.index
+
+    @router.get("", summary="List cached audio", response_description="a page of cache entries")
+    async def cache_list(
+            offset: int = Query(0, ge=0),
+            limit: int = Query(50, ge=1, le=1000),
+            order: Literal['last_access', 'hits', 'created', 'size'] = 'last_access'
+    ) -> CacheListing:
+        """List the entries in the audio cache, most recently used first
+        (or ordered by `order`).
+        """
+
+        index = get_index()
+        total, entries = await run_in_threadpool(index.list, offset, limit, order)
+        return {"total": total, "offset": offset, "limit": limit, "entries": entries}
+
+    @router.get("/stats", summary="Cache stats", response_description="aggregate stats for the audio cache")
+    async def cache_stats() -> CacheStats:
+        return await run_in_threadpool(get_index().stats)
+
+    @router.get("/lookup", summary="Look up cached audio by text", response_description="matching cache entries")
+    async def cache_lookup(text: str) -> List[CacheEntry]:
+        """Find the cached audio files (in any format or sample rate) for
+        `text`.
+        """
+        return await run_in_threadpool(get_index().lookup, text)
+
+    return router
+
+
+def create_jobs_router(jobs, root_path="", api_keys=None, admission=None, webhook_hosts=()):
+    api_keys = api_keys or {}
+    router = APIRouter(prefix=root_path)
+    job_priority = request_priority("bulk", api_keys)
+    webhook_hosts = {h.lower() for h in webhook_hosts}
+
+    def check_webhook(request, webhook):
+        # the server posts to the webhook from inside the network, so any
+        # client shouldn't get to pick where that goes
+        if request.headers.get("x-api-key") in api_keys:
+            return
+        if webhook.host.lower() in webhook_hosts:
+            return
+        raise HTTPException(
+            status_code=403, detail=f"webhooks to '{webhook.host}' need an api key, or the host in --webhook-host")
+
+    @router.post("", summary="Queue a text-to-speech job", status_code=202)
+    async def submit(
+            request: Request,
+            params: Annotated[JobRequest, Body(embed=False)],
+            priority: str = Depends(job_priority)
+    ) -> JobStatus:
+        """Queue synthesis of `text` and return right away, with the job id
+        to poll `GET /jobs/{id}` with. Jobs are scheduled with the `bulk`
+        priority by default. If a `webhook` url is given, the job status
+        is posted to it when the job is done (or has failed), webhooks
+        need an `X-API-Key` or a host that is allowed with
+        `--webhook-host`. Text that is already in the cache is done right
+        away.
+        """
+
+        if admission is not None:
+            admission.check_rate(client_key(request, api_keys))
+            await run_in_threadpool(admission.check_size, params.text)
+        webhook = None
+        if params.webhook is not None:
+            check_webhook(request, params.webhook)
+            webhook = str(params.webhook)
+        return await run_in_threadpool(
+            jobs.submit, params.text, params.audio_format, params.sample_rate, params.use_cache, priority,
+            webhook, params.voice)
+
+    @router.get("/{job_id}", summary="Job status")
+    async def status(job_id: str) -> JobStatus:
+        """The state and progress of a job, with the `audio_filename` (to
+        get from `/audio/`) once it is done.
+        """
+
+        job = await run_in_threadpool(jobs.get, job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="no such job")
+        return job
+
+    return router
+
+
+def create_admin_router(admin_token, root_path=""):
+    def check_token(authorization: str = Header(None)):
+        if not secrets.compare_digest(authorization or "", f"Bearer {admin_token}"):
+            raise HTTPException(status_code=401, detail="invalid admin token")
+
+    router = APIRouter(prefix=root_path, dependencies=[Depends(check_token)])
+    glados = GLaDOS.get()
+
+    @router.post("/reload", summary="Reload the models", status_code=202)
+    async def reload(params: Annotated[ReloadRequest, Body()] = ReloadRequest()) -> ReloadStatus:
+        """Load and warm a new acoustic model and vocoder (or the current
+        ones again, if they were replaced on disk) in the background, and
+        swap them in once they are ready. Requests that are in flight when
+        the models are swapped finish on the old models. Poll
+        `GET /admin/reload` for the result.
+        """
+
+        for path in (params.acoustic_model, params.vocoder_model):
+            if path is not None and not os.path.isfile(path):
+                raise HTTPException(status_code=400, detail=f"no such model file: '{path}'")
+        if not glados.reload_models_background(params.acoustic_model, params.vocoder_model):
+            raise HTTPException(status_code=409, detail="a reload is already running")
+        return {"state": "loading", "acoustic_model": params.acoustic_model, "vocoder_model": params.vocoder_model}
+
+    @router.get("/reload", summary="Model reload status")
+    async def reload_status() -> ReloadStatus:
+        """The state of the last model reload, with the memory use of the
+        process before, during and after the swap.
+        """
+        return glados.reload_status
+
+    return router
+
+
+def create_mary_router(root_path="", api_keys=None, admission=None):
+    api_keys = api_keys or {}
     router = APIRouter(prefix=root_path)
     glados = GLaDOS.get()
+    mary_priority = request_priority("interactive", api_keys)
 
     @router.post(
         "/process",
@@ -99,7 +542,7 @@ def create_mary_router(root_path=""):
         response_class=StreamingResponse,
         responses=audio_responses,
     )
-    async def say(params: MaryRequest) -> StreamingResponse:
+    async def say(request: Request, params: MaryRequest, priority: str = Depends(mary_priority)) -> StreamingResponse:
         """Accept the same format as the `/process` endpoint on the HTTP API
         for [MARY TTS system](https://marytts.github.io/) system, and
         synthesize TTS audio with the GLaDOS engine.
@@ -111,17 +554,14 @@ def create_mary_router(root_path=""):
 
         """
 
-        g = glados.tts(params.INPUT_TEXT, use_cache=True, audio_format="wav")
-        audiofile_path = glados.get_audiofile_path(g.audio_filename)
-
-        return StreamingResponse(
-            iterfile(audiofile_path),
-            media_type=g.audio_mimetype,
-            headers={'GLaDOS-from-cache': str(g.from_cache)}
-        )
+        await admit(admission, request, api_keys, params.INPUT_TEXT, priority, "wav")
+        g, buf = await run_in_threadpool(
+            glados.tts_to_memory, params.INPUT_TEXT, use_cache=True, audio_format="wav", priority=priority)
+        return audio_response(g, buf)
 
     return router
 
+
 @pass_meta_key('restapi')
 def create_app(restapi_config):
     app = FastAPI(
@@ -132,7 +572,13 @@ def create_app(restapi_config):
         openapi_tags=[
             {"name": "api", "description": "operations for the GLaDOS TTS API itself"},
             {"name": "tts", "description": "Text-to-speech API"},
-            {"name": "mary", "description": "Basic compatability interface the HTTP API for [MARY TTS](https://marytts.github.io/)."}
+            {"name": "cache", "description": "information about the audio cache"},
+            {"name": "jobs", "description": "queued text-to-speech jobs, for long texts and batches"},
+            {
+                "name": "mary",
+                "description": "Basic compatability interface the HTTP API for [MARY TTS](https://marytts.github.io/).",
+            },
+            {"name": "admin", "description": "model management, needs the `--admin-token`"}
         ],
         root_path = restapi_config.get('root_path', ''),
         openapi_url="/openapi.json",
@@ -144,12 +590,82 @@ def create_app(restapi_config):
     docs_router = create_docs_router(app.openapi_url)
     app.include_router(docs_router, prefix="/docs")
 
-    glados_router = create_glados_router()
+    # {api key: priority class} from the config file, for clients such as
+    # home assistant (interactive) or batch jobs (bulk)
+    api_keys = restapi_config.get('api_keys', {})
+    for key, priority in api_keys.items():
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"unknown priority for api key: '{priority}', supported: {PRIORITY_CLASSES}")
+
+    admission = AdmissionControl(
+        GLaDOS.get(),
+        max_chars=restapi_config.get('max_chars', 0),
+        max_tokens=restapi_config.get('max_tokens', 0),
+        rate=restapi_config.get('rate_limit', 0.0),
+        burst=restapi_config.get('rate_burst', 10),
+        latency_slo=restapi_config.get('latency_slo', 0.0),
+    )
+
+    glados_router = create_glados_router(api_keys=api_keys, admission=admission)
     app.include_router(glados_router, tags=['tts'])
 
-    mary_router = create_mary_router()
+    stream_router = create_stream_router(api_keys=api_keys, admission=admission)
+    app.include_router(stream_router)
+
+    cache_router = create_cache_router()
+    app.include_router(cache_router, prefix='/cache', tags=['cache'])
+
+    mary_router = create_mary_router(api_keys=api_keys, admission=admission)
     app.include_router(mary_router, prefix='/mary', tags=['mary'])
 
+    jobs = None
+    if restapi_config.get('jobs'):
+        from glados_tts.jobs import JobQueue
+        glados = GLaDOS.get()
+        jobs = JobQueue(
+            glados,
+            restapi_config.get('jobs_db') or os.path.join(glados.audio_dir, ".jobs.db"),
+            max_pending=restapi_config.get('jobs_max_pending', 1000),
+            workers=restapi_config.get('job_workers', 1),
+        )
+        jobs_router = create_jobs_router(
+            jobs, api_keys=api_keys, admission=admission, webhook_hosts=restapi_config.get('webhook_hosts') or ())
+        app.include_router(jobs_router, prefix='/jobs', tags=['jobs'])
+
+    admin_token = restapi_config.get('admin_token')
+    if admin_token:
+        admin_router = create_admin_router(admin_token)
+        app.include_router(admin_router, prefix='/admin', tags=['admin'])
+
+    @app.on_event("startup")
+    async def load_models():
+        # start answering requests (/health) right away, requests that need
+        # the models wait for them to be loaded
+        glados = GLaDOS.get()
+        glados.load_models_background()
+        if jobs is not None:
+            jobs.start()
+
+        # 'kill -HUP' reloads the models from the configured paths
+        try:
+            loop = asyncio.get_running_loop()
+            loop.add_signal_handler(signal.SIGHUP, glados.reload_models_background)
+        except (AttributeError, NotImplementedError, RuntimeError, ValueError):
+            # no SIGHUP (windows), or not running in the main thread
+            logger.debug("not reloading the models on SIGHUP")
+
+    @app.exception_handler(GLaDOSInputError)
+    async def input_error(request: Request, exc: GLaDOSInputError):
+        return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+    @app.exception_handler(AdmissionError)
+    async def admission_error(request: Request, exc: AdmissionError):
+        if exc.status_code == 429:
+            logger.warning(f"not admitted: {client_key(request, api_keys)}: {exc}")
+        headers = {}
+        if exc.retry_after is not None:
+            headers["Retry-After"] = str(max(1, math.ceil(exc.retry_after)))
+        return JSONResponse(status_code=exc.status_code, content={"detail": str(exc)}, headers=headers)
 
     @app.get("/", include_in_schema=False)
     async def index(request: Request):
@@ -162,14 +678,41 @@ def create_app(restapi_config):
 
     @app.get("/health", summary="Healthcheck", response_description="Healthcheck results", tags=["api"])
     async def health() -> HealthResponse:
-        """The healthcheck for the GLaDOS TTS Rest API.
+        """The healthcheck for the GLaDOS TTS Rest API. This answers while the
+        models are still loading in the background.
         """
-        return {"status": "healthy"}
+        return {"status": "healthy", "models_loaded": GLaDOS.get().models_loaded}
+
+    @app.get("/voices", summary="Voices", response_description="the voices to choose from", tags=["tts"])
+    async def voices() -> List[VoiceInfo]:
+        """The voices that can be asked for with the `voice` parameter, and
+        whether they are loaded. Voices are loaded when they are first
+        used, and the least recently used ones are unloaded when the
+        models don't fit in the memory budget (`--voice-memory-mb`).
+        """
+        return GLaDOS.get().list_voices()
+
+    @app.get("/stats", summary="Engine stats", response_description="Engine stats", tags=["api"])
+    async def stats() -> StatsResponse:
+        """Stats for the GLaDOS TTS engine, such as the queue depths for
+        each stage of the synthesis pipeline, and how long requests of each
+        priority class wait to be synthesized.
+        """
+        glados = GLaDOS.get()
+        return {
+            "pipeline": glados.pipeline_stats(),
+            "scheduler": glados.scheduler_stats(),
+            "sentence_cache": glados.sentence_cache_stats(),
+            "degrade": glados.degrade_stats(),
+            "voices": glados.voice_stats(),
+            "cache_keys": glados.cache_key_stats(),
+            "jobs": await run_in_threadpool(jobs.stats) if jobs is not None else None,
+        }
 
 
     route_summaries = []
     for item in app.routes:
-        methods = ", ".join(item.methods)
+        methods = ", ".join(getattr(item, "methods", None) or ["WS"])
         route_summaries.append(f" - {methods.ljust(10)} > {item.path}")
     route_summary = "\n".join(route_summaries)
     logger.debug(f"routes:\n{route_summary}")
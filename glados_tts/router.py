@@ -0,0 +1,418 @@
+import json
+import math
+import bisect
+import asyncio
+import hashlib
+import threading
+import http.client
+from time import sleep, monotonic
+from urllib.parse import urlsplit, parse_qs
+
+from loguru import logger
+from fastapi import FastAPI, Request, WebSocket
+from fastapi.responses import StreamingResponse, JSONResponse
+from starlette.concurrency import run_in_threadpool, iterate_in_threadpool
+from click.decorators import pass_meta_key
+
+from glados_tts import __version__
+from glados_tts.engine import GLaDOS
+
+
+# headers that only apply to a single connection, and are not passed on
+HOP_BY_HOP = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailer", "transfer-encoding", "upgrade", "host", "content-length",
+}
+
+
+class ProxyResponse(StreamingResponse):
+    """a response streamed from a replica, 'on_close' is called once it
+    is done, also when the client went away before (or while) it was
+    streamed.
+
+    """
+
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await run_in_threadpool(self.on_close)
+
+
+class Replica:
+    def __init__(self, url):
+        u = urlsplit(url)
+        self.url = url.rstrip("/")
+        self.scheme = u.scheme
+        self.host = u.hostname
+        self.port = u.port or (443 if u.scheme == "https" else 80)
+        self.path = u.path.rstrip("/")
+        self.healthy = True
+        self.in_flight = 0
+        self.last_check = None
+
+    def connection(self, timeout):
+        cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=timeout)
+
+    def __repr__(self):
+        return self.url
+
+
+class HashRing:
+    """consistent hashing with bounded loads: a request goes to the first
+    replica clockwise from its key on the ring (with 'vnodes' points per
+    replica) that is healthy and has fewer requests in flight than
+    'load_factor' times the average, so hot keys spill over to the next
+    replica instead of piling up on one.
+
+    """
+
+    def __init__(self, replicas, vnodes=100, load_factor=1.25):
+        self.replicas = replicas
+        self.load_factor = load_factor
+        self._lock = threading.Lock()
+        self._ring = sorted(
+            (self._hash(f"{replica.url}#{i}"), replica)
+            for replica in replicas for i in range(vnodes)
+        )
+        self._points = [p for p, _ in self._ring]
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+    def candidates(self, key):
+        """the distinct replicas in ring order, starting at 'key'"""
+        start = bisect.bisect(self._points, self._hash(key))
+        seen = []
+        for i in range(len(self._ring)):
+            replica = self._ring[(start + i) % len(self._ring)][1]
+            if replica not in seen:
+                seen.append(replica)
+                if len(seen) == len(self.replicas):
+                    break
+        return seen
+
+    def acquire(self, key, exclude=()):
+        """pick a replica for 'key' and count the request as in flight on it,
+        returns None if no replica is available.
+
+        """
+
+        with self._lock:
+            healthy = [r for r in self.replicas if r.healthy and r not in exclude]
+            if not healthy:
+                return None
+            total = sum(r.in_flight for r in healthy) + 1
+            capacity = math.ceil(self.load_factor * total / len(healthy))
+
+            candidates = [r for r in self.candidates(key) if r.healthy and r not in exclude]
+            replica = next((r for r in candidates if r.in_flight < capacity), candidates[0])
+            replica.in_flight += 1
+            return replica
+
+    def release(self, replica):
+        with self._lock:
+            replica.in_flight -= 1
+
+
+class Router:
+    def __init__(self, replicas, vnodes=100, load_factor=1.25, timeout=60.0, health_interval=5.0):
+        self.ring = HashRing([Replica(url) for url in replicas], vnodes, load_factor)
+        self.timeout = timeout
+        self.health_interval = health_interval
+        # the engine is configured (but not loaded) with the same options
+        # as the replicas, to compute the same cache filenames
+        self.glados = GLaDOS.get()
+
+    def key(self, text, audio_format=None, sample_rate=None, voice=None):
+        """the hash from the cache filename that the replicas would use for
+        this request, so every request for a phrase goes to the replica
+        that has it cached.
+
+        """
+
+        audio_format = (audio_format or self.glados.default_audio_format).lower()
+        try:
+            sample_rate = self.glados.get_encoder(audio_format).output_rate(sample_rate or self.glados.sample_rate)
+        except ValueError:
+            # the replica will answer with an error
+            sample_rate = None
+        if voice == self.glados.default_voice or voice not in self.glados.voices:
+            voice = None
+        return self.key_from_fname(self.glados._make_fname(text, audio_format, sample_rate, voice))
+
+    @staticmethod
+    def key_from_fname(fname):
+        return fname.rsplit(".", 1)[0].rsplit("_", 1)[-1]
+
+    def check_health(self, replica):
+        try:
+            conn = replica.connection(timeout=min(self.timeout, 5.0))
+            conn.request("GET", f"{replica.path}/health")
+            healthy = conn.getresponse().status == 200
+            conn.close()
+        except (OSError, http.client.HTTPException):
+            healthy = False
+        if healthy != replica.healthy:
+            logger.warning(f"replica {replica} is {'healthy' if healthy else 'unhealthy'}")
+        replica.healthy = healthy
+        replica.last_check = monotonic()
+
+    def health_loop(self):
+        while True:
+            for replica in self.ring.replicas:
+                self.check_health(replica)
+            sleep(self.health_interval)
+
+    def start(self):
+        threading.Thread(target=self.health_loop, name="glados-router-health", daemon=True).start()
+
+    def _open(self, replica, method, path, headers, body):
+        conn = replica.connection(self.timeout)
+        conn.request(method, f"{replica.path}{path}", body=body, headers=headers)
+        return conn, conn.getresponse()
+
+    async def proxy(self, request, key, body=None, retry_not_found=False):
+        """send the request to the replica for 'key', failing over to the
+        next one on the ring if it can't be reached (or, for
+        'retry_not_found', doesn't have the file). the response body is
+        streamed through as it arrives.
+
+        """
+
+        path = request.url.path
+        if request.url.query:
+            path = f"{path}?{request.url.query}"
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in HOP_BY_HOP}
+        headers["X-Forwarded-For"] = request.client.host if request.client else ""
+
+        tried = []
+        while True:
+            replica = self.ring.acquire(key, exclude=tried)
+            if replica is None:
+                return JSONResponse(status_code=503, content={"detail": "no replica available"})
+            tried.append(replica)
+            try:
+                conn, resp = await run_in_threadpool(self._open, replica, request.method, path, headers, body)
+            except (OSError, http.client.HTTPException) as e:
+                self.ring.release(replica)
+                replica.healthy = False
+                logger.warning(f"replica {replica} failed, marking it unhealthy: {e}")
+                continue
+
+            if resp.status == 404 and retry_not_found and len(tried) < len(self.ring.replicas):
+                conn.close()
+                self.ring.release(replica)
+                continue
+            break
+
+        def content():
+            while True:
+                chunk = resp.read(65536)
+                if not chunk:
+                    return
+                yield chunk
+
+        closed = threading.Lock()
+
+        def close():
+            if closed.acquire(blocking=False):
+                conn.close()
+                self.ring.release(replica)
+
+        response_headers = {k: v for k, v in resp.getheaders() if k.lower() not in HOP_BY_HOP}
+        response_headers["GLaDOS-replica"] = replica.url
+        return ProxyResponse(
+            iterate_in_threadpool(content()), close, status_code=resp.status, headers=response_headers)
+
+    async def proxy_websocket(self, websocket, key):
+        """relay a websocket (/stream) to the replica for 'key', failing
+        over to the next one if it can't be reached. messages are passed
+        on both ways until either side closes.
+
+        """
+
+        try:
+            from websockets.asyncio.client import connect
+            from websockets.exceptions import InvalidStatus, WebSocketException
+        except ImportError as e:
+            raise RuntimeError("routing /stream needs 'websockets' installed") from e
+
+        path = websocket.url.path
+        if websocket.url.query:
+            path = f"{path}?{websocket.url.query}"
+        headers = {k: v for k, v in websocket.headers.items()
+                   if k.lower() not in HOP_BY_HOP and not k.lower().startswith("sec-websocket-")}
+        headers["X-Forwarded-For"] = websocket.client.host if websocket.client else ""
+
+        tried = []
+        while True:
+            replica = self.ring.acquire(key, exclude=tried)
+            if replica is None:
+                await websocket.close(code=1013, reason="no replica available")
+                return
+            tried.append(replica)
+            scheme = "wss" if replica.scheme == "https" else "ws"
+            url = f"{scheme}://{replica.host}:{replica.port}{replica.path}{path}"
+            try:
+                upstream = await connect(url, additional_headers=headers, open_timeout=self.timeout)
+            except InvalidStatus:
+                # the replica refused the request (unknown voice, rate
+                # limit, ..), so does the router
+                self.ring.release(replica)
+                await websocket.close()
+                return
+            except (OSError, asyncio.TimeoutError, WebSocketException) as e:
+                self.ring.release(replica)
+                replica.healthy = False
+                logger.warning(f"replica {replica} failed, marking it unhealthy: {e}")
+                continue
+            break
+
+        try:
+            await websocket.accept()
+
+            async def from_client():
+                while True:
+                    message = await websocket.receive()
+                    if message["type"] == "websocket.disconnect":
+                        return
+                    if message.get("text") is not None:
+                        await upstream.send(message["text"])
+                    elif message.get("bytes") is not None:
+                        await upstream.send(message["bytes"])
+
+            async def from_replica():
+                try:
+                    async for message in upstream:
+                        if isinstance(message, str):
+                            await websocket.send_text(message)
+                        else:
+                            await websocket.send_bytes(message)
+                except WebSocketException:
+                    pass
+                code = upstream.close_code
+                # 1005 and 1006 (no code, connection lost) can't be sent
+                await websocket.close(
+                    code=code if code not in (None, 1005, 1006) else 1011, reason=upstream.close_reason or "")
+
+            tasks = [asyncio.ensure_future(from_client()), asyncio.ensure_future(from_replica())]
+            try:
+                await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            await upstream.close()
+            self.ring.release(replica)
+
+    def stats(self):
+        return [
+            {"url": r.url, "healthy": r.healthy, "in_flight": r.in_flight}
+            for r in self.ring.replicas
+        ]
+
+
+def _param(query, name):
+    value = query.get(name)
+    return value[0] if value else None
+
+
+@pass_meta_key('router')
+def create_app(router_config):
+    router = Router(
+        router_config['replica'],
+        vnodes=router_config.get('vnodes', 100),
+        load_factor=router_config.get('load_factor', 1.25),
+        timeout=router_config.get('timeout', 60.0),
+        health_interval=router_config.get('health_interval', 5.0),
+    )
+
+    app = FastAPI(
+        title="GLaDOS Text-to-speech router",
+        description="routes requests to the GLaDOS TTS replica that has the phrase cached",
+        version=__version__,
+        docs_url=None,
+        redoc_url=None,
+    )
+
+    @app.on_event("startup")
+    async def start():
+        router.start()
+
+    async def route_text(request, text, audio_format, sample_rate, voice, body=None):
+        try:
+            sample_rate = int(sample_rate) if sample_rate else None
+        except ValueError:
+            sample_rate = None
+        # with canonical cache keys, the key runs the text frontend
+        key = await run_in_threadpool(router.key, text or "", audio_format, sample_rate, voice)
+        return await router.proxy(request, key, body)
+
+    def json_params(body):
+        try:
+            params = json.loads(body)
+        except ValueError:
+            params = {}
+        return params if isinstance(params, dict) else {}
+
+    @app.get("/say")
+    @app.get("/say.{audio_format}")
+    @app.get("/tts")
+    async def say(request: Request):
+        query = parse_qs(request.url.query)
+        audio_format = request.path_params.get("audio_format") or _param(query, "audio_format")
+        return await route_text(
+            request, _param(query, "text"), audio_format, _param(query, "sample_rate"), _param(query, "voice"))
+
+    @app.post("/tts")
+    async def tts(request: Request):
+        body = await request.body()
+        params = json_params(body)
+        return await route_text(
+            request, params.get("text"), params.get("audio_format"), params.get("sample_rate"), params.get("voice"),
+            body)
+
+    @app.post("/jobs")
+    async def jobs(request: Request):
+        body = await request.body()
+        params = json_params(body)
+        return await route_text(
+            request, params.get("text"), params.get("audio_format"), params.get("sample_rate"), params.get("voice"),
+            body)
+
+    @app.websocket("/stream")
+    async def stream(websocket: WebSocket):
+        # the text arrives after the connection is made, so streams are
+        # spread over the replicas by client instead
+        client = websocket.client.host if websocket.client else ""
+        await router.proxy_websocket(websocket, f"stream:{client}")
+
+    @app.get("/jobs/{job_id}")
+    async def job_status(request: Request, job_id: str):
+        # each replica has its own job queue, ask them in turn
+        return await router.proxy(request, job_id, retry_not_found=True)
+
+    @app.get("/audio/{audio_filename}")
+    async def audio(request: Request, audio_filename: str):
+        # the replica that rendered the file might be gone (or the ring
+        # changed), so look for it on the next ones too
+        return await router.proxy(request, router.key_from_fname(audio_filename), retry_not_found=True)
+
+    @app.get("/health")
+    async def health():
+        replicas = router.stats()
+        status = "healthy" if any(r["healthy"] for r in replicas) else "unhealthy"
+        return JSONResponse(
+            status_code=200 if status == "healthy" else 503,
+            content={"status": status, "replicas": replicas}
+        )
+
+    return app
@@ -0,0 +1,120 @@
+import threading
+import collections
+from time import monotonic
+from contextlib import contextmanager
+
+from loguru import logger
+
+
+PRIORITY_CLASSES = ("interactive", "normal", "bulk")
+
+# how much "longer" (in estimated phoneme tokens) a request of each class is
+# treated as, so interactive requests go first unless a bulk request
+# has been waiting for a while
+DEFAULT_CLASS_COSTS = {"interactive": 0, "normal": 500, "bulk": 5000}
+
+
+class _Waiter:
+    __slots__ = ("priority", "cost", "t0", "event")
+
+    def __init__(self, priority, cost):
+        self.priority = priority
+        self.cost = cost
+        self.t0 = monotonic()
+        self.event = threading.Event()
+
+
+class Scheduler:
+    """admits synthesis requests to a fixed number of slots. when all
+    slots are busy, the waiting request with the lowest score goes
+    next: shortest job first (by the estimated token count), plus a cost
+    for the priority class, minus 'aging' for every second the request
+    has waited, so that nothing waits forever.
+
+    """
+
+    def __init__(self, slots=1, aging=100.0, class_costs=None):
+        self.slots = slots
+        self.aging = aging
+        self.class_costs = dict(DEFAULT_CLASS_COSTS, **(class_costs or {}))
+        self.busy = 0
+        self._running_cost = 0
+        self._waiting = []
+        self._lock = threading.Lock()
+
+        # recent queue waits per class, for the stats
+        self._waits = {c: collections.deque(maxlen=1000) for c in PRIORITY_CLASSES}
+        self._requests = {c: 0 for c in PRIORITY_CLASSES}
+
+    def _score(self, w, now):
+        return w.cost + self.class_costs[w.priority] - self.aging * (now - w.t0)
+
+    def _dispatch(self):
+        # called with the lock held
+        now = monotonic()
+        while self.busy < self.slots and self._waiting:
+            w = min(self._waiting, key=lambda w: self._score(w, now))
+            self._waiting.remove(w)
+            self.busy += 1
+            self._running_cost += w.cost
+            w.event.set()
+
+    @contextmanager
+    def slot(self, priority, cost):
+        """wait for a slot to run a request of the class 'priority' and
+        estimated 'cost' (phoneme tokens) in.
+
+        """
+
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"unknown priority: '{priority}', supported: {PRIORITY_CLASSES}")
+
+        w = _Waiter(priority, cost)
+        with self._lock:
+            self._waiting.append(w)
+            self._dispatch()
+        w.event.wait()
+
+        waited = monotonic() - w.t0
+        with self._lock:
+            self._waits[priority].append(waited)
+            self._requests[priority] += 1
+        if waited > 1.0:
+            logger.debug(f"{priority} request waited {waited:.2f}s for a synthesis slot")
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.busy -= 1
+                self._running_cost -= w.cost
+                self._dispatch()
+
+    def backlog(self, priority):
+        """the cost of the requests that are running, or waiting with the
+        same or a higher priority than 'priority' (so are likely to go
+        first).
+
+        """
+
+        rank = PRIORITY_CLASSES.index(priority)
+        with self._lock:
+            ahead = sum(w.cost for w in self._waiting if PRIORITY_CLASSES.index(w.priority) <= rank)
+            return self._running_cost + ahead
+
+    def stats(self):
+        with self._lock:
+            waiting = collections.Counter(w.priority for w in self._waiting)
+            classes = {}
+            for c in PRIORITY_CLASSES:
+                waits = sorted(self._waits[c])
+                n = len(waits)
+                classes[c] = {
+                    "waiting": waiting[c],
+                    "requests": self._requests[c],
+                    "wait_mean": sum(waits) / n if n else 0.0,
+                    "wait_p50": waits[n // 2] if n else 0.0,
+                    "wait_p95": waits[min(n - 1, int(n * 0.95))] if n else 0.0,
+                    "wait_max": waits[-1] if n else 0.0,
+                }
+            return {"slots": self.slots, "busy": self.busy, "classes": classes}
@@ -0,0 +1,106 @@
+import hashlib
+import threading
+import collections
+
+import numpy
+
+from glados_tts.utils.cleaners import english_cleaners, collapse_whitespace
+
+
+def normalize_sentence(sentence):
+    """the text that the models actually see for 'sentence' (numbers and
+    abbreviations spelled out, whitespace collapsed, with a full stop
+    added if it doesn't end with punctuation, like prepare_text does),
+    so sentences that only differ in ways that don't change the audio
+    share a cache entry.
+
+    """
+
+    text = collapse_whitespace(english_cleaners(sentence)).strip()
+    if text and text[-1] not in ".?!":
+        text = text + "."
+    return text
+
+
+class SentenceCache:
+    """int16 pcm at the native sample rate for single sentences, so that
+    texts that share sentences with earlier requests only need the new
+    sentences synthesized. recently used sentences are kept in memory
+    (up to 'max_bytes'), and all of them in the 'storage' backend.
+
+    """
+
+    def __init__(self, storage=None, max_bytes=64 * 1024 * 1024):
+        self.storage = storage
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._memory = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, sentence, salt=None):
+        h = hashlib.blake2b(digest_size=20)
+        h.update(normalize_sentence(sentence).encode())
+        if salt is not None:
+            h.update(f"#{salt}".encode())
+        return f"{h.hexdigest()}.pcm"
+
+    def _remember(self, key, pcm):
+        # called with the lock held
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = pcm
+        self.nbytes += pcm.nbytes
+        while self.nbytes > self.max_bytes and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+
+    def get(self, key):
+        """float audio for 'key' (a new array, that the caller can modify),
+        or None if it isn't cached.
+
+        """
+
+        with self._lock:
+            pcm = self._memory.get(key)
+            if pcm is not None:
+                self._memory.move_to_end(key)
+
+        if pcm is None and self.storage is not None and self.storage.exists(key):
+            with self.storage.open(key) as f:
+                pcm = numpy.frombuffer(f.read(), dtype='<i2')
+            with self._lock:
+                self._remember(key, pcm)
+
+        with self._lock:
+            if pcm is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return pcm / numpy.float32(32768.0)
+
+    def put(self, key, audio):
+        """cache the float audio 'audio' for 'key'"""
+        pcm = numpy.clip(audio * 32768.0, -32768, 32767).astype('<i2')
+        with self._lock:
+            self._remember(key, pcm)
+        if self.storage is not None:
+            self.storage.write(key, pcm.data)
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self.nbytes,
+            }
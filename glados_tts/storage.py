@@ -0,0 +1,342 @@
+import io
+import os
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from time import time
+from contextlib import contextmanager
+from collections import namedtuple
+from urllib.parse import urlparse, parse_qsl
+
+from loguru import logger
+
+
+StorageStat = namedtuple("StorageStat", ["size", "mtime", "ctime"])
+
+
+class Storage:
+    """where rendered audio files are kept, addressed by the filenames
+    from GLaDOS._make_fname.
+
+    """
+
+    name = None
+
+    def exists(self, fname):
+        return self.stat(fname) is not None
+
+    def stat(self, fname):
+        """returns a StorageStat, or None if there is no such file"""
+        raise NotImplementedError
+
+    def touch(self, fname):
+        """update the access time, used for cache eviction"""
+        pass
+
+    @contextmanager
+    def writer(self, fname):
+        """a seekable file object to write 'fname' to, the file only shows up
+        in the storage if the block exits without an exception.
+
+        """
+        f = io.BytesIO()
+        yield f
+        self.write(fname, f.getbuffer())
+
+    def write(self, fname, data):
+        raise NotImplementedError
+
+    def open(self, fname):
+        """a binary file object to read 'fname' from"""
+        raise NotImplementedError
+
+    def iter(self, fname, chunk_size=65536):
+        with self.open(fname) as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def delete(self, fname):
+        raise NotImplementedError
+
+    def list(self):
+        """iterate over all filenames in the storage"""
+        raise NotImplementedError
+
+    def local_path(self, fname):
+        """the path to 'fname' on the local filesystem, if the backend stores
+        plain files, otherwise None.
+
+        """
+        return None
+
+    def __str__(self):
+        return f"{self.name}"
+
+
+class DirStorage(Storage):
+    """the original layout: all files in a single flat directory"""
+
+    name = "dir"
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(self.path, exist_ok=True)
+
+    def local_path(self, fname):
+        return os.path.join(self.path, fname)
+
+    def stat(self, fname):
+        try:
+            st = os.stat(self.local_path(fname))
+        except FileNotFoundError:
+            return None
+        return StorageStat(st.st_size, st.st_mtime, st.st_ctime)
+
+    def touch(self, fname):
+        try:
+            os.utime(self.local_path(fname))
+        except FileNotFoundError:
+            # evicted in the meantime
+            pass
+
+    @contextmanager
+    def writer(self, fname):
+        path = self.local_path(fname)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # a temp file per writer, concurrent renders of the same file
+        # each write their own and the last one to finish wins
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f"{fname}.", suffix=".part")
+        # mkstemp creates the file readable only by us
+        os.chmod(tmp_path, 0o644)
+        try:
+            with open(fd, 'wb') as f:
+                yield f
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def write(self, fname, data):
+        with self.writer(fname) as f:
+            f.write(data)
+
+    def open(self, fname):
+        return open(self.local_path(fname), 'rb')
+
+    def delete(self, fname):
+        try:
+            os.remove(self.local_path(fname))
+        except FileNotFoundError:
+            pass
+
+    def _ignored(self, fname):
+        # partial writes, and dotfiles such as the cache index
+        return fname.endswith(".part") or fname.startswith(".")
+
+    def list(self):
+        for entry in os.scandir(self.path):
+            if entry.is_file() and not self._ignored(entry.name):
+                yield entry.name
+
+    def __str__(self):
+        return f"{self.name}:{self.path}"
+
+
+class ShardedDirStorage(DirStorage):
+    """files are spread over two levels of subdirectories, by a hash of the
+    filename, so no directory gets too big to list or look up in.
+
+    """
+
+    name = "sharded"
+
+    def local_path(self, fname):
+        h = hashlib.blake2b(fname.encode(), digest_size=2).hexdigest()
+        return os.path.join(self.path, h[:2], h[2:], fname)
+
+    def list(self):
+        for root, dirs, files in os.walk(self.path):
+            for fname in files:
+                if not self._ignored(fname):
+                    yield fname
+
+
+class SQLiteStorage(Storage):
+    """all files as blobs in a single sqlite database, with an index on the
+    access time for eviction.
+
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS audio (
+                    fname TEXT PRIMARY KEY,
+                    data BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS audio_accessed ON audio (accessed)")
+
+    def _conn(self):
+        # sqlite connections can't be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def stat(self, fname):
+        row = self._conn().execute(
+            "SELECT size, accessed, created FROM audio WHERE fname = ?", (fname,)).fetchone()
+        if row is None:
+            return None
+        return StorageStat(*row)
+
+    def touch(self, fname):
+        with self._conn() as conn:
+            conn.execute("UPDATE audio SET accessed = ? WHERE fname = ?", (time(), fname))
+
+    def write(self, fname, data):
+        now = time()
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO audio (fname, data, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (fname, bytes(data), len(data), now, now))
+
+    def open(self, fname):
+        row = self._conn().execute("SELECT data FROM audio WHERE fname = ?", (fname,)).fetchone()
+        if row is None:
+            raise FileNotFoundError(fname)
+        return io.BytesIO(row[0])
+
+    def delete(self, fname):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM audio WHERE fname = ?", (fname,))
+
+    def list(self):
+        for row in self._conn().execute("SELECT fname FROM audio ORDER BY fname"):
+            yield row[0]
+
+    def __str__(self):
+        return f"{self.name}:{self.path}"
+
+
+class S3Storage(Storage):
+    """an S3-compatible object storage bucket, so that several replicas can
+    share renders. set 'endpoint_url' to use something other than AWS
+    (minio, or a local stand-in for testing). needs 'boto3' (the s3 extra).
+
+    """
+
+    name = "s3"
+
+    def __init__(self, bucket, prefix="", **client_options):
+        try:
+            import boto3
+            import botocore.exceptions
+        except ImportError as e:
+            raise RuntimeError("the s3 storage backend needs 'boto3' installed") from e
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self._client = boto3.client("s3", **client_options)
+        self._client_error = botocore.exceptions.ClientError
+
+    def _key(self, fname):
+        return f"{self.prefix}/{fname}" if self.prefix else fname
+
+    def stat(self, fname):
+        try:
+            head = self._client.head_object(Bucket=self.bucket, Key=self._key(fname))
+        except self._client_error as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        ts = head["LastModified"].timestamp()
+        return StorageStat(head["ContentLength"], ts, ts)
+
+    def write(self, fname, data):
+        self._client.put_object(Bucket=self.bucket, Key=self._key(fname), Body=bytes(data))
+
+    def open(self, fname):
+        try:
+            obj = self._client.get_object(Bucket=self.bucket, Key=self._key(fname))
+        except self._client_error as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                raise FileNotFoundError(fname) from e
+            raise
+        return obj["Body"]
+
+    def delete(self, fname):
+        self._client.delete_object(Bucket=self.bucket, Key=self._key(fname))
+
+    def list(self):
+        paginator = self._client.get_paginator("list_objects_v2")
+        prefix = f"{self.prefix}/" if self.prefix else ""
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                yield obj["Key"][len(prefix):]
+
+    def __str__(self):
+        return f"s3://{self.bucket}/{self.prefix}"
+
+
+def storage_from_url(url):
+    """create a storage backend from a url-ish string:
+
+      audio/ or dir:audio/      flat directory (the default)
+      sharded:audio/            hash-sharded directory
+      sqlite:audio/cache.db     sqlite database
+      s3://bucket/prefix?endpoint_url=http://localhost:9000
+
+    """
+
+    if url.startswith("s3://"):
+        u = urlparse(url)
+        return S3Storage(u.netloc, u.path, **dict(parse_qsl(u.query)))
+
+    scheme, sep, path = url.partition(":")
+    if not sep or len(scheme) == 1:
+        # no scheme, or a windows drive letter
+        return DirStorage(url)
+
+    backends = {"dir": DirStorage, "sharded": ShardedDirStorage, "sqlite": SQLiteStorage}
+    try:
+        return backends[scheme](path)
+    except KeyError:
+        raise ValueError(f"unknown storage backend: '{scheme}', supported: {list(backends) + ['s3']}")
+
+
+def migrate(src, dst, delete=False):
+    """copy every file from the 'src' storage to 'dst', skipping files that
+    are already there. returns the number of files copied.
+
+    """
+
+    copied = 0
+    for fname in list(src.list()):
+        if not dst.exists(fname):
+            with src.open(fname) as f, dst.writer(fname) as out:
+                shutil.copyfileobj(f, out)
+            copied += 1
+            logger.debug(f"copied: '{fname}'")
+        if delete:
+            src.delete(fname)
+    return copied
@@ -0,0 +1,186 @@
+import io
+import weakref
+import threading
+import collections
+
+import numpy
+
+
+class ReusableBuffer(io.RawIOBase):
+    """a seekable, in-memory file backed by a bytearray that only ever
+    grows, so that once a buffer has been used for a render of some
+    size it can be reused for the next one without reallocating.
+
+    buffers are reference counted, and go back to their pool when the
+    last reference is released.
+
+    """
+
+    def __init__(self, pool=None, capacity=0):
+        super().__init__()
+        self._pool = pool
+        self._buf = bytearray(capacity)
+        self._size = 0
+        self._pos = 0
+        self._refs = 0
+        self._lock = threading.Lock()
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        elif whence == io.SEEK_END:
+            self._pos = self._size + offset
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def write(self, b):
+        b = memoryview(b).cast('B')
+        end = self._pos + len(b)
+        if end > len(self._buf):
+            self._buf.extend(bytes(max(end - len(self._buf), len(self._buf))))
+        self._buf[self._pos:end] = b
+        self._pos = end
+        self._size = max(self._size, end)
+        return len(b)
+
+    def readinto(self, b):
+        n = max(0, min(len(b), self._size - self._pos))
+        b[:n] = self._buf[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def truncate(self, size=None):
+        self._size = self._pos if size is None else size
+        return self._size
+
+    def getbuffer(self):
+        """a read-only view of the contents, without copying"""
+        return memoryview(self._buf)[:self._size].toreadonly()
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def capacity(self):
+        return len(self._buf)
+
+    def reset(self):
+        self._size = 0
+        self._pos = 0
+
+    def acquire(self):
+        with self._lock:
+            self._refs += 1
+        return self
+
+    def release(self):
+        with self._lock:
+            self._refs -= 1
+            done = self._refs == 0
+        if done and self._pool is not None:
+            self._pool.put(self)
+
+
+class BufferPool:
+    """a pool of reusable in-memory buffers for encoded audio. up to
+    'size' free buffers are kept around, buffers beyond that are
+    dropped when released, and so are buffers that have grown beyond
+    'max_capacity' bytes (for a long render), so the pool doesn't hold
+    on to 'size' times the largest render.
+
+    """
+
+    def __init__(self, size=8, capacity=1 << 20, max_capacity=4 << 20):
+        self.size = size
+        self.capacity = capacity
+        self.max_capacity = max_capacity
+        self._free = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            buf = self._free.pop() if self._free else None
+        if buf is None:
+            buf = ReusableBuffer(self, self.capacity)
+        buf.reset()
+        return buf.acquire()
+
+    def put(self, buf):
+        if buf.capacity > self.max_capacity:
+            return
+        with self._lock:
+            if len(self._free) < self.size:
+                self._free.append(buf)
+
+    def __len__(self):
+        return len(self._free)
+
+
+class PcmPool:
+    """a pool of reusable int16 arrays for synthesized audio blocks, so
+    the output stage doesn't allocate a new array for every block. the
+    arrays are sized in powers of two samples (at least 'min_samples'),
+    and up to 'size' free arrays are kept per size. a size of 0 turns
+    pooling off.
+
+    get(n) returns a view of n samples, put() it back once it has been
+    written out. blocks that are never put back are just garbage
+    collected.
+
+    """
+
+    def __init__(self, size=4, min_samples=1 << 14):
+        self.size = size
+        self.min_samples = min_samples
+        self._free = collections.defaultdict(list)
+        # the arrays that are handed out, so only those are taken back
+        self._out = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+        self.allocations = 0
+        self.reuses = 0
+
+    def get(self, n):
+        capacity = max(self.min_samples, 1 << max(0, n - 1).bit_length())
+        with self._lock:
+            free = self._free[capacity]
+            array = free.pop() if free else None
+            if array is None:
+                self.allocations += 1
+            else:
+                self.reuses += 1
+        if array is None:
+            array = numpy.empty(capacity, dtype=numpy.int16)
+        with self._lock:
+            self._out[id(array)] = array
+        return array[:n]
+
+    def put(self, block):
+        array = block.base if isinstance(block, numpy.ndarray) else None
+        with self._lock:
+            if array is None or self._out.get(id(array)) is not array:
+                return
+            del self._out[id(array)]
+            free = self._free[len(array)]
+            if len(free) < self.size:
+                free.append(array)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "allocations": self.allocations,
+                "reuses": self.reuses,
+                "free_bytes": sum(a.nbytes for free in self._free.values() for a in free),
+            }
@@ -1,11 +1,11 @@
 import re
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
-from phonemizer.phonemize import phonemize
 from unidecode import unidecode
 
 from glados_tts.utils.numbers import normalize_numbers
 from glados_tts.utils.symbols import phonemes_set
+from glados_tts.utils.lexicon import Lexicon, split_words
 
 
 # Regular expression matching whitespace:
@@ -68,8 +68,12 @@ def english_cleaners(text):
     return text
 
 
-def to_phonemes(text: str, lang: str) -> str:
-    phonemes = phonemize(
+def espeak(text, lang: str):
+    """run text (a string or a list of strings) through espeak"""
+    # phonemizer is slow to import, and not needed with a lexicon that
+    # covers every word
+    from phonemizer.phonemize import phonemize
+    return phonemize(
         text,
         language=lang,
         backend='espeak',
@@ -80,13 +84,35 @@ def to_phonemes(text: str, lang: str) -> str:
         punctuation_marks=';:,.!?¡¿—…"«»“”()',
         language_switch='remove-flags'
     )
+
+
+def lexicon_phonemes(text: str, lang: str, lexicon: Lexicon) -> str:
+    """look up every word in the lexicon, and only send the
+    out-of-vocabulary words to espeak (in a single call).
+
+    """
+
+    parts = [(chunk, lexicon.get(chunk) if is_word else chunk) for is_word, chunk in split_words(text)]
+    oov = sorted({chunk.lower() for chunk, p in parts if p is None})
+    if oov:
+        oov_phonemes = dict(zip(oov, espeak(oov, lang)))
+        parts = [(chunk, oov_phonemes[chunk.lower()] if p is None else p) for chunk, p in parts]
+
+    return ''.join(p for _, p in parts)
+
+
+def to_phonemes(text: str, lang: str, lexicon: Optional[Lexicon] = None) -> str:
+    if lexicon is not None:
+        phonemes = lexicon_phonemes(text, lang, lexicon)
+    else:
+        phonemes = espeak(text, lang)
     phonemes = ''.join([p for p in phonemes if p in phonemes_set])
     return phonemes
 
 
 class Cleaner:
 
-    def __init__(self, cleaner_name: str, use_phonemes: bool, lang: str) -> None:
+    def __init__(self, cleaner_name: str, use_phonemes: bool, lang: str, lexicon: Optional[Lexicon] = None) -> None:
         if cleaner_name == 'english_cleaners':
             self.clean_func = english_cleaners
         elif cleaner_name == 'no_cleaners':
@@ -96,11 +122,12 @@ class Cleaner:
                              f'Currently supported: [\'english_cleaners\', \'no_cleaners\']')
         self.use_phonemes = use_phonemes
         self.lang = lang
+        self.lexicon = lexicon
 
     def __call__(self, text: str) -> str:
         text = self.clean_func(text)
         if self.use_phonemes:
-            text = to_phonemes(text, self.lang)
+            text = to_phonemes(text, self.lang, self.lexicon)
         text = collapse_whitespace(text)
         text = text.strip()
         return text
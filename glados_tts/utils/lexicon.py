@@ -0,0 +1,143 @@
+import os
+import re
+import json
+import mmap
+import struct
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+# file layout (all integers little-endian uint32):
+#
+#   magic | version | count | offsets[count + 1] | entries
+#
+# each entry is b"<word>\x00<phonemes>", sorted by word (bytewise,
+# utf-8), and offsets[i] points at the start of entry i relative to
+# the start of the entries blob. that makes lookups a binary search
+# over the mmap, without ever loading the table into python objects.
+_MAGIC = b"GLXL"
+_VERSION = 1
+_HEADER = struct.Struct("<4sII")
+_OFFSET = struct.Struct("<I")
+
+_word_re = re.compile(r"[A-Za-z]+(?:'[A-Za-z]+)*")
+
+
+def split_words(text: str) -> List[Tuple[bool, str]]:
+    """split text into (is_word, chunk) pairs, keeping everything that is
+    not a word (whitespace, punctuation) as separator chunks so the
+    text can be put back together after phonemizing the words.
+
+    """
+
+    parts = []
+    pos = 0
+    for m in _word_re.finditer(text):
+        if m.start() > pos:
+            parts.append((False, text[pos:m.start()]))
+        parts.append((True, m.group(0)))
+        pos = m.end()
+    if pos < len(text):
+        parts.append((False, text[pos:]))
+    return parts
+
+
+def normalize_word(word: str) -> str:
+    return word.lower()
+
+
+def write_lexicon(path: str, entries: Dict[str, str]) -> int:
+    """write a word -> phonemes table to 'path' in the on-disk lexicon
+    format, returns the number of entries written.
+
+    """
+
+    items = sorted(
+        (normalize_word(w).encode(), p.encode()) for w, p in entries.items() if w and p
+    )
+    blob = bytearray()
+    offsets = []
+    for word, phonemes in items:
+        offsets.append(len(blob))
+        blob += word + b"\x00" + phonemes
+    offsets.append(len(blob))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, len(items)))
+        f.write(struct.pack(f"<{len(offsets)}I", *offsets))
+        f.write(blob)
+    os.replace(tmp_path, path)
+    return len(items)
+
+
+class Lexicon:
+    """a memory-mapped, sorted word -> phoneme table, with an optional
+    dict of user overrides that take precedence over the table.
+
+    """
+
+    def __init__(self, path: Optional[str] = None, overrides: Optional[Dict[str, str]] = None) -> None:
+        self.path = path
+        self.overrides = {normalize_word(k): v for k, v in (overrides or {}).items()}
+        self._mm = None
+        self._count = 0
+        self._entries_start = 0
+
+        if path is not None:
+            with open(path, "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, count = _HEADER.unpack_from(self._mm, 0)
+            if magic != _MAGIC or version != _VERSION:
+                raise ValueError(f"not a lexicon file (or unsupported version): '{path}'")
+            self._count = count
+            self._entries_start = _HEADER.size + (count + 1) * _OFFSET.size
+
+    @classmethod
+    def from_files(cls, path: Optional[str] = None, overrides_path: Optional[str] = None) -> 'Lexicon':
+        overrides = {}
+        if overrides_path is not None:
+            with open(overrides_path, "r") as f:
+                overrides = json.load(f)
+        return cls(path, overrides)
+
+    def __len__(self) -> int:
+        return self._count + len(self.overrides)
+
+    def _entry(self, i: int) -> Tuple[bytes, bytes]:
+        start, end = struct.unpack_from("<II", self._mm, _HEADER.size + i * _OFFSET.size)
+        entry = self._mm[self._entries_start + start:self._entries_start + end]
+        word, _, phonemes = entry.partition(b"\x00")
+        return word, phonemes
+
+    def _search(self, word: bytes) -> Optional[str]:
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key, phonemes = self._entry(mid)
+            if key < word:
+                lo = mid + 1
+            elif key > word:
+                hi = mid
+            else:
+                return phonemes.decode()
+        return None
+
+    def get(self, word: str) -> Optional[str]:
+        word = normalize_word(word)
+        if word in self.overrides:
+            return self.overrides[word]
+        if self._mm is None:
+            return None
+        return self._search(word.encode())
+
+    def __contains__(self, word: str) -> bool:
+        return self.get(word) is not None
+
+    def words(self) -> Iterable[str]:
+        for i in range(self._count):
+            yield self._entry(i)[0].decode()
+
+    def close(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
@@ -0,0 +1,99 @@
+import sys
+import random
+import threading
+import collections
+from time import time
+
+from loguru import logger
+
+
+def configure(level="INFO", json=False, path=None, enqueue=True):
+    """replace loguru's default sink. with 'enqueue', records are handed
+    to a background thread that writes them, so logging never blocks a
+    request (or the event loop) on the terminal or disk. formatting (and
+    serializing, with 'json') still happens on the thread that logs, so
+    hot paths should log lazily. with 'json', every record is written as
+    a json object, with the fields of the record in 'record.extra'.
+
+    """
+
+    logger.remove()
+    logger.add(path or sys.stderr, level=level.upper(), serialize=json, enqueue=enqueue)
+
+
+class RequestLog:
+    """per-request log lines (at DEBUG), for a random 'sample' (0.0 -
+    1.0) of the requests, with the text cut off after 'max_text'
+    characters, and a summary (at INFO) of the throughput and latency of
+    all requests every 'interval' seconds (0 to turn it off).
+
+    """
+
+    def __init__(self, sample=1.0, max_text=80, interval=60.0, window=10000):
+        self.sample = sample
+        self.max_text = max_text
+        self.interval = interval
+        self._latencies = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._reset(time())
+
+    def _reset(self, now):
+        # called with the lock held (or before the summary thread runs)
+        self._since = now
+        self._requests = 0
+        self._from_cache = 0
+        self._chars = 0
+        self._latencies.clear()
+
+    def truncate(self, text):
+        if self.max_text and len(text) > self.max_text:
+            return f"{text[:self.max_text]}... ({len(text)} chars)"
+        return text
+
+    def record(self, text, seconds, from_cache=False, **fields):
+        """a finished request, 'fields' are added to the record"""
+        with self._lock:
+            self._requests += 1
+            self._from_cache += from_cache
+            self._chars += len(text)
+            self._latencies.append(seconds)
+            if self._thread is None and self.interval > 0:
+                self._thread = threading.Thread(target=self._summaries, name="glados-log-summary", daemon=True)
+                self._thread.start()
+
+        if self.sample >= 1.0 or (self.sample > 0.0 and random.random() < self.sample):
+            # the text goes into the record as a field, never into the
+            # format string
+            short = text[:self.max_text] if self.max_text else text
+            logger.bind(text=short, chars=len(text), seconds=seconds, from_cache=from_cache, **fields).debug(
+                "request: '{}' in {:.2f}s{}", self.truncate(text), seconds, " (cached)" if from_cache else "")
+
+    def _summaries(self):
+        stop = threading.Event()
+        while not stop.wait(self.interval):
+            self.summary()
+
+    def summary(self):
+        """log the summary of the requests since the last one"""
+        now = time()
+        with self._lock:
+            if not self._requests:
+                self._since = now
+                return
+            elapsed = now - self._since
+            latencies = sorted(self._latencies)
+            stats = {
+                "requests": self._requests,
+                "requests_per_second": self._requests / elapsed if elapsed > 0 else 0.0,
+                "from_cache": self._from_cache,
+                "chars": self._chars,
+                "latency_p50": latencies[len(latencies) // 2],
+                "latency_p95": latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+                "latency_max": latencies[-1],
+            }
+            self._reset(now)
+
+        logger.bind(**stats).info(
+            "summary: {requests} requests ({requests_per_second:.2f}/s, {from_cache} cached, {chars} chars), "
+            "latency p50 {latency_p50:.2f}s, p95 {latency_p95:.2f}s, max {latency_max:.2f}s", **stats)
@@ -0,0 +1,73 @@
+import os
+import sys
+import importlib
+from time import perf_counter
+from contextlib import contextmanager
+
+from loguru import logger
+
+
+# heavy dependencies that are imported lazily, in the order they
+# usually get imported
+HEAVY_IMPORTS = ["numpy", "soundfile", "phonemizer", "torch", "fastapi", "uvicorn"]
+
+enabled = False
+_reported = False
+_phases = []
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+@contextmanager
+def phase(name):
+    """time a startup phase, for the --profile-startup report"""
+    t0 = perf_counter()
+    try:
+        yield
+    finally:
+        _phases.append((name, perf_counter() - t0))
+
+
+def time_imports(modules=HEAVY_IMPORTS):
+    """import 'modules' now (if they haven't been imported already) and
+    record how long each import took.
+
+    """
+
+    for name in modules:
+        if name in sys.modules:
+            continue
+        with phase(f"import {name}"):
+            importlib.import_module(name)
+
+
+def report():
+    global _reported
+    if not enabled or _reported:
+        return
+    _reported = True
+    width = max((len(name) for name, _ in _phases), default=0)
+    lines = [f"  {name.ljust(width)}  {seconds:7.3f}s" for name, seconds in _phases]
+    total = sum(seconds for _, seconds in _phases)
+    logger.info("startup profile:\n" + "\n".join(lines) + f"\n  {'total'.ljust(width)}  {total:7.3f}s")
+
+
+def rss():
+    """the resident memory of the process in bytes"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        # windows
+        return 0
+    # peak rather than current rss, in bytes on macos and kilobytes
+    # elsewhere. close enough where there is no /proc
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
@@ -0,0 +1,84 @@
+from math import gcd
+from functools import lru_cache
+
+import numpy
+
+
+@lru_cache()
+def _filter_table(up: int, down: int, zero_crossings: int):
+    """windowed-sinc (kaiser) polyphase filter table, one row of taps for
+    each of the 'up' output phases. returns (table, half_width).
+
+    """
+
+    # low-pass at the lower of the two nyquist frequencies (relative to
+    # the input rate), with a bit of headroom for the transition band
+    cutoff = min(1.0, up / down) * 0.95
+    half_width = int(numpy.ceil(zero_crossings / cutoff))
+
+    phases = numpy.arange(up, dtype=numpy.float64)[:, None] / up
+    k = numpy.arange(-half_width + 1, half_width + 1, dtype=numpy.float64)[None, :]
+    t = phases - k
+
+    window = numpy.i0(8.0 * numpy.sqrt(numpy.clip(1.0 - (t / half_width) ** 2, 0.0, 1.0))) / numpy.i0(8.0)
+    table = cutoff * numpy.sinc(cutoff * t) * window
+    # unity gain at DC for every phase
+    table /= table.sum(axis=1, keepdims=True)
+    return table.astype(numpy.float32), half_width
+
+
+class Resampler:
+    """vectorized polyphase resampler that can be fed audio in blocks,
+    keeping just enough of the input around to compute the next
+    output samples. the filter tables are cached per rate pair.
+
+    """
+
+    block_size = 16384
+
+    def __init__(self, src_rate: int, dst_rate: int, zero_crossings: int = 16) -> None:
+        g = gcd(src_rate, dst_rate)
+        self.up = dst_rate // g
+        self.down = src_rate // g
+        self.table, self.half_width = _filter_table(self.up, self.down, zero_crossings)
+        self.taps = numpy.arange(-self.half_width + 1, self.half_width + 1)
+
+        # absolute input index of self._buf[0], starting with zeros
+        # before the first sample
+        self._buf = numpy.zeros(self.half_width, dtype=numpy.float32)
+        self._offset = -self.half_width
+        self._n_in = 0
+        self._m = 0
+
+    def process(self, x, final: bool = False):
+        x = numpy.asarray(x, dtype=numpy.float32)
+        self._buf = numpy.concatenate([self._buf, x])
+        self._n_in += len(x)
+
+        if final:
+            last = -(-self._n_in * self.up // self.down)
+            self._buf = numpy.concatenate([self._buf, numpy.zeros(self.half_width, dtype=numpy.float32)])
+        else:
+            # outputs where all of the taps are already available
+            last = max(self._m, -(-(self._n_in - self.half_width) * self.up // self.down))
+
+        out = numpy.empty(last - self._m, dtype=numpy.float32)
+        for start in range(self._m, last, self.block_size):
+            m = numpy.arange(start, min(start + self.block_size, last))
+            i, p = numpy.divmod(m * self.down, self.up)
+            idx = i[:, None] + self.taps[None, :] - self._offset
+            out[start - self._m:start - self._m + len(m)] = (self._buf[idx] * self.table[p]).sum(axis=1)
+
+        self._m = last
+        drop = (last * self.down) // self.up - self.half_width + 1 - self._offset
+        if drop > 0:
+            self._buf = self._buf[drop:]
+            self._offset += drop
+        return out
+
+
+def resample(x, src_rate: int, dst_rate: int):
+    """resample a whole float array from 'src_rate' to 'dst_rate'"""
+    if src_rate == dst_rate:
+        return x
+    return Resampler(src_rate, dst_rate).process(x, final=True)
@@ -0,0 +1,120 @@
+import re
+from typing import List
+
+from glados_tts.utils.cleaners import english_cleaners
+
+
+# sentence ends, followed by whitespace
+_sentence_re = re.compile(r'(?<=[.!?…])\s+')
+# weaker boundaries inside of a sentence, followed by whitespace
+_clause_re = re.compile(r'(?<=[,;:—)])\s+')
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in _sentence_re.split(text) if s.strip()]
+
+
+def _split_long(text: str, max_chars: int) -> List[str]:
+    """split a single sentence that is over the budget, first at clause
+    boundaries and then (as a last resort) at whitespace.
+
+    """
+
+    if len(text) <= max_chars:
+        return [text]
+
+    clauses = [c for c in _clause_re.split(text) if c]
+    if len(clauses) == 1:
+        clauses = text.split()
+
+    pieces = []
+    for clause in clauses:
+        if len(clause) > max_chars and clause != text:
+            pieces.extend(_split_long(clause, max_chars))
+        else:
+            pieces.append(clause)
+    return _pack(pieces, max_chars)
+
+
+def _pack(pieces: List[str], max_chars: int) -> List[str]:
+    segments = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + 1 + len(piece) > max_chars:
+            segments.append(current)
+            current = piece
+        else:
+            current = f"{current} {piece}" if current else piece
+    if current:
+        segments.append(current)
+    return segments
+
+
+def segment_text(text: str, max_tokens: int) -> List[str]:
+    """split text into segments at sentence boundaries (or at punctuation
+    and whitespace for very long sentences), packing consecutive
+    sentences together as long as they fit in 'max_tokens'.
+
+    the token count is estimated from the length of the text, since
+    the phoneme tokens are roughly one per character, and the real
+    count is only known after the (expensive) phonemization step.
+
+    """
+
+    return _pack(sentence_segments(text, max_tokens), max_tokens)
+
+
+def sentence_segments(text: str, max_tokens: int) -> List[str]:
+    """the sentences in 'text', with sentences over 'max_tokens' split up
+    (like segment_text, but without packing sentences together)
+
+    """
+
+    pieces = []
+    for sentence in split_sentences(text):
+        pieces.extend(_split_long(sentence, max_tokens))
+    return pieces
+
+
+class SentenceSplitter:
+    """split_sentences for text that arrives in fragments (from an LLM, for
+    example): feed() returns the sentences that are complete so far,
+    and holds on to the rest until more text arrives or flush() is
+    called. a sentence is only complete once the whitespace after its
+    punctuation has arrived, so "3." isn't cut off from ".14". text
+    that goes on for more than 'max_chars' without a sentence end is
+    split at clause boundaries or whitespace instead.
+
+    """
+
+    def __init__(self, max_chars: int = 200):
+        self.max_chars = max_chars
+        self.buf = ""
+
+    def feed(self, fragment: str) -> List[str]:
+        self.buf += fragment
+        *complete, self.buf = _sentence_re.split(self.buf)
+        sentences = [s.strip() for s in complete if s.strip()]
+
+        if len(self.buf) > self.max_chars:
+            # the last piece might still be growing
+            trailing = " " if self.buf[-1].isspace() else ""
+            *pieces, self.buf = _split_long(self.buf, self.max_chars)
+            self.buf += trailing
+            sentences.extend(pieces)
+        return sentences
+
+    def flush(self) -> List[str]:
+        text, self.buf = self.buf.strip(), ""
+        return [text] if text else []
+
+
+def estimate_tokens(text: str) -> int:
+    """estimate the number of phoneme tokens for 'text' without running
+    espeak: roughly one per character, after numbers, units and
+    abbreviations are spelled out (so "10000000" counts as "ten
+    million").
+
+    """
+
+    return len(english_cleaners(text))
@@ -1,17 +1,45 @@
-import torch
+from typing import Optional, List
 
 from glados_tts.utils.cleaners import Cleaner
 from glados_tts.utils.tokenizer import Tokenizer
+from glados_tts.utils.lexicon import Lexicon
 
 
-def prepare_text(text: str) -> str:
+def text_to_tokens(text: str, lexicon: Optional[Lexicon] = None) -> List[int]:
+    """the text frontend: cleaning, phonemization and tokenization"""
     if not ((text[-1] == '.') or (text[-1] == '?') or (text[-1] == '!')):
         text = text + '.'
-    cleaner = Cleaner('english_cleaners', True, 'en-us')
+    cleaner = Cleaner('english_cleaners', True, 'en-us', lexicon)
     tokenizer = Tokenizer()
-    return torch.as_tensor(tokenizer(cleaner(text)), dtype=torch.int, device='cpu').unsqueeze(0)
+    return tokenizer(cleaner(text))
+
+
+def prepare_tokens(text: str, lexicon: Optional[Lexicon] = None):
+    """the token array for 'text', shaped (1, n), that the inference
+    backends take.
+
+    """
+    import numpy
+    return numpy.asarray(text_to_tokens(text, lexicon), dtype=numpy.int32).reshape(1, -1)
+
+
+def prepare_text(text: str, lexicon: Optional[Lexicon] = None) -> str:
+    import torch
+    return torch.as_tensor(text_to_tokens(text, lexicon), dtype=torch.int, device='cpu').unsqueeze(0)
 
 
 def iterfile(file_path):
     with open(file_path, mode='rb') as f:
         yield from f
+
+
+def iterbuffer(buf, chunk_size=65536):
+    """iterate over an in-memory audio buffer, releasing it at the end"""
+    try:
+        # the view has to be released first, a pooled buffer can't grow
+        # while it is exported
+        with buf.getbuffer() as view:
+            for i in range(0, len(view), chunk_size):
+                yield bytes(view[i:i+chunk_size])
+    finally:
+        buf.release()
@@ -0,0 +1,151 @@
+import os
+import threading
+import collections
+
+from loguru import logger
+
+
+# the voice of the models configured with --acoustic-model and
+# --vocoder-model, which is always loaded
+DEFAULT_VOICE = "glados"
+
+# voices for model files that are shipped in the package's models dir,
+# added if the files are there. the model names are without the
+# extension, which is the one of the inference backend
+BUILTIN_VOICES = {
+    "glados-lq": {
+        "vocoder_model": "vocoder-cpu-lq",
+        "description": "GLaDOS with the low quality vocoder, for mobile and slow cpus",
+    },
+}
+
+
+class Voice:
+    def __init__(self, name, acoustic_model, vocoder_model, description=None, preload=False, degraded_voice=None):
+        self.name = name
+        self.acoustic_model = acoustic_model
+        self.vocoder_model = vocoder_model
+        self.description = description or name
+        self.preload = preload
+        # the faster voice to switch to under load
+        self.degraded_voice = degraded_voice
+
+    @classmethod
+    def from_config(cls, name, config, models_dir, default_acoustic, default_vocoder):
+        """a voice from the 'voices' section of the config file, model
+        paths are relative to the package's models dir and default to the
+        models of the default voice.
+
+        """
+
+        def path(key, default):
+            value = config.get(key)
+            if value is None:
+                return default
+            return value if os.path.isabs(value) else os.path.join(models_dir, value)
+
+        return cls(
+            name,
+            path("acoustic_model", default_acoustic),
+            path("vocoder_model", default_vocoder),
+            description=config.get("description"),
+            preload=config.get("preload", False),
+            degraded_voice=config.get("degraded_voice"),
+        )
+
+
+class VoiceRegistry:
+    """the voices (besides the default one) that can be asked for by name,
+    loaded by 'load(voice)' when they are first used. loaded voices
+    are kept in least recently used order, and the least recently used
+    ones are unloaded (once the requests using them are done) when the
+    models take up more than 'memory_budget' bytes. 'reserved()' is the
+    memory that is always taken (by the default voice). a budget of 0
+    means no limit.
+
+    """
+
+    def __init__(self, load, memory_budget=0, reserved=lambda: 0):
+        self.voices = {}
+        self.memory_budget = memory_budget
+        self._load = load
+        self._reserved = reserved
+        self._resident = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._loading = collections.defaultdict(threading.Lock)
+        self.loads = 0
+        self.evictions = 0
+
+    def add(self, voice):
+        self.voices[voice.name] = voice
+
+    def __contains__(self, name):
+        return name in self.voices
+
+    def names(self):
+        return list(self.voices)
+
+    def acquire(self, name):
+        """the model pair for the voice 'name', loaded if needed and
+        acquired for a request (release() it when done).
+
+        """
+
+        with self._lock:
+            models = self._resident.get(name)
+            if models is not None:
+                self._resident.move_to_end(name)
+                return models.acquire()
+            loading = self._loading[name]
+
+        # only one thread loads a voice, the others wait for it
+        with loading:
+            with self._lock:
+                models = self._resident.get(name)
+                if models is not None:
+                    self._resident.move_to_end(name)
+                    return models.acquire()
+
+            models = self._load(self.voices[name])
+            with self._lock:
+                self.loads += 1
+                self._resident[name] = models
+                models.acquire()
+                self._evict(keep=name)
+            return models
+
+    def _used(self):
+        return self._reserved() + sum(m.nbytes() for m in self._resident.values())
+
+    def _evict(self, keep):
+        # called with the lock held
+        if not self.memory_budget:
+            return
+        while self._used() > self.memory_budget:
+            victim = next((n for n in self._resident if n != keep), None)
+            if victim is None:
+                logger.warning(f"voice '{keep}' doesn't fit in the memory budget of {self.memory_budget} bytes")
+                return
+            models = self._resident.pop(victim)
+            self.evictions += 1
+            logger.info(f"unloading voice '{victim}' ({models.in_flight} request(s) still using it)")
+            threading.Thread(target=self._unload, args=(models,), name=f"glados-unload-{victim}", daemon=True).start()
+
+    @staticmethod
+    def _unload(models):
+        models.wait_drained()
+        models.unload()
+
+    def resident(self):
+        with self._lock:
+            return {name: models.nbytes() for name, models in self._resident.items()}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "memory_budget": self.memory_budget,
+                "memory_used": self._used(),
+                "resident": list(self._resident),
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,272 @@
+import json
+import asyncio
+import functools
+
+from loguru import logger
+
+from glados_tts import __version__
+from glados_tts.engine import GLaDOS, GLaDOSError
+from glados_tts.utils.segment import SentenceSplitter, split_sentences
+
+
+# the wyoming protocol (https://github.com/rhasspy/wyoming) that home
+# assistant voice pipelines speak: a json header line per event,
+# optionally followed by more json data and a binary payload
+WYOMING_VERSION = "1.5.4"
+# 16-bit mono pcm
+SAMPLE_WIDTH = 2
+CHANNELS = 1
+SAMPLES_PER_CHUNK = 1024
+
+ATTRIBUTION = {"name": "glados-tts", "url": "https://git.sudo.is/ben/glados-tts"}
+
+
+async def read_event(reader):
+    """returns (type, data, payload), or None at the end of the stream.
+    raises ValueError for a malformed event, after reading all of it (as
+    far as the header can be trusted), so the next event can be read.
+
+    """
+
+    line = await reader.readline()
+    if not line:
+        return None
+    header = json.loads(line)
+    if not isinstance(header, dict) or not isinstance(header.get("type"), str):
+        raise ValueError("the event header must be an object with a 'type'")
+    data_length, payload_length = (header.get(k) or 0 for k in ("data_length", "payload_length"))
+    if not all(isinstance(n, int) and n >= 0 for n in (data_length, payload_length)):
+        raise ValueError("'data_length' and 'payload_length' must be non-negative integers")
+    data_bytes = await reader.readexactly(data_length)
+    payload = await reader.readexactly(payload_length) if payload_length else None
+    data = header.get("data") or {}
+    more_data = json.loads(data_bytes) if data_bytes else {}
+    if not isinstance(data, dict) or not isinstance(more_data, dict):
+        raise ValueError("the event data must be an object")
+    data.update(more_data)
+    return header["type"], data, payload
+
+
+async def write_event(writer, event_type, data=None, payload=None):
+    header = {"type": event_type, "version": WYOMING_VERSION}
+    data_bytes = json.dumps(data).encode() if data else b""
+    if data_bytes:
+        header["data_length"] = len(data_bytes)
+    if payload:
+        header["payload_length"] = len(payload)
+    writer.write(json.dumps(header).encode() + b"\n" + data_bytes + (payload or b""))
+    await writer.drain()
+
+
+def info(glados):
+    voices = [{
+        "name": voice["name"],
+        "description": voice["description"],
+        "attribution": ATTRIBUTION,
+        "installed": True,
+        "version": __version__,
+        "languages": ["en"],
+    } for voice in glados.list_voices()]
+    return {
+        "tts": [{
+            "name": "glados-tts",
+            "description": "GLaDOS Text-to-speech",
+            "attribution": ATTRIBUTION,
+            "installed": True,
+            "version": __version__,
+            "voices": voices,
+            "supports_synthesize_streaming": True,
+        }],
+        "asr": [], "handle": [], "intent": [], "wake": [], "mic": [], "snd": [],
+    }
+
+
+class WyomingHandler:
+    """one client connection. 'synthesize' events are split into
+    sentences, and each sentence is rendered as raw pcm (from the cache
+    if it was rendered before) and sent as audio-chunk events as soon
+    as it is ready, so playback starts after the first sentence.
+
+    with streaming synthesis (synthesize-start, synthesize-chunk, ..,
+    synthesize-stop), text is synthesized sentence by sentence as the
+    chunks arrive.
+
+    """
+
+    def __init__(self, glados, reader, writer):
+        self.glados = glados
+        self.reader = reader
+        self.writer = writer
+        self.splitter = None
+        self.sample_rate = None
+        self.voice = None
+
+    async def run(self):
+        peer = self.writer.get_extra_info("peername")
+        logger.debug(f"wyoming: client connected: {peer}")
+        try:
+            while True:
+                try:
+                    event = await read_event(self.reader)
+                except ValueError as e:
+                    logger.warning(f"wyoming: malformed event: {e}")
+                    await self.error(f"malformed event: {e}", "invalid-event")
+                    continue
+                if event is None:
+                    break
+                await self.handle_event(*event)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.writer.close()
+            logger.debug(f"wyoming: client disconnected: {peer}")
+
+    async def handle_event(self, event_type, data, payload):
+        """handle one event, errors are sent to the client as an 'error'
+        event instead of closing the connection.
+
+        """
+
+        try:
+            await self.handle(event_type, data, payload)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            raise
+        except ValueError as e:
+            logger.warning(f"wyoming: invalid '{event_type}' event: {e}")
+            await self.error(str(e), "invalid-event")
+        except Exception as e:
+            logger.opt(exception=e).error(f"wyoming: failed to handle '{event_type}' event")
+            await self.error("internal error", "internal-error")
+
+    async def error(self, text, code):
+        await write_event(self.writer, "error", {"text": text, "code": code})
+
+    async def handle(self, event_type, data, payload):
+        if event_type == "describe":
+            await write_event(self.writer, "info", info(self.glados))
+
+        elif event_type == "synthesize":
+            if self.splitter is not None:
+                # the final text of a streaming synthesis, which has
+                # already been synthesized from the chunks
+                return
+            self.voice = self.voice_name(data)
+            await self.audio_start()
+            for sentence in split_sentences(data.get("text", "")):
+                await self.say(sentence)
+            await self.audio_stop()
+
+        elif event_type == "synthesize-start":
+            self.splitter = SentenceSplitter(self.glados.segment_max_tokens)
+            self.voice = self.voice_name(data)
+            await self.audio_start()
+
+        elif event_type == "synthesize-chunk" and self.splitter is not None:
+            for sentence in self.splitter.feed(data.get("text", "")):
+                await self.say(sentence)
+
+        elif event_type == "synthesize-stop" and self.splitter is not None:
+            for sentence in self.splitter.flush():
+                await self.say(sentence)
+            self.splitter = None
+            await self.audio_stop()
+            await write_event(self.writer, "synthesize-stopped")
+
+        else:
+            logger.debug(f"wyoming: ignoring event: '{event_type}'")
+
+    def voice_name(self, data):
+        """the voice asked for, unknown voices get the default voice"""
+        voice = data.get("voice") or {}
+        if not isinstance(voice, dict):
+            raise ValueError("'voice' must be an object")
+        name = voice.get("name")
+        if name is not None and name != self.glados.default_voice and name not in self.glados.voices:
+            logger.warning(f"wyoming: unknown voice '{name}', using the default voice")
+            return None
+        return name
+
+    def audio_format(self):
+        return {"rate": self.sample_rate, "width": SAMPLE_WIDTH, "channels": CHANNELS}
+
+    async def audio_start(self):
+        self.sample_rate = self.glados.get_encoder("pcm").output_rate(self.glados.sample_rate)
+        await write_event(self.writer, "audio-start", self.audio_format())
+
+    async def audio_stop(self):
+        await write_event(self.writer, "audio-stop", self.audio_format())
+
+    async def say(self, sentence):
+        loop = asyncio.get_running_loop()
+        render = functools.partial(
+            self.glados.tts_to_memory, sentence, "pcm", True, self.sample_rate, "interactive", self.voice)
+        try:
+            g, buf = await loop.run_in_executor(None, render)
+        except GLaDOSError as e:
+            logger.warning(f"wyoming: failed to synthesize '{sentence}': {e}")
+            await self.error(str(e), "synthesis-failed")
+            return
+        except Exception as e:
+            # the other sentences (and the audio-stop) are still sent
+            logger.opt(exception=e).error(f"wyoming: failed to synthesize '{sentence}'")
+            await self.error("internal error", "synthesis-failed")
+            return
+
+        chunk_size = SAMPLES_PER_CHUNK * SAMPLE_WIDTH
+        if buf is not None:
+            # a fresh render (or a pending write) is sent straight from memory
+            try:
+                with buf.getbuffer() as view:
+                    for i in range(0, len(view), chunk_size):
+                        await write_event(
+                            self.writer, "audio-chunk", self.audio_format(), bytes(view[i:i+chunk_size]))
+            finally:
+                buf.release()
+        else:
+            content = await loop.run_in_executor(None, self._read_cached, g.audio_filename)
+            for i in range(0, len(content), chunk_size):
+                await write_event(self.writer, "audio-chunk", self.audio_format(), content[i:i+chunk_size])
+
+    def _read_cached(self, fname):
+        return b"".join(self.glados.get_audiofile_iter(fname))
+
+
+async def serve(host, port):
+    glados = GLaDOS.get()
+    glados.load_models_background()
+
+    async def handle_client(reader, writer):
+        await WyomingHandler(glados, reader, writer).run()
+
+    server = await asyncio.start_server(handle_client, host, port)
+    logger.info(f"wyoming server listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+async def synthesize(host, port, text, voice="glados"):
+    """a minimal wyoming client, returns the sample rate and the pcm audio
+    for 'text'.
+
+    """
+
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        await write_event(writer, "synthesize", {"text": text, "voice": {"name": voice}})
+        rate = None
+        audio = bytearray()
+        while True:
+            event = await read_event(reader)
+            if event is None:
+                raise ConnectionError("the server closed the connection")
+            event_type, data, payload = event
+            if event_type == "audio-start":
+                rate = data["rate"]
+            elif event_type == "audio-chunk":
+                audio += payload
+            elif event_type == "error":
+                raise GLaDOSError(data.get("text"))
+            elif event_type == "audio-stop":
+                return rate, bytes(audio)
+    finally:
+        writer.close()
@@ -0,0 +1,46 @@
+from types import SimpleNamespace
+
+import pytest
+
+from glados_tts.admission import AdmissionControl, AdmissionError
+from glados_tts.restapi import client_key, request_priority
+
+
+API_KEYS = {"home-assistant-key": "interactive"}
+
+
+def request(host="10.0.0.1", api_key=None):
+    headers = {"x-api-key": api_key} if api_key is not None else {}
+    return SimpleNamespace(headers=headers, client=SimpleNamespace(host=host))
+
+
+def test_client_key():
+    assert client_key(request(), API_KEYS) == "ip:10.0.0.1"
+    assert client_key(request(api_key="home-assistant-key"), API_KEYS) == "key:home-assistant-key"
+    # keys that aren't configured are no identity
+    assert client_key(request(api_key="made-up"), API_KEYS) == "ip:10.0.0.1"
+
+
+def test_made_up_keys_share_the_ip_rate_limit():
+    admission = AdmissionControl(None, rate=0.001, burst=2)
+    for i in range(2):
+        admission.check_rate(client_key(request(api_key=f"fake-{i}"), API_KEYS))
+    with pytest.raises(AdmissionError) as e:
+        admission.check_rate(client_key(request(api_key="fake-3"), API_KEYS))
+    assert e.value.status_code == 429
+
+    # other clients have their own bucket
+    admission.check_rate(client_key(request(host="10.0.0.2"), API_KEYS))
+    admission.check_rate(client_key(request(api_key="home-assistant-key"), API_KEYS))
+
+
+def test_priority_header_is_capped_without_a_key():
+    priority = request_priority("normal", API_KEYS)
+
+    assert priority(None, None) == "normal"
+    assert priority("bulk", None) == "bulk"
+    assert priority("interactive", None) == "normal"
+    assert priority("interactive", "made-up") == "normal"
+    assert priority(None, "home-assistant-key") == "interactive"
+    # routes that are interactive anyway stay that way
+    assert request_priority("interactive", API_KEYS)("interactive", None) == "interactive"
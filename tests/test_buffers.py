@@ -0,0 +1,41 @@
+from glados_tts.utils.buffers import BufferPool
+from glados_tts.utils.tools import iterbuffer
+
+
+def test_reuse():
+    pool = BufferPool(size=2, capacity=16, max_capacity=64)
+    buf = pool.get()
+    buf.write(b"a" * 32)
+    assert b"".join(iterbuffer(buf, 10)) == b"a" * 32
+    assert len(pool) == 1
+
+    # the same buffer, and it can grow again
+    assert pool.get() is buf
+    buf.write(b"b" * 64)
+    assert bytes(buf.getbuffer()) == b"b" * 64
+
+
+def test_large_buffers_are_dropped():
+    pool = BufferPool(size=2, capacity=16, max_capacity=64)
+    small, large = pool.get(), pool.get()
+    small.write(b"a" * 16)
+    large.write(b"a" * 100)
+    small.release()
+    large.release()
+
+    assert len(pool) == 1
+    assert pool.get() is small
+
+
+def test_view_is_released_first():
+    class GrowingPool(BufferPool):
+        def put(self, buf):
+            # fails if the buffer is still exported
+            buf.write(b"b" * buf.capacity)
+            super().put(buf)
+
+    pool = GrowingPool()
+    buf = pool.get()
+    buf.write(b"a" * 32)
+    assert b"".join(iterbuffer(buf, 10)) == b"a" * 32
+    assert len(pool) == 1
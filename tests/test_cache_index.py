@@ -0,0 +1,69 @@
+import pytest
+
+from glados_tts.engine import GLaDOS
+from glados_tts.storage import DirStorage
+from glados_tts.cacheindex import CacheIndex
+
+
+@pytest.fixture
+def glados(tmp_path):
+    glados = GLaDOS()
+    glados.storage = DirStorage(str(tmp_path))
+    glados.index = CacheIndex(str(tmp_path / ".index.db"))
+
+    def encode(f, text, encoder, sample_rate, priority, voice, degraded):
+        # a second of silence, instead of running the models
+        f.write(b"\0" * 1000)
+        return sample_rate
+
+    glados._encode = encode
+    return glados
+
+
+def render(glados, use_cache):
+    g, buf = glados.tts_audio_to_memory("Hello.", "wav", use_cache)
+    buf.release()
+    glados._write_behind.submit(lambda: None).result()
+    return g
+
+
+def test_uncached_render_is_not_indexed(glados):
+    g = render(glados, use_cache=False)
+
+    assert not glados.storage.exists(g.audio_filename)
+    assert glados.index.stats()["entries"] == 0
+
+
+def test_persisted_render_is_indexed(glados):
+    glados.persist_uncached = True
+    g = render(glados, use_cache=False)
+
+    assert glados.storage.exists(g.audio_filename)
+    stats = glados.index.stats()
+    assert stats["entries"] == 1
+    assert stats["total_size"] == 1000
+
+
+def test_evicted_right_after_the_render(glados, monkeypatch):
+    monkeypatch.setattr(glados.storage, "stat", lambda fname: None)
+    g = glados.tts_audio_to_file("Hello.", "wav", True)
+
+    assert not g.from_cache
+    assert glados.index.stats()["entries"] == 0
+
+
+def test_evicted_while_looked_up(glados, monkeypatch):
+    glados.tts_audio_to_file("Hello.", "wav", True)
+    stat = glados.storage.stat
+
+    def stat_and_evict(fname):
+        # evicted right after the lookup
+        st = stat(fname)
+        glados.storage.delete(fname)
+        return st
+
+    monkeypatch.setattr(glados.storage, "stat", stat_and_evict)
+    g = glados.tts_audio_to_file("Hello.", "wav", True)
+
+    assert g.from_cache
+    assert glados.index.stats()["entries"] == 1
@@ -0,0 +1,45 @@
+import numpy
+import pytest
+
+from glados_tts.engine import GLaDOS
+from glados_tts.utils import tools
+
+
+@pytest.fixture
+def frontend_calls(monkeypatch):
+    calls = []
+
+    def prepare_tokens(text, lexicon=None):
+        # stands in for cleaning and espeak
+        calls.append(text)
+        return numpy.array([[len(word) for word in text.lower().strip(".").split()]], dtype=numpy.int64)
+
+    monkeypatch.setattr(tools, "prepare_tokens", prepare_tokens)
+    return calls
+
+
+@pytest.fixture
+def glados():
+    glados = GLaDOS()
+    glados.canonical_keys = True
+    return glados
+
+
+def test_equivalent_texts_share_a_name(glados, frontend_calls):
+    assert glados._make_fname("Door open.", "wav") == glados._make_fname("door  open", "wav")
+    assert glados._make_fname("Door open.", "wav") != glados._make_fname("Door closed.", "wav")
+
+
+def test_render_reuses_the_tokens_of_the_key(glados, frontend_calls):
+    glados._make_fname("Hello there.", "wav")
+    tokens = glados._prepare("Hello there.")
+
+    assert frontend_calls == ["Hello there."]
+    assert tokens.tolist() == [[5, 5]]
+
+    # the tokens are only handed out once, later renders prepare again
+    glados._prepare("Hello there.")
+    assert frontend_calls == ["Hello there.", "Hello there."]
+    # the key itself is memoized
+    glados._make_fname("Hello there.", "wav")
+    assert len(frontend_calls) == 2
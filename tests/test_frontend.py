@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from glados_tts.frontend import Frontend
+from glados_tts.utils import tools
+from glados_tts.utils.lexicon import Lexicon
+
+
+# every word is in the lexicon, so espeak isn't needed
+OVERRIDES = {
+    "hello": "həloʊ",
+    "there": "ðɛɹ",
+    "the": "ðə",
+    "cake": "keɪk",
+    "is": "ɪz",
+    "a": "ə",
+    "lie": "laɪ",
+}
+TEXTS = ["Hello there.", "The cake is a lie!", "Hello, hello, hello."]
+
+
+@pytest.fixture(scope="module")
+def overrides_path(tmp_path_factory):
+    path = tmp_path_factory.mktemp("lexicon") / "overrides.json"
+    path.write_text(json.dumps(OVERRIDES))
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def frontend(overrides_path):
+    frontend = Frontend(2, None, overrides_path)
+    yield frontend
+    frontend.shutdown()
+
+
+def expected(overrides_path, text):
+    return tools.prepare_tokens(text, Lexicon.from_files(None, overrides_path))
+
+
+def test_prepare(frontend, overrides_path):
+    for text in TEXTS:
+        tokens = frontend.prepare(text)
+        assert tokens.shape == expected(overrides_path, text).shape
+        assert (tokens == expected(overrides_path, text)).all()
+
+
+def test_prepare_iter(frontend, overrides_path):
+    texts = TEXTS * 5
+    results = list(frontend.prepare_iter(texts, batch_size=3, lookahead=2))
+
+    assert len(results) == len(texts)
+    for text, tokens in zip(texts, results):
+        assert (tokens == expected(overrides_path, text)).all()
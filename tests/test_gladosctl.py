@@ -0,0 +1,52 @@
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from glados_tts import gladosctl
+from glados_tts.engine import GLaDOS
+
+
+@pytest.fixture
+def glados(monkeypatch):
+    glados = GLaDOS()
+    monkeypatch.setattr(GLaDOS, "get", classmethod(lambda cls: glados))
+    return glados
+
+
+def run(tmp_path, *args):
+    config = tmp_path / "glados.json"
+    config.write_text("{}")
+    result = CliRunner().invoke(gladosctl.cli, [
+        "--config", str(config), "--audio-dir", str(tmp_path / "audio"), "--cache-index",
+        "--cache-index-path", str(tmp_path / "index.db"), *args])
+    assert result.exit_code == 0, result.output
+    return result
+
+
+def test_cache_migrate(tmp_path, glados):
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "a.wav").write_bytes(b"a")
+    run(tmp_path, "cache", "migrate", str(src), f"sharded:{tmp_path / 'dst'}")
+
+    assert not glados.started
+    assert not (tmp_path / "audio").exists()
+    assert not (tmp_path / "index.db").exists()
+
+
+def test_lexicon_lookup(tmp_path, glados):
+    overrides = tmp_path / "overrides.json"
+    overrides.write_text(json.dumps({"glados": "ɡlˈædɑːs"}))
+    result = run(tmp_path, "--lexicon-overrides", str(overrides), "lexicon", "lookup", "glados")
+
+    assert "ɡlˈædɑːs" in result.output
+    assert not glados.started
+    assert not (tmp_path / "audio").exists()
+
+
+def test_cache_evict(tmp_path, glados):
+    run(tmp_path, "cache", "evict", "--max-size-mb", "1")
+
+    assert glados.started
+    assert glados.index is not None
@@ -0,0 +1,58 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from glados_tts.restapi import create_jobs_router
+
+
+class StubJobs:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, text, audio_format, sample_rate, use_cache, priority, webhook, voice):
+        self.submitted.append(webhook)
+        return {
+            "id": "1", "state": "queued", "progress": 0.0, "text": text, "audio_format": audio_format,
+            "use_cache": use_cache, "priority": priority, "webhook": webhook, "created": 0,
+        }
+
+
+@pytest.fixture
+def jobs():
+    return StubJobs()
+
+
+@pytest.fixture
+def client(jobs):
+    app = FastAPI()
+    router = create_jobs_router(jobs, api_keys={"batch-key": "bulk"}, webhook_hosts=["hooks.example.com"])
+    app.include_router(router, prefix="/jobs")
+    return TestClient(app)
+
+
+def submit(client, webhook, **headers):
+    return client.post("/jobs", json={"text": "Hello.", "webhook": webhook}, headers=headers)
+
+
+@pytest.mark.parametrize("webhook", ["file:///etc/passwd", "ftp://hooks.example.com/x", "gopher://localhost/"])
+def test_webhook_must_be_http(client, jobs, webhook):
+    assert submit(client, webhook, **{"X-API-Key": "batch-key"}).status_code == 422
+    assert jobs.submitted == []
+
+
+def test_webhook_host_allowlist(client, jobs):
+    assert submit(client, "https://hooks.example.com/done").status_code == 202
+    assert submit(client, "http://169.254.169.254/latest/meta-data").status_code == 403
+    assert submit(client, "http://localhost:8124/admin/reload").status_code == 403
+    assert jobs.submitted == ["https://hooks.example.com/done"]
+
+
+def test_webhook_with_api_key(client, jobs):
+    assert submit(client, "http://localhost:9000/hook", **{"X-API-Key": "made-up"}).status_code == 403
+    assert submit(client, "http://localhost:9000/hook", **{"X-API-Key": "batch-key"}).status_code == 202
+    assert jobs.submitted == ["http://localhost:9000/hook"]
+
+
+def test_no_webhook(client, jobs):
+    assert client.post("/jobs", json={"text": "Hello."}).status_code == 202
+    assert jobs.submitted == [None]
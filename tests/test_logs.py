@@ -0,0 +1,31 @@
+import pytest
+from loguru import logger
+
+from glados_tts.utils.logs import RequestLog
+
+
+@pytest.fixture
+def records():
+    records = []
+    handler = logger.add(lambda message: records.append(message.record), level="DEBUG")
+    yield records
+    logger.remove(handler)
+
+
+def test_request_lines_are_debug(records):
+    log = RequestLog(interval=0)
+    log.record("Hello there.", 0.5, voice="glados")
+    log.record("Hello there.", 0.01, from_cache=True, voice="glados")
+    log.summary()
+
+    assert [(r["level"].name, r["message"].split(":")[0]) for r in records] == [
+        ("DEBUG", "request"), ("DEBUG", "request"), ("INFO", "summary")]
+    assert records[-1]["extra"]["requests"] == 2
+    assert records[-1]["extra"]["from_cache"] == 1
+
+
+def test_no_sample(records):
+    log = RequestLog(sample=0.0, interval=0)
+    log.record("Hello there.", 0.5)
+
+    assert records == []
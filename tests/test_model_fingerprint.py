@@ -0,0 +1,33 @@
+from glados_tts.engine import GLaDOS, MODELS_FINGERPRINT
+from glados_tts.modelpair import fingerprint
+
+
+def write_models(tmp_path, version):
+    paths = tmp_path / f"glados-{version}.pt", tmp_path / f"vocoder-{version}.pt"
+    for path in paths:
+        path.write_bytes(f"{path.name} weights".encode())
+    return [str(p) for p in paths]
+
+
+def start(tmp_path, models):
+    glados = GLaDOS()
+    glados.start(str(tmp_path / "audio"), acoustic_model=models[0], vocoder_model=models[1])
+    return glados
+
+
+def test_new_models_keep_their_own_filenames_after_a_restart(tmp_path):
+    old, new = write_models(tmp_path, "v1"), write_models(tmp_path, "v2")
+
+    glados = start(tmp_path, old)
+    old_fname = glados._make_fname("Hello.", "wav", None, None)
+    assert glados.storage.exists(MODELS_FINGERPRINT)
+
+    # a hot reload to the new models
+    glados._check_fingerprint(fingerprint(*new))
+    new_fname = glados._make_fname("Hello.", "wav", None, None)
+    assert new_fname != old_fname
+
+    # restarted with the new models configured
+    assert start(tmp_path, new)._make_fname("Hello.", "wav", None, None) == new_fname
+    # and back to the old ones
+    assert start(tmp_path, old)._make_fname("Hello.", "wav", None, None) == old_fname
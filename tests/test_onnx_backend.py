@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+import glados_tts
+from glados_tts.modelpair import TorchScriptModels, OnnxModels, compare_backends
+from glados_tts.utils import tools
+
+
+MODELS_DIR = os.path.join(os.path.dirname(glados_tts.__file__), "models")
+TOLERANCE = 1e-3
+
+
+def model_paths(backend):
+    paths = [os.path.join(MODELS_DIR, f) for f in backend.default_models]
+    missing = [p for p in paths if not os.path.exists(p)]
+    if missing:
+        pytest.skip(f"missing models: {missing}")
+    return paths
+
+
+@pytest.fixture(scope="module")
+def backends():
+    pytest.importorskip("torch")
+    pytest.importorskip("onnxruntime")
+    # export the onnx models with 'gladosctl onnx export' first
+    reference = TorchScriptModels(*model_paths(TorchScriptModels), 'cpu').load()
+    onnx = OnnxModels(*model_paths(OnnxModels), 'cpu').load()
+    return reference, onnx
+
+
+@pytest.mark.parametrize("text", [
+    "Hello.",
+    "Hello, and welcome to the Aperture Science computer-aided enrichment center.",
+    "The cake is a lie, but the 3 test chambers are real.",
+])
+def test_onnx_matches_torchscript(backends, text):
+    reference, onnx = backends
+    mel_diff, audio_diff = compare_backends(reference, onnx, tools.prepare_tokens(text))
+
+    assert mel_diff <= TOLERANCE
+    assert audio_diff <= TOLERANCE
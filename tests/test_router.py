@@ -0,0 +1,275 @@
+import socket
+import asyncio
+import threading
+from types import SimpleNamespace
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import click
+import pytest
+from fastapi import FastAPI, WebSocket
+from fastapi.testclient import TestClient
+
+from glados_tts.router import HashRing, Replica, Router, create_app
+
+
+def free_port():
+    # nothing listens on it once the socket is closed
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def ring(n=3, load_factor=1.25):
+    return HashRing([Replica(f"http://replica-{i}:8124") for i in range(n)], vnodes=50, load_factor=load_factor)
+
+
+def key_for(ring, replica):
+    """a key that hashes to 'replica' first"""
+    return next(k for k in (f"key-{i}" for i in range(10000)) if ring.candidates(k)[0] is replica)
+
+
+def test_candidates_are_every_replica_once():
+    r = ring()
+    for key in ("a", "b", "c"):
+        candidates = r.candidates(key)
+        assert sorted(c.url for c in candidates) == sorted(c.url for c in r.replicas)
+    assert r.candidates("a") == r.candidates("a")
+
+
+def test_acquire_follows_the_key():
+    r = ring()
+    for replica in r.replicas:
+        key = key_for(r, replica)
+        assert r.acquire(key) is replica
+        r.release(replica)
+        assert replica.in_flight == 0
+
+
+def test_bounded_load_spills_over():
+    r = ring(load_factor=1.0)
+    key = key_for(r, r.replicas[0])
+    picked = [r.acquire(key) for _ in range(9)]
+
+    # a hot key doesn't pile up on one replica
+    assert [p.in_flight for p in r.replicas] == [3, 3, 3]
+    # the spill goes to the next replicas on the ring
+    assert picked[:3] == r.candidates(key)
+
+    for p in picked:
+        r.release(p)
+    assert [p.in_flight for p in r.replicas] == [0, 0, 0]
+
+
+def test_acquire_skips_excluded_and_unhealthy():
+    r = ring()
+    first, second, third = r.candidates("key")
+    assert r.acquire("key", exclude=[first]) is second
+    second.healthy = False
+    assert r.acquire("key", exclude=[first]) is third
+
+
+def test_acquire_without_healthy_replicas():
+    r = ring()
+    assert r.acquire("key", exclude=r.replicas) is None
+    for replica in r.replicas:
+        replica.healthy = False
+    assert r.acquire("key") is None
+    assert [p.in_flight for p in r.replicas] == [0, 0, 0]
+
+
+class StubReplica:
+    """an http server that answers every request with 'status' and its
+    own name.
+
+    """
+
+    def __init__(self, name, status=200):
+        outer = self
+        self.requests = 0
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                outer.requests += 1
+                body = name.encode()
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def replicas():
+    started = []
+
+    def start(*args, **kwargs):
+        replica = StubReplica(*args, **kwargs)
+        started.append(replica)
+        return replica
+
+    yield start
+    for replica in started:
+        replica.close()
+
+
+def request(path="/audio/GLaDOS-hello_1234.wav"):
+    return SimpleNamespace(
+        url=SimpleNamespace(path=path, query=""), headers={}, client=SimpleNamespace(host="10.0.0.1"),
+        method="GET")
+
+
+def respond(response, disconnect=False):
+    """run an asgi response, returns the body that was sent"""
+
+    body = bytearray()
+
+    async def receive():
+        if not disconnect:
+            # wait until the response is sent
+            await asyncio.sleep(3600)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if disconnect:
+            raise OSError("the client went away")
+        body.extend(message.get("body", b""))
+
+    async def run():
+        try:
+            await response({"type": "http"}, receive, send)
+        except Exception:
+            # the error from send(), in an exception group
+            assert disconnect
+
+    asyncio.run(run())
+    return bytes(body)
+
+
+def router_for(*urls):
+    router = Router(urls, vnodes=50)
+    by_url = {r.url: r for r in router.ring.replicas}
+    return router, [by_url[url.rstrip("/")] for url in urls]
+
+
+def test_proxy_fails_over(replicas):
+    live = replicas("live")
+    router, (dead, alive) = router_for(f"http://127.0.0.1:{free_port()}", live.url)
+    key = key_for(router.ring, dead)
+
+    response = asyncio.run(router.proxy(request(), key))
+    assert response.status_code == 200
+    assert response.headers["GLaDOS-replica"] == alive.url
+    assert respond(response) == b"live"
+    assert not dead.healthy
+    assert dead.in_flight == alive.in_flight == 0
+
+
+def test_proxy_without_replicas():
+    router, (dead,) = router_for(f"http://127.0.0.1:{free_port()}")
+    response = asyncio.run(router.proxy(request(), "key"))
+    assert response.status_code == 503
+    assert dead.in_flight == 0
+
+
+def test_proxy_retries_not_found(replicas):
+    missing, found = replicas("missing", status=404), replicas("found")
+    router, (first, second) = router_for(missing.url, found.url)
+    key = key_for(router.ring, first)
+
+    response = asyncio.run(router.proxy(request(), key))
+    assert respond(response) == b"missing"
+
+    response = asyncio.run(router.proxy(request(), key, retry_not_found=True))
+    assert respond(response) == b"found"
+    assert first.healthy and second.healthy
+    assert first.in_flight == second.in_flight == 0
+
+
+def test_proxy_releases_when_the_client_goes_away(replicas):
+    live = replicas("live")
+    router, (replica,) = router_for(live.url)
+
+    response = asyncio.run(router.proxy(request(), "key"))
+    assert replica.in_flight == 1
+    respond(response, disconnect=True)
+    assert replica.in_flight == 0
+
+
+class StubStreamReplica:
+    """a restapi replica with a /stream websocket that echoes messages
+    back, and closes after 'end'.
+
+    """
+
+    def __init__(self):
+        import uvicorn
+
+        app = FastAPI()
+
+        @app.get("/health")
+        async def health():
+            return {"status": "healthy"}
+
+        @app.websocket("/stream")
+        async def stream(websocket: WebSocket, audio_format: str = "pcm"):
+            await websocket.accept()
+            await websocket.send_json({"type": "hello", "audio_format": audio_format})
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+                if message.get("bytes") is not None:
+                    await websocket.send_bytes(message["bytes"][::-1])
+                elif message["text"] == "end":
+                    await websocket.close(code=1000)
+                    return
+                else:
+                    await websocket.send_text(message["text"].upper())
+
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+        self.thread.start()
+        while not self.server.started:
+            threading.Event().wait(0.01)
+
+    def close(self):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+def router_app(*urls):
+    ctx = click.Context(click.Command("router"))
+    ctx.meta["router"] = {"replica": list(urls), "vnodes": 50, "health_interval": 3600}
+    with ctx:
+        return create_app()
+
+
+def test_stream_is_routed():
+    pytest.importorskip("websockets")
+    replica = StubStreamReplica()
+    try:
+        # the first replica on the ring is down for some clients
+        app = router_app(f"http://127.0.0.1:{free_port()}", replica.url)
+        with TestClient(app) as client:
+            with client.websocket_connect("/stream?audio_format=wav") as ws:
+                assert ws.receive_json() == {"type": "hello", "audio_format": "wav"}
+                ws.send_text("hello")
+                assert ws.receive_text() == "HELLO"
+                ws.send_bytes(b"\x01\x02\x03")
+                assert ws.receive_bytes() == b"\x03\x02\x01"
+                ws.send_text("end")
+                assert ws.receive()["type"] == "websocket.close"
+    finally:
+        replica.close()
@@ -0,0 +1,131 @@
+import os
+import threading
+
+import pytest
+
+from glados_tts.storage import DirStorage, ShardedDirStorage, SQLiteStorage, migrate, storage_from_url
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    """an S3Storage on moto's in-process stand-in for S3"""
+    boto3 = pytest.importorskip("boto3")
+    moto = pytest.importorskip("moto")
+    for var in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"):
+        monkeypatch.setenv(var, "testing")
+    with moto.mock_aws():
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket="glados")
+        yield storage_from_url("s3://glados/audio?region_name=us-east-1")
+
+
+@pytest.fixture(params=["dir", "sharded", "sqlite", "s3"])
+def storage(request, tmp_path):
+    if request.param == "s3":
+        return request.getfixturevalue("s3")
+    if request.param == "sqlite":
+        return storage_from_url(f"sqlite:{tmp_path / 'cache.db'}")
+    return storage_from_url(f"{request.param}:{tmp_path}")
+
+
+def test_storage(storage):
+    assert not storage.exists("GLaDOS-a.wav")
+    assert storage.stat("GLaDOS-a.wav") is None
+
+    storage.write("GLaDOS-a.wav", b"a" * 100)
+    with storage.writer("GLaDOS-b.wav") as f:
+        f.write(b"b" * 200)
+
+    assert storage.stat("GLaDOS-a.wav").size == 100
+    assert storage.exists("GLaDOS-b.wav")
+    assert b"".join(storage.iter("GLaDOS-b.wav", chunk_size=64)) == b"b" * 200
+    assert sorted(storage.list()) == ["GLaDOS-a.wav", "GLaDOS-b.wav"]
+
+    storage.write("GLaDOS-a.wav", b"new")
+    with storage.open("GLaDOS-a.wav") as f:
+        assert f.read() == b"new"
+
+    storage.delete("GLaDOS-a.wav")
+    assert not storage.exists("GLaDOS-a.wav")
+    assert list(storage.list()) == ["GLaDOS-b.wav"]
+
+
+def test_missing_file(storage):
+    with pytest.raises(FileNotFoundError):
+        storage.open("GLaDOS-missing.wav")
+
+
+def test_s3_prefix(s3):
+    s3.write("GLaDOS-a.wav", b"a")
+    keys = [obj["Key"] for obj in s3._client.list_objects_v2(Bucket="glados")["Contents"]]
+    assert keys == ["audio/GLaDOS-a.wav"]
+
+
+@pytest.mark.parametrize("dst_url", ["sharded", "sqlite", "s3"])
+def test_migrate(tmp_path, request, dst_url):
+    src = DirStorage(str(tmp_path / "src"))
+    if dst_url == "s3":
+        dst = request.getfixturevalue("s3")
+    elif dst_url == "sqlite":
+        dst = SQLiteStorage(str(tmp_path / "cache.db"))
+    else:
+        dst = ShardedDirStorage(str(tmp_path / "dst"))
+    files = {f"GLaDOS-{i}.wav": bytes([i]) * (i + 1) * 1000 for i in range(5)}
+    for fname, data in files.items():
+        src.write(fname, data)
+    # already there, not copied again
+    dst.write("GLaDOS-0.wav", files["GLaDOS-0.wav"])
+
+    assert migrate(src, dst) == 4
+    assert sorted(dst.list()) == sorted(files)
+    for fname, data in files.items():
+        with dst.open(fname) as f:
+            assert f.read() == data
+    assert sorted(src.list()) == sorted(files)
+
+    assert migrate(src, dst, delete=True) == 0
+    assert list(src.list()) == []
+
+
+@pytest.mark.parametrize("cls", [DirStorage, ShardedDirStorage])
+def test_concurrent_writers(tmp_path, cls):
+    storage = cls(str(tmp_path))
+    fname = "GLaDOS-test.wav"
+    n = 8
+    barrier = threading.Barrier(n)
+    errors = []
+
+    def render(i):
+        try:
+            with storage.writer(fname) as f:
+                f.write(bytes([i]) * 1000)
+                # every writer has its file open at the same time
+                barrier.wait(timeout=10)
+                f.write(bytes([i]) * 1000)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=render, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    with storage.open(fname) as f:
+        data = f.read()
+    # the whole file of one of the writers, not a mix
+    assert len(data) == 2000
+    assert data == bytes([data[0]]) * 2000
+    assert list(storage.list()) == [fname]
+    assert not any(name.endswith(".part") for _, _, files in os.walk(str(tmp_path)) for name in files)
+
+
+def test_failed_write_leaves_nothing(tmp_path):
+    storage = DirStorage(str(tmp_path))
+    with pytest.raises(RuntimeError):
+        with storage.writer("GLaDOS-test.wav") as f:
+            f.write(b"partial")
+            raise RuntimeError("encoder failed")
+
+    assert not storage.exists("GLaDOS-test.wav")
+    assert os.listdir(str(tmp_path)) == []
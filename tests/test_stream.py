@@ -0,0 +1,75 @@
+import io
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from glados_tts import restapi
+from glados_tts.engine import GLaDOS
+
+
+class Buffer(io.BytesIO):
+    released = False
+
+    def release(self):
+        self.released = True
+
+
+class StubGLaDOS:
+    """renders every sentence as its own text, or fails for the ones
+    that contain 'boom'
+
+    """
+
+    audio_formats = ["pcm"]
+    default_voice = "glados"
+    voices = {}
+    segment_max_tokens = 200
+
+    def tts_to_memory(self, text, audio_format, use_cache, sample_rate, priority, voice):
+        if "boom" in text:
+            raise RuntimeError("the vocoder broke")
+        g = SimpleNamespace(
+            from_cache=False, audio_format=audio_format, audio_mimetype="audio/pcm;rate=22050;channels=1",
+            sample_rate=22050)
+        return g, Buffer(text.encode())
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(GLaDOS, "get", classmethod(lambda cls: StubGLaDOS()))
+    app = FastAPI()
+    app.include_router(restapi.create_stream_router())
+    return TestClient(app)
+
+
+def test_stream(client):
+    with client.websocket_connect("/stream") as ws:
+        ws.send_json({"type": "text", "text": "Hello there. "})
+        ws.send_json({"type": "end"})
+        assert ws.receive_json()["type"] == "sentence"
+        data = ws.receive_bytes()
+        assert restapi.STREAM_HEADER.unpack_from(data) == (0, 0)
+        assert data[restapi.STREAM_HEADER.size:] == b"Hello there."
+        assert ws.receive_json() == {"type": "sentence_end", "seq": 0, "chunks": 1}
+        assert ws.receive_json() == {"type": "done", "sentences": 1}
+
+
+def test_binary_frame(client):
+    with client.websocket_connect("/stream") as ws:
+        ws.send_bytes(b"\x00\x01")
+        with pytest.raises(WebSocketDisconnect) as e:
+            ws.receive_json()
+    assert e.value.code == 1003
+
+
+def test_unexpected_render_failure(client):
+    with client.websocket_connect("/stream") as ws:
+        ws.send_json({"type": "text", "text": "Things go boom."})
+        ws.send_json({"type": "flush"})
+        assert ws.receive_json() == {"type": "error", "detail": "internal error"}
+        with pytest.raises(WebSocketDisconnect) as e:
+            ws.receive_json()
+    assert e.value.code == 1011
@@ -0,0 +1,55 @@
+import numpy
+import pytest
+
+from glados_tts.engine import GLaDOS
+
+
+HOP = 256
+
+
+class ConvVocoder:
+    """a stand-in for HiFiGAN: a 1-d convolution over the mel frames,
+    upsampled to 'HOP' samples per frame. the receptive field is
+    'width' frames on either side.
+
+    """
+
+    def __init__(self, width):
+        rng = numpy.random.default_rng(0)
+        self.width = width
+        self.kernel = rng.standard_normal(2 * width + 1).astype(numpy.float32)
+
+    def audio(self, mel):
+        frames = mel[0].sum(axis=0)
+        # zero padded, one output per frame even for short windows
+        out = numpy.convolve(frames, self.kernel)[self.width:self.width + len(frames)]
+        return numpy.tanh(numpy.repeat(out, HOP))
+
+
+@pytest.fixture
+def mel():
+    rng = numpy.random.default_rng(1)
+    return rng.standard_normal((1, 80, 203)).astype(numpy.float32)
+
+
+def stitched(models, mel, chunk_frames, overlap):
+    return numpy.concatenate(list(GLaDOS()._vocode_chunks(models, mel, chunk_frames, overlap)))
+
+
+@pytest.mark.parametrize("chunk_frames", [1, 7, 32, 203, 500])
+def test_chunks_match_full_pass(mel, chunk_frames):
+    models = ConvVocoder(width=4)
+    full = models.audio(mel)
+    chunked = stitched(models, mel, chunk_frames, overlap=4)
+
+    assert chunked.shape == full.shape
+    numpy.testing.assert_allclose(chunked, full, atol=1e-5)
+
+
+def test_overlap_below_receptive_field_differs(mel):
+    models = ConvVocoder(width=4)
+    full = models.audio(mel)
+    chunked = stitched(models, mel, 32, overlap=1)
+
+    assert chunked.shape == full.shape
+    assert numpy.abs(chunked - full).max() > 1e-3
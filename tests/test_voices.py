@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+from glados_tts.engine import GLaDOS
+from glados_tts.modelpair import TorchScriptModels, OnnxModels
+
+
+@pytest.fixture
+def models_dir(tmp_path):
+    for f in ("glados.pt", "vocoder-gpu.pt", "vocoder-cpu-lq.pt", "glados.onnx", "vocoder-gpu.onnx"):
+        (tmp_path / f).touch()
+    return tmp_path
+
+
+def builtin_voices(models_dir, backend):
+    glados = GLaDOS()
+    glados.models_dir = str(models_dir)
+    glados.backend = backend
+    glados.acoustic_model, glados.vocoder_model = glados._default_models()
+    glados._add_voices({})
+    return glados.voices
+
+
+def test_builtin_voice_torchscript(models_dir):
+    voices = builtin_voices(models_dir, TorchScriptModels)
+    voice = voices.voices["glados-lq"]
+
+    assert voice.acoustic_model == os.path.join(models_dir, "glados.pt")
+    assert voice.vocoder_model == os.path.join(models_dir, "vocoder-cpu-lq.pt")
+
+
+def test_builtin_voice_onnx(models_dir):
+    # the .pt vocoder is there, but can't run on onnxruntime
+    assert "glados-lq" not in builtin_voices(models_dir, OnnxModels).names()
+
+    (models_dir / "vocoder-cpu-lq.onnx").touch()
+    voice = builtin_voices(models_dir, OnnxModels).voices["glados-lq"]
+
+    assert voice.acoustic_model == os.path.join(models_dir, "glados.onnx")
+    assert voice.vocoder_model == os.path.join(models_dir, "vocoder-cpu-lq.onnx")
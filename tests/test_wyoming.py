@@ -0,0 +1,258 @@
+import asyncio
+import json
+
+import pytest
+
+from glados_tts import encoders
+from glados_tts.engine import GLaDOSInputError
+from glados_tts.models import GLaDOSResponse
+from glados_tts.wyoming import WyomingHandler, SAMPLES_PER_CHUNK, SAMPLE_WIDTH, read_event
+
+
+class StubBuffer:
+    def __init__(self, data):
+        self.data = data
+        self.released = False
+
+    def getbuffer(self):
+        return memoryview(self.data)
+
+    def release(self):
+        self.released = True
+
+
+class StubGLaDOS:
+    """renders every sentence as 10 ms of 16-bit pcm per character, from
+    memory or (for texts in 'cached') from the cache.
+
+    """
+
+    default_voice = "glados"
+    voices = {"glados-lq": None}
+    segment_max_tokens = 200
+    sample_rate = 22050
+
+    def __init__(self, cached=()):
+        self.cached = set(cached)
+        self.rendered = []
+        self.buffers = []
+
+    def get_encoder(self, audio_format):
+        return encoders.get_encoder(audio_format)
+
+    def list_voices(self):
+        return [{"name": "glados", "description": "GLaDOS"}, {"name": "glados-lq", "description": "low quality"}]
+
+    def pcm(self, text):
+        return text.encode()[:1] * (len(text) * 220 * SAMPLE_WIDTH)
+
+    def tts_to_memory(self, text, audio_format, use_cache, sample_rate, priority, voice):
+        if "error" in text:
+            raise GLaDOSInputError("input must not be empty")
+        if "crash" in text:
+            raise RuntimeError("the vocoder broke")
+        self.rendered.append((text, audio_format, sample_rate, priority, voice))
+        g = GLaDOSResponse(
+            from_cache=text in self.cached, text=text, audio_format=audio_format, audio_filename=text,
+            audio_timestamp=0, sample_rate=sample_rate)
+        if text in self.cached:
+            return g, None
+        buf = StubBuffer(self.pcm(text))
+        self.buffers.append(buf)
+        return g, buf
+
+    def get_audiofile_iter(self, fname):
+        yield self.pcm(fname)
+
+
+class StubWriter:
+    def __init__(self):
+        self.data = bytearray()
+        self.closed = False
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def get_extra_info(self, name):
+        return ("127.0.0.1", 10300)
+
+
+def event(event_type, data=None):
+    return json.dumps({"type": event_type, "data": data or {}}).encode() + b"\n"
+
+
+def converse(glados, *events):
+    """send 'events' to a handler, returns the events it sent back"""
+
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b"".join(events))
+        reader.feed_eof()
+        writer = StubWriter()
+        await WyomingHandler(glados, reader, writer).run()
+        assert writer.closed
+
+        replies = asyncio.StreamReader()
+        replies.feed_data(bytes(writer.data))
+        replies.feed_eof()
+        sent = []
+        while (e := await read_event(replies)) is not None:
+            sent.append(e)
+        return sent
+
+    return asyncio.run(run())
+
+
+def audio(events):
+    return b"".join(payload for event_type, _, payload in events if event_type == "audio-chunk")
+
+
+def test_describe():
+    [(event_type, data, payload)] = converse(StubGLaDOS(), event("describe"))
+
+    assert event_type == "info"
+    [tts] = data["tts"]
+    assert tts["supports_synthesize_streaming"] is True
+    assert [v["name"] for v in tts["voices"]] == ["glados", "glados-lq"]
+    assert payload is None
+
+
+def test_synthesize():
+    glados = StubGLaDOS()
+    events = converse(
+        glados, event("synthesize", {"text": "Hello there. How are you?", "voice": {"name": "glados-lq"}}))
+
+    types = [e[0] for e in events]
+    assert types[0] == "audio-start" and types[-1] == "audio-stop"
+    assert set(types[1:-1]) == {"audio-chunk"}
+    assert events[0][1] == {"rate": 22050, "width": SAMPLE_WIDTH, "channels": 1}
+    for _, data, payload in events[1:-1]:
+        assert data["rate"] == 22050
+        assert 0 < len(payload) <= SAMPLES_PER_CHUNK * SAMPLE_WIDTH
+
+    assert [r[0] for r in glados.rendered] == ["Hello there.", "How are you?"]
+    assert {r[1:] for r in glados.rendered} == {("pcm", 22050, "interactive", "glados-lq")}
+    assert audio(events) == glados.pcm("Hello there.") + glados.pcm("How are you?")
+    assert all(buf.released for buf in glados.buffers)
+
+
+def test_synthesize_from_cache():
+    glados = StubGLaDOS(cached=["Hello there."])
+    events = converse(glados, event("synthesize", {"text": "Hello there."}))
+
+    assert audio(events) == glados.pcm("Hello there.")
+    assert glados.rendered[0][-1] is None
+
+
+def test_unknown_voice_gets_the_default():
+    glados = StubGLaDOS()
+    converse(glados, event("synthesize", {"text": "Hello.", "voice": {"name": "wheatley"}}))
+
+    assert glados.rendered[0][-1] is None
+
+
+def test_streaming():
+    glados = StubGLaDOS()
+    events = converse(
+        glados,
+        event("synthesize-start", {"voice": {"name": "glados"}}),
+        event("synthesize-chunk", {"text": "Hello th"}),
+        event("synthesize-chunk", {"text": "ere. How "}),
+        event("synthesize-chunk", {"text": "are you"}),
+        # the full text, for servers that don't stream, is ignored
+        event("synthesize", {"text": "Hello there. How are you"}),
+        event("synthesize-stop"),
+    )
+
+    types = [e[0] for e in events]
+    assert types[0] == "audio-start"
+    assert types[-2:] == ["audio-stop", "synthesize-stopped"]
+    assert [r[0] for r in glados.rendered] == ["Hello there.", "How are you"]
+    assert audio(events) == glados.pcm("Hello there.") + glados.pcm("How are you")
+
+
+def test_chunks_before_start_are_ignored():
+    glados = StubGLaDOS()
+    events = converse(glados, event("synthesize-chunk", {"text": "Hello. "}), event("synthesize-stop"))
+
+    assert events == []
+    assert glados.rendered == []
+
+
+def test_synthesis_error():
+    glados = StubGLaDOS()
+    events = converse(glados, event("synthesize", {"text": "An error. Then this."}))
+
+    types = [e[0] for e in events]
+    assert types[0] == "audio-start" and types[-1] == "audio-stop"
+    assert "error" in types
+    assert audio(events) == glados.pcm("Then this.")
+
+
+def test_unexpected_synthesis_error():
+    glados = StubGLaDOS()
+    events = converse(glados, event("synthesize", {"text": "A crash. Then this."}))
+
+    types = [e[0] for e in events]
+    assert types[0] == "audio-start" and types[-1] == "audio-stop"
+    assert ("error", {"text": "internal error", "code": "synthesis-failed"}, None) in events
+    assert audio(events) == glados.pcm("Then this.")
+
+
+@pytest.mark.parametrize("bad_event", [
+    b"not json\n",
+    b'["describe"]\n',
+    b'{"data": {}}\n',
+    b'{"type": "describe", "data_length": "10"}\n',
+    b'{"type": "describe", "data_length": 8}\nnot json',
+    b'{"type": "describe", "data": [1]}\n',
+    event("synthesize", {"text": "Hello.", "voice": "glados"}),
+])
+def test_invalid_event(bad_event):
+    glados = StubGLaDOS()
+    events = converse(glados, bad_event, event("describe"))
+
+    [(event_type, data, _), (next_type, _, _)] = events
+    assert event_type == "error" and data["code"] == "invalid-event"
+    # the connection is still usable
+    assert next_type == "info"
+    assert glados.rendered == []
+
+
+def test_internal_error(monkeypatch):
+    glados = StubGLaDOS()
+    monkeypatch.setattr(glados, "list_voices", lambda: 1 / 0)
+    events = converse(glados, event("describe"), event("synthesize", {"text": "Hello."}))
+
+    assert events[0] == ("error", {"text": "internal error", "code": "internal-error"}, None)
+    assert audio(events) == glados.pcm("Hello.")
+
+
+@pytest.mark.parametrize("data", [b"", b'{"type": "describe", "data_length": 100}\n{}'])
+def test_closed_connection(data):
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        writer = StubWriter()
+        await WyomingHandler(StubGLaDOS(), reader, writer).run()
+        return writer
+
+    writer = asyncio.run(run())
+    assert writer.closed
+    assert writer.data == b""
+
+
+def test_pcm_mimetype():
+    g = GLaDOSResponse(
+        from_cache=False, text="Hello.", audio_format="pcm", audio_filename="hello.pcm", audio_timestamp=0,
+        sample_rate=16000)
+
+    # little-endian, unlike audio/L16
+    assert g.audio_mimetype == "audio/pcm;rate=16000;channels=1"